@@ -1,15 +1,137 @@
+import time
+_IMPORT_START = time.perf_counter()
+
+from api.startup import StartupPhases
+IMPORT_TIMINGS = StartupPhases(_IMPORT_START)
+
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile, shutil
-from src.mywardrobe.retrieval import load_index, encode_query
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import threading
+from PIL import UnidentifiedImageError
+IMPORT_TIMINGS.lap("framework")
+
+# The serving stack (torch, CLIP, FAISS) is imported up front; LangChain and
+# the Supabase client are only imported on first use by /chat and /wardrobe
+from src.mywardrobe.retrieval import (
+    encode_queries, encode_catalog_images, warm_text_cache, text_cache_stats,
+    image_cache_stats, warm_up, prepare_query_image,
+)
+from src.mywardrobe.sharding import ShardedIndex
+from src.mywardrobe.live import LiveCatalog
+from src.mywardrobe.versions import CatalogVersions
+IMPORT_TIMINGS.lap("serving_stack")
+
 from src.mywardrobe.db import add_item, list_items, init_supabase
 from api.chains import chat_with_stylist
+from api.batching import QueryBatcher, Saturated
+from config import (
+    CATALOG_EMB_FILE, CATALOG_IDX_FILE, CATALOG_SHARD_DIR, SHARD_SEARCH_MODE, CATALOG_VERSIONS_DIR, CATALOG_POLL_SECONDS,
+    SEARCH_MAX_BATCH, SEARCH_MAX_WAIT_MS, SEARCH_WORKERS, SEARCH_MAX_PENDING, TEXT_CACHE_WARM_FILE,
+)
 import os
+import json
+import numpy as np
+IMPORT_TIMINGS.lap("app_modules")
+
+# Load the catalog as a singleton; a single index takes live updates. With a
+# versions directory, newer releases are swapped in while the API keeps serving
+if CATALOG_VERSIONS_DIR:
+    CATALOGS = CatalogVersions(CATALOG_VERSIONS_DIR, poll_seconds=CATALOG_POLL_SECONDS, shard_mode=SHARD_SEARCH_MODE)
+    CATALOGS.start()
+elif CATALOG_SHARD_DIR:
+    CATALOGS = CatalogVersions(catalog=ShardedIndex(CATALOG_SHARD_DIR, mode=SHARD_SEARCH_MODE), name=CATALOG_SHARD_DIR)
+else:
+    CATALOGS = CatalogVersions(catalog=LiveCatalog(CATALOG_EMB_FILE, CATALOG_IDX_FILE), name=CATALOG_EMB_FILE)
+IMPORT_TIMINGS.lap("catalog")
+
+def _search_batch(queries, top_k):
+    """Encode a batch of (image, text, filters) queries and search them (on an inference thread).
 
-# Load index and paths as singletons
-IX, PATHS = load_index("data/embeddings.npy", "data/paths.txt")
+    Queries sharing the same filters are searched together, unfiltered ones in
+    a single FAISS call. Results are resolved to paths here, against the same
+    catalog state the search used; a catalog swapped out meanwhile stays
+    loaded until the batch is done.
+    """
+    images = [image for image, _, _ in queries]
+    texts = [text for _, text, _ in queries]
+    t0 = time.perf_counter()
+    vecs = encode_queries(images, texts).numpy()
+    t1 = time.perf_counter()
+    groups = {}
+    for row, (_, _, filters) in enumerate(queries):
+        groups.setdefault(json.dumps(filters or {}, sort_keys=True), []).append(row)
+    D = np.empty((len(queries), top_k), dtype="float32")
+    P = np.empty((len(queries), top_k), dtype=object)
+    with CATALOGS.lease() as catalog:
+        for key, rows in groups.items():
+            D[rows], P[rows] = catalog.search_paths(vecs[rows], top_k, json.loads(key) or None)
+    BATCHER.timings.record("encode", t1 - t0)
+    BATCHER.timings.record("faiss", time.perf_counter() - t1)
+    return D, P
+
+BATCHER = QueryBatcher(
+    _search_batch, max_batch=SEARCH_MAX_BATCH, max_wait_ms=SEARCH_MAX_WAIT_MS,
+    workers=SEARCH_WORKERS, max_pending=SEARCH_MAX_PENDING,
+)
 
-app = FastAPI(title="MyWardrobe API", version="0.1.0")
+# --- startup --------------------------------------------------------------
+WARM_UP_TIMINGS = StartupPhases()
+WARM_UP = None
+WARM_UP_ERROR = None
+READY = threading.Event()
+_warm_up_lock = threading.Lock()
+
+def _warm_up():
+    """Load CLIP and run one dummy query through the encoders and the catalog (on an inference thread)."""
+    global WARM_UP_ERROR
+    try:
+        vecs, timings = warm_up()
+        WARM_UP_TIMINGS.add(timings)
+        with CATALOGS.lease() as catalog:
+            catalog.search_paths(vecs, 1)
+        WARM_UP_TIMINGS.lap("index")
+    except Exception as e:
+        WARM_UP_ERROR = f"{type(e).__name__}: {e}"
+        print(f"⚠️ Warm-up failed: {WARM_UP_ERROR}")
+        raise
+    READY.set()
+    WARM_UP_TIMINGS.log("Warm-up done")
+    # Pre-encode popular phrases after the API is ready
+    if TEXT_CACHE_WARM_FILE and os.path.exists(TEXT_CACHE_WARM_FILE):
+        with open(TEXT_CACHE_WARM_FILE) as f:
+            warm_text_cache(f.read().splitlines())
+
+def start_warm_up():
+    """Start warm-up once; returns its future."""
+    global WARM_UP, WARM_UP_TIMINGS
+    with _warm_up_lock:
+        if WARM_UP is None:
+            WARM_UP_TIMINGS = StartupPhases()
+            WARM_UP = BATCHER.executor.submit(_warm_up)
+    return WARM_UP
+
+async def _until_warm():
+    """Hold requests that arrive during warm-up instead of loading CLIP a second time."""
+    future = start_warm_up()
+    if not future.done():
+        try:
+            await asyncio.wrap_future(future)
+        except Exception:
+            pass  # reported by /ready; the request loads what it needs itself
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background so the server starts answering /ready at once
+    start_warm_up()
+    yield
+    CATALOGS.stop()
+
+IMPORT_TIMINGS.log("API imported")
+
+app = FastAPI(title="MyWardrobe API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],   # tighten later
@@ -18,21 +140,153 @@ app.add_middleware(
 )
 
 # --- search --------------------------------------------------------------
+def _prepare_query(contents, filters):
+    """Check ``filters`` against the catalog and hash / decode the upload; runs on the inference pool."""
+    if filters is not None:
+        try:
+            with CATALOGS.lease() as catalog:
+                catalog.attributes.mask(filters)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(400, f"Invalid filters: {e}")
+    t0 = time.perf_counter()
+    try:
+        img = prepare_query_image(contents)
+    except (UnidentifiedImageError, OSError) as e:
+        raise HTTPException(400, f"Could not decode image: {e}")
+    BATCHER.timings.record("decode", time.perf_counter() - t0)
+    return img
+
 @app.post("/search")
 async def search(
     file: UploadFile = File(...),
-    text: str = Form("")
+    text: str = Form(""),
+    filters: str = Form("")
 ):
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-    shutil.copyfileobj(file.file, tmp)
-    vec = encode_query(tmp.name, text).cpu().numpy()
-    D, I = IX.search(vec, 12)
-    os.unlink(tmp.name)
+    # Check the filters and hash the upload and, unless its embedding is
+    # cached, decode it in memory on the inference pool, so a bad request
+    # fails on its own rather than with the batch it would join. The query
+    # holds a pending slot before any of that work, so an overloaded API
+    # answers 429 right away
+    try:
+        filters = json.loads(filters) if filters else None
+        if filters is not None and not isinstance(filters, dict):
+            raise ValueError("filters must be a JSON object")
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid filters: {e}")
+    contents = await file.read()
+    try:
+        with BATCHER.admit():
+            # The decode matches the loaded model's preprocessing, so wait for warm-up first
+            await _until_warm()
+            img = await asyncio.get_running_loop().run_in_executor(BATCHER.executor, _prepare_query, contents, filters)
+            D, P = await BATCHER.enqueue(img, text, 12, filters)
+    except Saturated as e:
+        raise HTTPException(429, f"Search is busy, retry shortly: {e}")
     return [
-        {"path": PATHS[i], "score": float(d)}
-        for d, i in zip(D[0], I[0])
+        {"path": p, "score": float(d)}
+        for d, p in zip(D, P) if p is not None
     ]
 
+@app.get("/metrics")
+async def metrics():
+    with CATALOGS.lease() as catalog:
+        catalog_stats = catalog.stats() if isinstance(catalog, LiveCatalog) else None
+    return {
+        "search_batching": BATCHER.stats(),
+        "text_cache": text_cache_stats(),
+        "image_cache": image_cache_stats(),
+        "catalog": catalog_stats,
+    }
+
+@app.get("/ready")
+async def ready():
+    """200 once CLIP and the catalog are warmed up, 503 until then; with import and warm-up timings."""
+    body = {
+        "ready": READY.is_set(),
+        "error": WARM_UP_ERROR,
+        "import": IMPORT_TIMINGS.snapshot(),
+        "warm_up": WARM_UP_TIMINGS.snapshot(),
+    }
+    return JSONResponse(body, status_code=200 if READY.is_set() else 503)
+
+@app.get("/status")
+async def status():
+    """Catalog version being served, when it was loaded and how long loading took."""
+    return CATALOGS.status()
+
+# --- live catalog updates -----------------------------------------------
+# Changes apply to the catalog of the process that receives them: with more
+# than one uvicorn worker, the other workers only see them after a restart
+# (WAL replay). Serve live updates from a single worker.
+if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 and isinstance(CATALOGS.current.catalog, LiveCatalog):
+    print("⚠️ WEB_CONCURRENCY > 1: /catalog updates only reach the worker that receives them")
+
+def _live_catalog():
+    catalog = CATALOGS.current.catalog
+    if not isinstance(catalog, LiveCatalog):
+        raise HTTPException(409, "Live updates are not supported for a sharded catalog; rebuild its shards")
+    return catalog
+
+def _embed_and_add(path, image, mask, attributes):
+    vecs = encode_catalog_images([(image, mask)])
+    with CATALOGS.lease() as catalog:
+        if not isinstance(catalog, LiveCatalog):
+            raise HTTPException(409, "Live updates are not supported for a sharded catalog; rebuild its shards")
+        return catalog.add([path], vecs, [attributes])[0], catalog.ntotal
+
+@app.post("/catalog/add")
+async def catalog_add(
+    path: str = Form(...),
+    file: UploadFile = File(...),
+    mask: UploadFile = File(None),
+    attributes: str = Form(""),
+):
+    """Embed an uploaded product image and add it (or replace it) under ``path``."""
+    _live_catalog()
+    try:
+        attributes = json.loads(attributes) if attributes else {}
+        if not isinstance(attributes, dict):
+            raise ValueError("attributes must be a JSON object")
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid attributes: {e}")
+    image = await file.read()
+    mask_bytes = await mask.read() if mask is not None else None
+    await _until_warm()
+    loop = asyncio.get_running_loop()
+    try:
+        item_id, size = await loop.run_in_executor(BATCHER.executor, _embed_and_add, path, image, mask_bytes, attributes)
+    except (UnidentifiedImageError, OSError) as e:
+        raise HTTPException(400, f"Could not decode image: {e}")
+    return {"status": "ok", "id": item_id, "size": size}
+
+def _remove(path):
+    with CATALOGS.lease() as catalog:
+        if not isinstance(catalog, LiveCatalog):
+            raise HTTPException(409, "Live updates are not supported for a sharded catalog; rebuild its shards")
+        return catalog.remove([path]), catalog.ntotal
+
+@app.post("/catalog/remove")
+async def catalog_remove(path: str = Form(...)):
+    # The log append (fsync) and attribute rebuild run off the event loop
+    removed, size = await asyncio.get_running_loop().run_in_executor(BATCHER.executor, _remove, path)
+    if not removed:
+        raise HTTPException(404, f"{path} is not in the catalog")
+    return {"status": "ok", "size": size}
+
+@app.post("/catalog/compact")
+async def catalog_compact():
+    """Fold logged changes into the base index now, on the catalog's compaction thread.
+
+    A catalog version is released only after its compaction thread ends;
+    failures are reported as ``last_compaction_error`` in /metrics.
+    """
+    with CATALOGS.lease() as catalog:
+        if not isinstance(catalog, LiveCatalog):
+            raise HTTPException(409, "Live updates are not supported for a sharded catalog; rebuild its shards")
+        started = catalog.start_compaction()
+        stats = catalog.stats()
+    return {"status": "started" if started else "running", "wal_records": stats["wal_records"]}
+
 # --- wardrobe CRUD -------------------------------------------------------
 @app.post("/wardrobe/add")
 async def add_to_wardrobe(user_id: str = Form(...), product_path: str = Form(...)):
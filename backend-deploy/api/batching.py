@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+class Saturated(Exception):
+    """Raised when more queries are pending than the batcher accepts."""
+
+class StageStats:
+    """Thread-safe count / mean / max of per-stage durations in milliseconds."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, seconds):
+        ms = seconds * 1000.0
+        with self._lock:
+            count, total, peak = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + ms, max(peak, ms))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                stage: {"count": count, "avg_ms": total / count, "max_ms": peak}
+                for stage, (count, total, peak) in self._stages.items()
+            }
+
+class QueryBatcher:
+    """Coalesces concurrent /search queries into one batched encode + FAISS search.
+
+    Queries that arrive within ``max_wait_ms`` of the first waiting query, up
+    to ``max_batch`` of them, are handed to ``search_fn(queries, top_k)`` in a
+    single call; each caller then gets its own row of ``(D, I)`` back.
+    Queries are ``(image, text, filters)`` triples.
+
+    ``search_fn`` runs on a bounded pool of ``workers`` threads so the event
+    loop keeps serving other endpoints while CLIP encodes. Once
+    ``max_pending`` queries are admitted (preprocessing, queued or running),
+    ``admit`` / ``submit`` raise ``Saturated`` instead of accepting more.
+    """
+    def __init__(self, search_fn, max_batch=16, max_wait_ms=5.0, workers=2, max_pending=64):
+        self.search_fn = search_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self.timings = StageStats()
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self.pending = 0
+        self.rejected = 0
+        self.batches = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+
+    def _ensure_worker(self):
+        # The queue and worker belong to the loop serving requests; recreate them
+        # if that loop changes (e.g. a new TestClient portal)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._worker = loop.create_task(self._run())
+
+    @contextmanager
+    def admit(self):
+        """Hold a pending slot for one query, from before its preprocessing until its result."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise Saturated(f"{self.pending} search queries already pending")
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def submit(self, image, text, top_k, filters=None):
+        """Admit and queue one query and wait for its ``(scores, ids)`` row."""
+        with self.admit():
+            return await self.enqueue(image, text, top_k, filters)
+
+    async def enqueue(self, image, text, top_k, filters=None):
+        """Queue one query already holding an ``admit`` slot and wait for its row."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put(((image, text, filters), top_k, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Wait for a free inference slot; new queries keep queueing meanwhile
+            await self._slots.acquire()
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            started = time.perf_counter()
+            for *_, queued_at in batch:
+                self.timings.record("queue_wait", started - queued_at)
+            queries = [query for query, _, _, _ in batch]
+            top_k = max(k for _, k, _, _ in batch)
+            try:
+                D, I = await self._loop.run_in_executor(self.executor, self.search_fn, queries, top_k)
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self.timings.record("inference", time.perf_counter() - started)
+            self.batches += 1
+            self.queries += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for row, (_, k, future, _) in enumerate(batch):
+                if not future.done():
+                    future.set_result((D[row][:k], I[row][:k]))
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "stages": self.timings.snapshot(),
+        }
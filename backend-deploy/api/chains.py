@@ -1,5 +1,8 @@
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+import threading
+
+# LangChain and the Ollama client take over a second to import, so the chain
+# is built on the first /chat request rather than at API startup
+
 # from langchain.tools import tool
 # import requests, os
 
@@ -13,16 +16,26 @@ from langchain_core.prompts import ChatPromptTemplate
 #     r = requests.post(f"{SEARCH_API}/search", files=files, data=data, timeout=30)
 #     return r.text
 
-prompt = ChatPromptTemplate.from_template(
-    "You are a friendly fashion stylist.\nUser: {input}\nAssistant:"
-)
-llm = OllamaLLM(model="mistral")
-stylist_chain = prompt | llm  # simple LLMChain for text-only chat
+STYLIST_PROMPT = "You are a friendly fashion stylist.\nUser: {input}\nAssistant:"
+
+_stylist_chain = None
+_chain_lock = threading.Lock()
+
+def get_stylist_chain():
+    """Prompt | Ollama chain for text-only chat, built once."""
+    global _stylist_chain
+    with _chain_lock:
+        if _stylist_chain is None:
+            from langchain_ollama import OllamaLLM
+            from langchain_core.prompts import ChatPromptTemplate
+            prompt = ChatPromptTemplate.from_template(STYLIST_PROMPT)
+            _stylist_chain = prompt | OllamaLLM(model="mistral")  # simple LLMChain for text-only chat
+    return _stylist_chain
 
 async def chat_with_stylist(query: str) -> str:
     """Async function to chat with the stylist"""
     try:
-        result = await stylist_chain.ainvoke({"input": query})
+        result = await get_stylist_chain().ainvoke({"input": query})
         return result.content if hasattr(result, 'content') else str(result)
     except Exception as e:
         print(f"Error in chat: {e}")
@@ -0,0 +1,29 @@
+import time
+
+class StartupPhases:
+    """Wall time of consecutive named startup phases, in seconds."""
+    def __init__(self, start=None):
+        self.phases = {}
+        self._last = time.perf_counter() if start is None else start
+
+    def lap(self, phase):
+        """End ``phase`` now; it started when the previous phase ended."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def add(self, phases):
+        """Record phases timed elsewhere (e.g. by ``retrieval.warm_up``)."""
+        self.phases.update(phases)
+        self._last = time.perf_counter()
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def log(self, what):
+        breakdown = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        print(f"✔ {what} in {self.total:.2f}s ({breakdown})")
+
+    def snapshot(self):
+        return {"total_seconds": self.total, **{f"{phase}_seconds": s for phase, s in self.phases.items()}}
@@ -30,16 +30,95 @@ GITHUB_REPO_URL = f"https://github.com/{GITHUB_REPO_SLUG}"
 
 # System Configuration
 CLIP_MODEL = os.getenv("CLIP_MODEL", "ViT-B/32")
+# Model version used for queries and index builds: a name from MODEL_REGISTRY_FILE
+# (registered by `finetune`), or empty for CLIP_MODEL plus an optional fine-tuned
+# checkpoint and adapter heads. Indexes built with another version are refused.
+CLIP_MODEL_VERSION = os.getenv("CLIP_MODEL_VERSION", "")
+CLIP_CHECKPOINT_PATH = os.getenv("CLIP_CHECKPOINT_PATH", "")
+CLIP_ADAPTER_PATH = os.getenv("CLIP_ADAPTER_PATH", "")
+MODEL_REGISTRY_FILE = os.getenv("MODEL_REGISTRY_FILE", "checkpoints/models.json")
 DEVICE = os.getenv("DEVICE", "auto")
 
+# CPU inference backend for CLIP's encoders in queries and index builds:
+# eager | script | compile | int8 | onnx (see mywardrobe.inference).
+# INFERENCE_THREADS sets intra-op threads, for all backends ("4") or per
+# backend ("int8:4,onnx:2,*:1"); 0 / empty keeps the library default.
+# PyTorch's count is process-global and is set once at startup
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+INFERENCE_THREADS = os.getenv("INFERENCE_THREADS", "")
+ONNX_DIR = os.getenv("ONNX_DIR", "checkpoints/onnx")
+
 # FAISS Configuration
+# IndexFlatIP | IndexIVFFlat | IndexIVFPQ | IndexHNSWFlat
 FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "IndexFlatIP")
 FAISS_DIMENSION = int(os.getenv("FAISS_DIMENSION", "512"))
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))            # 0 = ~4*sqrt(N)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "200"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Catalog embedding storage: float32 | float16 | int8 | pq (see mywardrobe.compact)
+EMBEDDING_FORMAT = os.getenv("EMBEDDING_FORMAT", "float32")
+
+# The single catalog the API serves when no shard or versions directory is set
+CATALOG_EMB_FILE = os.getenv("CATALOG_EMB_FILE", "data/embeddings.npy")
+CATALOG_IDX_FILE = os.getenv("CATALOG_IDX_FILE", "data/paths.txt")
+
+# Sharded catalog: when CATALOG_SHARD_DIR is set the API searches every
+# catalog_*.npy shard in it in parallel, on threads or one process per shard
+CATALOG_SHARD_DIR = os.getenv("CATALOG_SHARD_DIR", "")
+SHARD_SEARCH_MODE = os.getenv("SHARD_SEARCH_MODE", "thread")
+
+# Metadata filters: CATALOG_ATTRIBUTES_FILE is a CSV / JSON-lines file with an
+# "image" column whose other columns (colour, price, in_stock, ...) build_index
+# stores next to the paths; filters matching at most FILTER_EXACT_MAX items are
+# scored exactly over just those items
+CATALOG_ATTRIBUTES_FILE = os.getenv("CATALOG_ATTRIBUTES_FILE", "")
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "4096"))
+
+# Live catalog updates are logged next to the embeddings and folded into the
+# base index in the background after this many changes (0 = only on request)
+CATALOG_COMPACT_AFTER = int(os.getenv("CATALOG_COMPACT_AFTER", "1000"))
+
+# Versioned catalog releases: when CATALOG_VERSIONS_DIR is set the API serves
+# its newest release subdirectory, checks for a newer one every
+# CATALOG_POLL_SECONDS and swaps it in without a restart; `prep --release_dir`
+# keeps the newest CATALOG_KEEP_VERSIONS releases
+CATALOG_VERSIONS_DIR = os.getenv("CATALOG_VERSIONS_DIR", "")
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "10"))
+CATALOG_KEEP_VERSIONS = int(os.getenv("CATALOG_KEEP_VERSIONS", "3"))
 
 # Search Configuration
 DEFAULT_TOP_K = int(os.getenv("DEFAULT_TOP_K", "10"))
 DEFAULT_ALPHA = float(os.getenv("DEFAULT_ALPHA", "0.5"))
 
+# API query batching: /search requests arriving within SEARCH_MAX_WAIT_MS are
+# encoded and searched together, up to SEARCH_MAX_BATCH at a time
+SEARCH_MAX_BATCH = int(os.getenv("SEARCH_MAX_BATCH", "16"))
+SEARCH_MAX_WAIT_MS = float(os.getenv("SEARCH_MAX_WAIT_MS", "5"))
+# Inference threads serving /search decodes and batches, and decoding +
+# queued + running queries allowed before /search answers 429
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "2"))
+SEARCH_MAX_PENDING = int(os.getenv("SEARCH_MAX_PENDING", "64"))
+
+# Batched tensor preprocessing (mywardrobe.preprocess) instead of CLIP's
+# per-image PIL transform, for both queries and catalog builds
+FAST_PREPROCESS = os.getenv("FAST_PREPROCESS", "true").lower() in ("1", "true", "yes")
+
+# Query caches: normalized text embeddings kept in memory, optionally
+# pre-warmed from a newline-separated phrase list at API startup
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", "4096"))
+TEXT_CACHE_WARM_FILE = os.getenv("TEXT_CACHE_WARM_FILE", "")
+# Query-image embeddings keyed by upload content hash; IMAGE_CACHE_DIR adds an
+# on-disk tier and IMAGE_CACHE_PHASH_DISTANCE >= 0 also matches near-duplicates
+# whose 64-bit perceptual hash differs in at most that many bits
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "1024"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")
+IMAGE_CACHE_DISK_MAX = int(os.getenv("IMAGE_CACHE_DISK_MAX", "100000"))
+IMAGE_CACHE_PHASH_DISTANCE = int(os.getenv("IMAGE_CACHE_PHASH_DISTANCE", "-1"))
+
 # File Paths
 DEFAULT_EMBEDDINGS_FILE = os.getenv("DEFAULT_EMBEDDINGS_FILE", "embeddings.npy")
 DEFAULT_PATHS_FILE = os.getenv("DEFAULT_PATHS_FILE", "index_paths.txt")
@@ -1,3 +1,5 @@
-from .retrieval import build_index, load_index, search, encode_query
+from .retrieval import (
+    build_index, load_index, search, encode_query, encode_queries, Retriever, get_retriever,
+)
 
 __version__ = "0.1.0" 
\ No newline at end of file
@@ -0,0 +1,132 @@
+import os
+import json
+import numpy as np
+import torch
+import torch.nn as nn
+from tqdm import tqdm
+
+from .training import info_nce, enable_bf16_text
+
+# Lightweight heads trained on frozen CLIP embeddings. Image and text
+# features are extracted once into memory-mapped float16 arrays
+# (<feature_dir>/image.npy, text.npy); an adapter is then trained over them
+# with a batched InfoNCE loss, which costs seconds per epoch instead of a
+# backbone pass per image. At serving time the adapter is applied to CLIP's
+# normalized image and text embeddings (CLIP_ADAPTER_PATH).
+
+class ProjectionAdapter(nn.Module):
+    """Residual MLP on a normalized embedding, re-normalized; starts out as the identity."""
+    def __init__(self, dim=512, hidden=1024):
+        super().__init__()
+        self.fc1 = nn.Linear(dim, hidden)
+        self.act = nn.GELU()
+        self.fc2 = nn.Linear(hidden, dim)
+        nn.init.zeros_(self.fc2.weight)
+        nn.init.zeros_(self.fc2.bias)
+
+    def forward(self, x):
+        y = x + self.fc2(self.act(self.fc1(x)))
+        return y / y.norm(dim=-1, keepdim=True)
+
+class ClipAdapter(nn.Module):
+    """One ``ProjectionAdapter`` per modality."""
+    def __init__(self, dim=512, hidden=1024):
+        super().__init__()
+        self.dim, self.hidden = dim, hidden
+        self.image = ProjectionAdapter(dim, hidden)
+        self.text = ProjectionAdapter(dim, hidden)
+
+def save_adapter(adapter, path, meta=None):
+    torch.save({"dim": adapter.dim, "hidden": adapter.hidden, "state": adapter.state_dict(), "meta": meta or {}}, path)
+    print(f"✔ Saved adapter → {path}")
+
+def load_adapter(path, device="cpu"):
+    ckpt = torch.load(path, map_location=device)
+    adapter = ClipAdapter(ckpt["dim"], ckpt["hidden"])
+    adapter.load_state_dict(ckpt["state"])
+    return adapter.to(device).eval()
+
+def extract_features(model, loader, normalize, out_dir, key, device="cpu", amp=True):
+    """Embed every (uint8 image, tokens) pair of ``loader`` once into ``out_dir``.
+
+    The arrays are reused while ``key`` (model and data identity) matches.
+    ``loader`` must not shuffle. Returns the memory-mapped (image, text) arrays.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    image_file, text_file = os.path.join(out_dir, "image.npy"), os.path.join(out_dir, "text.npy")
+    meta_file = os.path.join(out_dir, "features.json")
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            if json.load(f) == key:
+                print(f"✔ Reusing features in {out_dir}")
+                return np.load(image_file, mmap_mode="r"), np.load(text_file, mmap_mode="r")
+        os.remove(meta_file)
+
+    n, dim = len(loader.dataset), model.visual.output_dim
+    image = np.lib.format.open_memmap(image_file, mode="w+", dtype=np.float16, shape=(n, dim))
+    text = np.lib.format.open_memmap(text_file, mode="w+", dtype=np.float16, shape=(n, dim))
+    start = 0
+    amp = amp and torch.device(device).type in ("cpu", "cuda")
+    if amp:
+        enable_bf16_text(model)
+    autocast = torch.autocast(torch.device(device).type, dtype=torch.bfloat16, enabled=amp)
+    with torch.no_grad(), autocast:
+        for imgs, txts in tqdm(loader, desc="Extracting features"):
+            img_f = model.encode_image(normalize(imgs)).float()
+            txt_f = model.encode_text(txts.to(device)).float()
+            end = start + len(imgs)
+            image[start:end] = (img_f / img_f.norm(dim=-1, keepdim=True)).cpu().numpy()
+            text[start:end] = (txt_f / txt_f.norm(dim=-1, keepdim=True)).cpu().numpy()
+            start = end
+    image.flush()
+    text.flush()
+    # Written last: the arrays are only reused once complete
+    with open(meta_file, "w") as f:
+        json.dump(key, f)
+    print(f"✔ Extracted {n} image / text features → {out_dir}")
+    return np.load(image_file, mmap_mode="r"), np.load(text_file, mmap_mode="r")
+
+def train_adapter(image, text, epochs=20, batch_size=4096, lr=1e-3, wd=1e-2, tau=0.07,
+                  hidden=1024, val_fraction=0.05, device="cpu", seed=0):
+    """Train a ``ClipAdapter`` on paired feature arrays with in-batch InfoNCE.
+
+    A ``val_fraction`` of the pairs (at most one batch) is held out, and the
+    loss and image-to-text recall@1 on it are reported every epoch.
+    """
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(image))
+    n_val = min(int(len(order) * val_fraction), batch_size)
+    n_val = n_val if n_val >= 2 else 0
+    val, train = np.sort(order[:n_val]), order[n_val:]
+    adapter = ClipAdapter(image.shape[1], hidden).to(device)
+    optimizer = torch.optim.AdamW(adapter.parameters(), lr=lr, weight_decay=wd)
+    steps = epochs * -(-len(train) // batch_size)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=max(steps, 1))
+
+    def batch(ids):
+        ids = np.sort(ids)   # sequential reads from the memory-mapped arrays
+        return (torch.from_numpy(np.asarray(image[ids], dtype=np.float32)).to(device),
+                torch.from_numpy(np.asarray(text[ids], dtype=np.float32)).to(device))
+
+    for epoch in range(epochs):
+        adapter.train()
+        rng.shuffle(train)
+        total, count = 0.0, 0
+        for i in range(0, len(train), batch_size):
+            img_f, txt_f = batch(train[i:i + batch_size])
+            loss = info_nce(adapter.image(img_f), adapter.text(txt_f), tau)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            total, count = total + loss.item(), count + 1
+        msg = f"Adapter epoch {epoch+1}/{epochs} – loss: {total / max(count, 1):.4f}"
+        if n_val:
+            adapter.eval()
+            with torch.no_grad():
+                img_f, txt_f = batch(val)
+                img_a, txt_a = adapter.image(img_f), adapter.text(txt_f)
+                recall = (img_a @ txt_a.T).argmax(dim=1).eq(torch.arange(n_val, device=device)).float().mean()
+                msg += f", val loss: {info_nce(img_a, txt_a, tau).item():.4f}, val R@1: {recall.item():.3f}"
+        print(msg)
+    return adapter.eval()
@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping with hit/miss counters."""
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+def dhash(img, hash_size=8):
+    """64-bit difference hash of a PIL image; near-duplicates differ in few bits."""
+    gray = np.asarray(img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+class ImageEmbeddingCache:
+    """Query-image embeddings keyed by content hash, with optional near-duplicate and disk tiers.
+
+    The memory tier is an ``LRUCache``. With ``phash_distance >= 0`` a miss
+    falls back to the cached image whose difference hash is within that many
+    bits. With ``disk_dir`` embeddings are also written as ``<key>.npy`` and
+    at most ``disk_max`` files are kept.
+    """
+    def __init__(self, maxsize=1024, disk_dir=None, disk_max=100000, phash_distance=-1):
+        self.memory = LRUCache(maxsize)
+        self.disk_dir = disk_dir
+        self.disk_max = disk_max
+        self.phash_distance = phash_distance
+        self._phashes = OrderedDict()   # content key -> dhash, for memory-tier entries
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.phash_hits = 0
+        self._disk_puts = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".npy")
+
+    def __contains__(self, key):
+        """Whether ``key`` is cached, without touching the hit / miss counters."""
+        return key in self.memory or bool(self.disk_dir and os.path.exists(self._disk_path(key)))
+
+    def get(self, key):
+        emb = self.memory.get(key)
+        if emb is None and self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                emb = np.load(self._disk_path(key))
+            except (OSError, ValueError):
+                return None
+            self.disk_hits += 1
+            self.memory.put(key, emb)
+        return emb
+
+    def get_similar(self, phash):
+        """Embedding of a cached image within ``phash_distance`` bits of ``phash``, if any."""
+        if self.phash_distance < 0:
+            return None
+        with self._lock:
+            if not self._phashes:
+                return None
+            keys = list(self._phashes)
+            hashes = np.fromiter(self._phashes.values(), dtype=np.uint64, count=len(keys))
+        dist = np.unpackbits((hashes ^ np.uint64(phash)).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(dist.argmin())
+        if dist[best] > self.phash_distance:
+            return None
+        emb = self.memory.get(keys[best])
+        if emb is not None:
+            self.phash_hits += 1
+        return emb
+
+    def put(self, key, emb, phash=None):
+        # A copy, so a cached row does not keep its whole batch alive
+        emb = np.array(emb, dtype=np.float32)
+        self.memory.put(key, emb)
+        if phash is not None and self.phash_distance >= 0:
+            with self._lock:
+                self._phashes[key] = phash
+                self._phashes.move_to_end(key)
+                while len(self._phashes) > self.memory.maxsize:
+                    self._phashes.popitem(last=False)
+        if self.disk_dir:
+            tmp = self._disk_path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, emb)
+            os.replace(tmp, self._disk_path(key))
+            self._disk_puts += 1
+            if self._disk_puts % 64 == 0:
+                self._trim_disk()
+
+    def _trim_disk(self):
+        files = [os.path.join(self.disk_dir, f) for f in os.listdir(self.disk_dir) if f.endswith(".npy")]
+        if len(files) <= self.disk_max:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.disk_max]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update(disk_hits=self.disk_hits, phash_hits=self.phash_hits, disk_dir=self.disk_dir or None)
+        return stats
@@ -0,0 +1,119 @@
+import os
+import time
+import numpy as np
+import faiss
+
+from .indexing import FAISS_PQ_M, FAISS_PQ_NBITS, make_index, sample_rows
+
+# Compact on-disk formats for catalog embeddings. Every format has a FAISS
+# codec: float16 and int8 are scalar quantizers, pq a product quantizer.
+# float32 / float16 are written as plain .npy arrays; int8 / pq write their
+# uint8 codes as the .npy and the trained codec next to it (".codec").
+FORMATS = ("float32", "float16", "int8", "pq")
+
+def codec_file_for(emb_file):
+    return os.path.splitext(emb_file)[0] + ".codec"
+
+def make_codec(vecs, fmt, pq_m=None, pq_nbits=None):
+    """Trained, empty FAISS codec index for ``fmt`` (None for float32)."""
+    d = vecs.shape[1]
+    if fmt == "float32":
+        return None
+    if fmt == "float16":
+        return faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if fmt == "int8":
+        codec = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        codec.train(sample_rows(vecs, 100000))
+        return codec
+    if fmt == "pq":
+        pq_m, pq_nbits = pq_m or FAISS_PQ_M, pq_nbits or FAISS_PQ_NBITS
+        if len(vecs) < 2 ** pq_nbits:
+            raise ValueError(f"PQ with {pq_nbits} bits needs at least {2 ** pq_nbits} vectors, got {len(vecs)}")
+        codec = faiss.IndexPQ(d, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        codec.train(sample_rows(vecs, 256 * 2 ** pq_nbits))
+        return codec
+    raise ValueError(f"Unknown embedding format {fmt!r}; expected one of {FORMATS}")
+
+def save_embeddings(vecs, emb_file, fmt="float32"):
+    """Write catalog embeddings in ``fmt``; returns the codec (None for float32 / float16)."""
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
+    codec_file = codec_file_for(emb_file)
+    if fmt in ("float32", "float16"):
+        np.save(emb_file, vecs.astype(fmt))
+        if os.path.exists(codec_file):
+            os.remove(codec_file)
+        return None
+    codec = make_codec(vecs, fmt)
+    np.save(emb_file, codec.sa_encode(vecs))
+    faiss.write_index(codec, codec_file)
+    return codec
+
+def embedding_format(emb_file):
+    """Format of a saved embeddings file."""
+    if os.path.exists(codec_file_for(emb_file)):
+        codec = faiss.downcast_index(faiss.read_index(codec_file_for(emb_file)))
+        return "pq" if isinstance(codec, faiss.IndexPQ) else "int8"
+    return str(np.load(emb_file, mmap_mode="r").dtype)
+
+def load_embeddings(emb_file, chunk_size=65536):
+    """Load embeddings of any format as float32, dequantizing codes chunk by chunk."""
+    data = np.load(emb_file, mmap_mode="r")
+    codec_file = codec_file_for(emb_file)
+    if not os.path.exists(codec_file):
+        return np.asarray(data, dtype="float32")
+    codec = faiss.read_index(codec_file)
+    out = np.empty((len(data), codec.d), dtype="float32")
+    for i in range(0, len(data), chunk_size):
+        out[i:i + chunk_size] = codec.sa_decode(np.ascontiguousarray(data[i:i + chunk_size]))
+    return out
+
+def quantized_index(emb_file):
+    """Flat FAISS index that searches the stored codes directly, without dequantizing.
+
+    float16 vectors are served by a QT_fp16 scalar quantizer; int8 / pq files
+    by their saved codec. Returns None for float32 files. FAISS indexes own
+    their code storage, so the codes are copied from the file into process
+    memory (one copy per worker, as large as the embeddings file).
+    """
+    data = np.load(emb_file, mmap_mode="r")
+    codec_file = codec_file_for(emb_file)
+    if os.path.exists(codec_file):
+        ix = faiss.read_index(codec_file)
+        codes = np.ascontiguousarray(data, dtype=np.uint8)
+    elif data.dtype == np.float16:
+        ix = make_codec(np.zeros((0, data.shape[1]), dtype="float32"), "float16")
+        codes = np.ascontiguousarray(data).view(np.uint8)
+    else:
+        return None
+    faiss.copy_array_to_vector(codes.ravel(), faiss.downcast_index(ix).codes)
+    ix.ntotal = len(codes)
+    return ix
+
+def compare_formats(vecs, formats=FORMATS, top_k=10, num_queries=200, seed=0):
+    """Report memory footprint, recall@k and latency of each format against float32 exact search."""
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
+    queries = sample_rows(vecs, num_queries, seed=seed + 1)
+    flat = make_index(vecs, "IndexFlatIP", verbose=False)
+    _, truth = flat.search(queries, top_k)
+
+    rows = []
+    for fmt in formats:
+        if fmt == "float32":
+            ix, nbytes = flat, vecs.nbytes
+        else:
+            ix = make_codec(vecs, fmt)
+            ix.add(vecs)
+            nbytes = faiss.downcast_index(ix).codes.size()
+        start = time.perf_counter()
+        _, found = ix.search(queries, top_k)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / top_k for f, t in zip(found, truth)])
+        rows.append({"format": fmt, "bytes_per_vector": nbytes / len(vecs), "total_mb": nbytes / 2 ** 20,
+                     "recall": float(recall), "ms_per_query": ms})
+
+    print(f"Recall@{top_k} vs float32 IndexFlatIP over {len(vecs)} vectors, {len(queries)} queries:")
+    print(f"{'format':<8} {'bytes/vec':>9} {'total MB':>9} {'recall':>7} {'ms/query':>9}")
+    for r in rows:
+        print(f"{r['format']:<8} {r['bytes_per_vector']:>9.0f} {r['total_mb']:>9.1f} "
+              f"{r['recall']:>7.3f} {r['ms_per_query']:>9.3f}")
+    return rows
@@ -4,6 +4,7 @@ import datetime
 import json
 from pathlib import Path
 import threading
+import importlib.util
 from typing import List, Dict, Optional
 
 # Add the parent directory to Python path to import config
@@ -11,13 +12,12 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from config import SUPABASE_URL, SUPABASE_KEY
 
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
+# The Supabase client is only imported once it is configured and first used;
+# importing it costs about half a second of API startup
+SUPABASE_AVAILABLE = importlib.util.find_spec("supabase") is not None
+if SUPABASE_AVAILABLE:
     print("✅ Supabase client available")
-except ImportError:
-    SUPABASE_AVAILABLE = False
+else:
     print("⚠️ Supabase client not available, using in-memory database")
 
 supabase: Optional['Client'] = None
@@ -34,6 +34,7 @@ def init_supabase():
         return False
     if supabase is None:
         try:
+            from supabase import create_client
             supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
             print("✅ Supabase client initialized")
         except Exception as e:
@@ -0,0 +1,260 @@
+import os
+import csv
+import sys
+import json
+import numpy as np
+import faiss
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import FILTER_EXACT_MAX
+
+# Per-item catalog attributes live in a columnar sidecar next to the paths
+# file (index_paths.txt -> index_paths.attrs.npz), one array per attribute in
+# catalog order. Text attributes are dictionary-encoded as int32 codes
+# ("-1" = missing) plus a "<name>.values" vocabulary; numeric and boolean
+# attributes are float32 with NaN for missing values.
+
+def catalog_category(img_path):
+    """Product category of a catalog image, e.g. ``MEN-Denim`` for ``MEN-Denim-id_00000080-01_7_additional.jpg``."""
+    name = os.path.basename(img_path)
+    return name.split("-id_")[0] if "-id_" in name else "other"
+
+def attributes_file_for(idx_file):
+    return os.path.splitext(idx_file)[0] + ".attrs.npz"
+
+def _parse_value(value):
+    if isinstance(value, str):
+        if value.strip().lower() in ("true", "yes"):
+            return 1.0
+        if value.strip().lower() in ("false", "no"):
+            return 0.0
+        try:
+            return float(value)
+        except ValueError:
+            return value.strip()
+    if isinstance(value, bool):
+        return float(value)
+    return value
+
+def read_attribute_rows(attributes_file):
+    """Attribute rows keyed by image file name, from a CSV or JSON-lines file with an ``image`` column."""
+    rows = {}
+    with open(attributes_file, newline="") as f:
+        if attributes_file.endswith((".jsonl", ".json")):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for rec in records:
+            name = os.path.basename(rec.pop("image"))
+            rows[name] = {k: _parse_value(v) for k, v in rec.items() if v not in ("", None)}
+    return rows
+
+class AttributeTable:
+    """Columnar catalog attributes with boolean-mask filtering."""
+    def __init__(self, columns, size):
+        self.columns = columns   # name -> float32 array, or (int32 codes, values array)
+        self.size = size
+
+    @classmethod
+    def from_rows(cls, rows):
+        columns = {}
+        names = sorted({name for row in rows for name in row})
+        for name in names:
+            values = [row.get(name) for row in rows]
+            if all(v is None or isinstance(v, (int, float)) for v in values):
+                columns[name] = np.array([np.nan if v is None else v for v in values], dtype="float32")
+            else:
+                vocab = sorted({str(v) for v in values if v is not None})
+                lookup = {v: i for i, v in enumerate(vocab)}
+                codes = np.array([-1 if v is None else lookup[str(v)] for v in values], dtype="int32")
+                columns[name] = (codes, np.array(vocab, dtype=object))
+        return cls(columns, len(rows))
+
+    @classmethod
+    def load(cls, path):
+        columns = {}
+        with np.load(path, allow_pickle=False) as data:
+            size = int(data["__size__"])
+            for key in data.files:
+                if key == "__size__" or key.endswith(".values"):
+                    continue
+                if key + ".values" in data.files:
+                    columns[key] = (data[key], data[key + ".values"].astype(object))
+                else:
+                    columns[key] = data[key]
+        return cls(columns, size)
+
+    def save(self, path):
+        arrays = {"__size__": np.array(self.size)}
+        for name, col in self.columns.items():
+            if isinstance(col, tuple):
+                arrays[name], arrays[name + ".values"] = col[0], col[1].astype(str)
+            else:
+                arrays[name] = col
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def concat(cls, tables):
+        """One table over several catalogs in order, e.g. the shards of a sharded index."""
+        rows = []
+        for table in tables:
+            rows.extend(table.rows())
+        return cls.from_rows(rows)
+
+    def append(self, rows):
+        """A new table with ``rows`` after the existing items, extending the columns in place of a rebuild.
+
+        Only a column that turns from numeric to text is rebuilt from rows.
+        """
+        if not rows:
+            return self
+        added = AttributeTable.from_rows(rows)
+        columns = {}
+        for name in sorted(set(self.columns) | set(added.columns)):
+            old, new = self.columns.get(name), added.columns.get(name)
+            if not isinstance(old, tuple) and not isinstance(new, tuple):
+                columns[name] = np.concatenate([_numeric(old, self.size), _numeric(new, added.size)])
+            elif (old is not None and not isinstance(old, tuple)) or (new is not None and not isinstance(new, tuple)):
+                return AttributeTable.from_rows(self.rows() + list(rows))
+            else:
+                columns[name] = _concat_text([_text(old, self.size), _text(new, added.size)])
+        return AttributeTable(columns, self.size + added.size)
+
+    def rows(self):
+        rows = [{} for _ in range(self.size)]
+        for name, col in self.columns.items():
+            if isinstance(col, tuple):
+                codes, vocab = col
+                for row, code in zip(rows, codes):
+                    if code >= 0:
+                        row[name] = vocab[code]
+            else:
+                for row, value in zip(rows, col):
+                    if not np.isnan(value):
+                        row[name] = float(value)
+        return rows
+
+    def mask(self, filters):
+        """Boolean mask of items matching every filter.
+
+        ``filters`` maps attribute names to a value (equality), a list of
+        values (any of) or a ``{"min": .., "max": ..}`` range.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for name, cond in filters.items():
+            if name not in self.columns:
+                raise ValueError(f"Unknown attribute {name!r}; expected one of {sorted(self.columns)}")
+            col = self.columns[name]
+            if isinstance(cond, dict):
+                if isinstance(col, tuple) or not set(cond) <= {"min", "max"}:
+                    raise ValueError(f"Range filter on {name!r} needs a numeric attribute and min/max bounds")
+                if "min" in cond:
+                    mask &= col >= float(cond["min"])
+                if "max" in cond:
+                    mask &= col <= float(cond["max"])
+                continue
+            wanted = cond if isinstance(cond, list) else [cond]
+            if isinstance(col, tuple):
+                codes, vocab = col
+                lookup = {v: i for i, v in enumerate(vocab)}
+                mask &= np.isin(codes, [lookup[str(v)] for v in wanted if str(v) in lookup])
+            else:
+                wanted = [_parse_value(v) for v in wanted]
+                if not all(isinstance(v, (int, float)) for v in wanted):
+                    raise ValueError(f"Attribute {name!r} is numeric, got {cond!r}")
+                mask &= np.isin(col, wanted)
+        return mask
+
+def _numeric(col, size):
+    return np.full(size, np.nan, dtype="float32") if col is None else col
+
+def _text(col, size):
+    return (np.full(size, -1, dtype="int32"), np.array([], dtype=object)) if col is None else col
+
+def _concat_text(cols):
+    """Dictionary-encoded columns joined over one merged, sorted vocabulary."""
+    vocab = sorted({v for _, values in cols for v in values})
+    lookup = {v: i for i, v in enumerate(vocab)}
+    parts = []
+    for codes, values in cols:
+        remap = np.array([lookup[v] for v in values] + [-1], dtype="int32")
+        # Code -1 (missing) indexes the trailing -1
+        parts.append(remap[codes])
+    return np.concatenate(parts), np.array(vocab, dtype=object)
+
+def build_attributes(paths, attributes_file=None):
+    """Attributes of catalog ``paths``: the category from the file name plus any from ``attributes_file``."""
+    extra = read_attribute_rows(attributes_file) if attributes_file else {}
+    rows = [dict(extra.get(os.path.basename(p), {}), category=catalog_category(p)) for p in paths]
+    return AttributeTable.from_rows(rows)
+
+def load_attributes(idx_file, paths=None):
+    """Attribute table saved next to ``idx_file``, or one derived from the paths for older builds."""
+    path = attributes_file_for(idx_file)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(idx_file):
+        return AttributeTable.load(path)
+    if paths is None:
+        with open(idx_file) as f:
+            paths = f.read().splitlines()
+    return build_attributes(paths)
+
+def _search_params(ix, sel, selectivity):
+    """SearchParameters restricting ``ix`` to ``sel``; None if the index cannot filter while searching.
+
+    IVF probes and HNSW's candidate list grow with 1 / selectivity so about
+    as many matching vectors are visited as in an unfiltered search.
+    """
+    base = faiss.downcast_index(ix)
+    if isinstance(base, faiss.IndexPQ):
+        return None
+    ivf = faiss.try_extract_index_ivf(ix)
+    if ivf is not None:
+        nprobe = min(ivf.nlist, int(np.ceil(ivf.nprobe / selectivity)))
+        return faiss.SearchParametersIVF(sel=sel, nprobe=nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        ef = min(ix.ntotal, int(np.ceil(base.hnsw.efSearch / selectivity)))
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=ef)
+    return faiss.SearchParameters(sel=sel)
+
+def _exact_search(ix, queries, k, ids):
+    """Exact inner-product top-k over the vectors ``ids``, reconstructed from ``ix``."""
+    vecs = ix.reconstruct_batch(ids)
+    scores = queries @ vecs.T
+    k_eff = min(k, len(ids))
+    top = np.argpartition(-scores, k_eff - 1, axis=1)[:, :k_eff]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    D = np.full((len(queries), k), -np.inf, dtype="float32")
+    I = np.full((len(queries), k), -1, dtype="int64")
+    D[:, :k_eff] = np.take_along_axis(scores, top, axis=1)
+    I[:, :k_eff] = ids[top]
+    return D, I
+
+def filtered_search(ix, queries, k, mask):
+    """Top-``k`` among the items where ``mask`` is True, filtered inside the search.
+
+    Up to FILTER_EXACT_MAX matches are scored exactly from their stored
+    vectors, so cost shrinks with the filter; larger subsets are searched
+    through an ``IDSelectorBitmap`` over the whole index.
+    """
+    if len(mask) != ix.ntotal:
+        raise ValueError(f"Filter mask covers {len(mask)} items, index has {ix.ntotal}")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    ids = np.flatnonzero(mask)
+    if len(ids) == 0:
+        return (np.full((len(queries), k), -np.inf, dtype="float32"),
+                np.full((len(queries), k), -1, dtype="int64"))
+    if len(ids) == ix.ntotal:
+        return ix.search(queries, k)
+
+    bitmap = np.packbits(mask, bitorder="little")
+    sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+    params = _search_params(ix, sel, len(ids) / ix.ntotal)
+    # IVF indexes keep no id -> vector map, so they always use the selector
+    if faiss.try_extract_index_ivf(ix) is None and (len(ids) <= FILTER_EXACT_MAX or params is None):
+        return _exact_search(ix, queries, k, ids)
+    return ix.search(queries, k, params=params)
@@ -7,7 +7,14 @@ from transformers import BlipProcessor, BlipForConditionalGeneration
 from torch.utils.data import Dataset, DataLoader
 from torch.optim import AdamW
 from tqdm import tqdm
+import numpy as np
+import hashlib
 import os
+from .preprocess import BatchPreprocessor
+from .training import ContrastiveTrainer
+from .adapter import extract_features, train_adapter, save_adapter
+from .models import register_model
+from datetime import datetime
 
 ### 🛠 `src/finetune.py`
 
@@ -25,40 +32,219 @@ BLIP_MODEL  = "Salesforce/blip-image-captioning-base"
 CLIP_MODEL  = "ViT-B/32"
 CAP_FILE    = DATA_DIR / "captions.jsonl"
 IMG_LIST    = DATA_DIR / "image_paths.txt"
+TOKENS_FILE = DATA_DIR / "captions.tokens.pt"     # captions tokenized once
+IMAGE_CACHE = DATA_DIR / "train_images.u8.npy"    # preprocessed crops, filled in epoch 1
+FEATURE_DIR = DATA_DIR / "clip_features"          # frozen CLIP embeddings for adapter training
+TRAIN_CKPT  = CHECKPTS / "clip_finetuned.pt"      # weights + optimizer / scheduler state, every epoch
+
+# Captioning
+CAPTION_BATCH_SIZE  = 16   # images per BLIP generate() call
+CAPTION_WORKERS     = 2    # background image loading processes
+CAPTION_MAX_TOKENS  = 40
 
 # Hyperparams
 EPOCHS      = 5
-BATCH_SIZE  = 32
+BATCH_SIZE  = 32   # micro-batch; one optimizer step covers ACCUM_STEPS of them
+ACCUM_STEPS = 1
+PRECISION   = "bf16"   # bf16 autocast (CPU / CUDA) | fp32
+TRAIN       = "all"    # all | proj (frozen encoders, projections only)
+ADAPTER_EPOCHS     = 20
+ADAPTER_BATCH_SIZE = 4096
 LR          = 5e-4
 WD          = 1e-2
 TAU         = 0.07
+NUM_WORKERS = 4    # training data loading processes
 
 # ── Datasets ──────────────────────────────────────────────
+def tokenize_captions(cap_file, tokens_file):
+    """Image paths and CLIP tokens of every caption, tokenized once into ``tokens_file``."""
+    if tokens_file.exists() and tokens_file.stat().st_mtime >= Path(cap_file).stat().st_mtime:
+        data = torch.load(tokens_file)
+        return data["paths"], data["tokens"]
+    records = read_captions(cap_file)
+    paths   = [rec["path"] for rec in records]
+    tokens  = clip.tokenize([rec["caption"] for rec in records], truncate=True).to(torch.int32)
+    torch.save({"paths": paths, "tokens": tokens}, tokens_file)
+    print(f"✔ Tokenized {len(paths)} captions → {tokens_file}")
+    return paths, tokens
+
+class TrainImageCache:
+    """Resized, center-cropped uint8 training images in one memory-mapped file.
+
+    Rows are written by the loader workers the first time an image is decoded
+    and flagged in ``<cache>.filled.npy``; later epochs read them back instead
+    of decoding. The cache is recreated when the image list or size changes.
+    """
+    def __init__(self, cache_file, paths, n_px):
+        self.cache_file  = Path(cache_file)
+        self.filled_file = self.cache_file.with_suffix(".filled.npy")
+        meta_file = self.cache_file.with_suffix(".json")
+        meta = {"n_px": n_px, "paths": hashlib.sha256("\n".join(paths).encode("utf-8")).hexdigest()}
+        if not (meta_file.exists() and json.loads(meta_file.read_text()) == meta and self.filled_file.exists()):
+            np.lib.format.open_memmap(self.cache_file, mode="w+", dtype=np.uint8, shape=(len(paths), 3, n_px, n_px))
+            np.save(self.filled_file, np.zeros(len(paths), dtype=bool))
+            meta_file.write_text(json.dumps(meta))
+            print(f"Caching preprocessed images in {self.cache_file} ({len(paths) * 3 * n_px * n_px / 1e9:.1f} GB)")
+        self._pixels = self._filled = None
+
+    def __getstate__(self):
+        # Each worker maps the files itself rather than receiving a copy
+        return dict(self.__dict__, _pixels=None, _filled=None)
+
+    def _open(self):
+        if self._pixels is None:
+            self._pixels = np.load(self.cache_file, mmap_mode="r+")
+            self._filled = np.load(self.filled_file, mmap_mode="r+")
+
+    def get(self, idx):
+        self._open()
+        return torch.from_numpy(np.array(self._pixels[idx])) if self._filled[idx] else None
+
+    def put(self, idx, crop):
+        self._open()
+        self._pixels[idx] = crop.numpy()
+        self._filled[idx] = True
+
+    def filled(self):
+        self._open()
+        return int(self._filled.sum())
+
 class FashionCLIPDataset(Dataset):
-    def __init__(self, cap_file, preprocess_fn):
-        self.items = []
-        with open(cap_file, "r") as f:
-            for line in f:
-                obj = json.loads(line)
-                self.items.append((obj["path"], obj["caption"]))
-        self.preprocess = preprocess_fn
+    """(uint8 image crop, caption tokens) pairs; normalize batches with ``BatchPreprocessor.normalize``."""
+    def __init__(self, paths, tokens, n_px=224, cache=None):
+        self.paths  = paths
+        self.tokens = tokens
+        self.cache  = cache
+        self.engine = BatchPreprocessor(n_px, draft=False)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        img = self.cache.get(idx) if self.cache is not None else None
+        if img is None:
+            img_path = self.paths[idx]
+            # Ensure image exists
+            if not os.path.exists(img_path):
+                raise FileNotFoundError(f"Image not found: {img_path}")
+            img = self.engine.resize_crop(self.engine.decode(img_path))
+            if self.cache is not None:
+                self.cache.put(idx, img)
+        return img, self.tokens[idx].long()
+
+class CaptionImages(Dataset):
+    """Images to caption, loaded by DataLoader workers; missing or unreadable files yield None."""
+    def __init__(self, paths):
+        self.paths = paths
 
     def __len__(self):
-        return len(self.items)
+        return len(self.paths)
 
     def __getitem__(self, idx):
-        img_path, caption = self.items[idx]
-        
-        # Ensure image exists
-        if not os.path.exists(img_path):
-            raise FileNotFoundError(f"Image not found: {img_path}")
-            
-        img = Image.open(img_path).convert("RGB")
-        img_tensor = self.preprocess(img)
-        text_tensor = clip.tokenize([caption], truncate=True)[0]
-        return img_tensor, text_tensor
-
-def run_finetune():
+        path = self.paths[idx]
+        try:
+            return path, Image.open(path).convert("RGB")
+        except (FileNotFoundError, OSError):
+            return path, None
+
+class CaptionBatch:
+    """Collate loaded images into BLIP pixel values, still on the loader workers."""
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, items):
+        paths  = [path for path, img in items if img is not None]
+        missing = [path for path, img in items if img is None]
+        pixels = None
+        if paths:
+            imgs   = [img for _, img in items if img is not None]
+            pixels = self.processor(images=imgs, return_tensors="pt")["pixel_values"]
+        return paths, pixels, missing
+
+def read_captions(cap_file):
+    """Captions already written to ``cap_file``, dropping a torn last line from an interrupted run."""
+    records, valid_bytes = [], 0
+    if not os.path.exists(cap_file):
+        return records
+    with open(cap_file, "rb") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            valid_bytes += len(line)
+    if valid_bytes < os.path.getsize(cap_file):
+        with open(cap_file, "r+b") as f:
+            f.truncate(valid_bytes)
+    return records
+
+def generate_captions(img_paths, cap_file, processor, blip_model,
+                      batch_size=CAPTION_BATCH_SIZE, num_workers=CAPTION_WORKERS):
+    """Caption ``img_paths`` with BLIP in batches, appending to ``cap_file``.
+
+    Paths already in ``cap_file`` are skipped, so an interrupted run resumes
+    where it stopped. Every batch is flushed to disk before the next one is
+    generated, which bounds what a crash can lose to one batch.
+    """
+    done    = {rec["path"] for rec in read_captions(cap_file)}
+    pending = [p for p in img_paths if p not in done]
+    print(f"Captioning {len(pending)} images ({len(done)} already captioned)")
+    if not pending:
+        return 0
+
+    loader = DataLoader(
+        CaptionImages(pending), batch_size=batch_size, num_workers=num_workers,
+        collate_fn=CaptionBatch(processor), prefetch_factor=2 if num_workers > 0 else None,
+    )
+    written = 0
+    with open(cap_file, "a") as out, torch.inference_mode():
+        for paths, pixels, missing in tqdm(loader, desc="Captioning images"):
+            for path in missing:
+                print(f"Warning: Image not found: {path}")
+            if not paths:
+                continue
+            ids  = blip_model.generate(pixel_values=pixels.to(DEVICE), max_new_tokens=CAPTION_MAX_TOKENS)
+            caps = processor.batch_decode(ids, skip_special_tokens=True)
+            out.write("".join(json.dumps({"path": p, "caption": c}) + "\n" for p, c in zip(paths, caps)))
+            out.flush()
+            os.fsync(out.fileno())
+            written += len(paths)
+    return written
+
+def save_checkpoint(path, model, optimizer, scheduler, epoch, train):
+    """Training state after ``epoch`` epochs, written atomically."""
+    tmp = Path(str(path) + ".tmp")
+    torch.save({
+        "model": model.state_dict(), "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(), "epoch": epoch, "train": train, "base": CLIP_MODEL,
+    }, tmp)
+    os.replace(tmp, path)
+    print(f"✔ Saved training checkpoint (epoch {epoch}) → {path}")
+
+CHECKPOINT_KEYS = ("model", "optimizer", "scheduler", "epoch", "train", "base")
+
+def load_checkpoint(path, train):
+    """Training state written by ``save_checkpoint``; ValueError if ``path`` cannot resume ``train`` of CLIP_MODEL."""
+    ckpt = torch.load(path, map_location=DEVICE)
+    missing = [key for key in CHECKPOINT_KEYS if key not in ckpt] if isinstance(ckpt, dict) else CHECKPOINT_KEYS
+    if missing:
+        raise ValueError(f"{path} is not a training checkpoint (missing {', '.join(missing)}); resume from "
+                         f"{TRAIN_CKPT}, not from the registered weights of a model version")
+    if ckpt["base"] != CLIP_MODEL or ckpt["train"] != train:
+        raise ValueError(f"{path} trains {ckpt['train']} of {ckpt['base']}, not {train} of {CLIP_MODEL}")
+    return ckpt
+
+def run_finetune(caption_batch_size=CAPTION_BATCH_SIZE, caption_workers=CAPTION_WORKERS,
+                 num_workers=NUM_WORKERS, cache_images=True, batch_size=BATCH_SIZE,
+                 accum_steps=ACCUM_STEPS, precision=PRECISION, train=TRAIN, grad_cache=True,
+                 adapter=False, adapter_epochs=ADAPTER_EPOCHS, epochs=EPOCHS,
+                 checkpoint_path=None, version_name=None):
+    """Caption the images, fine-tune CLIP (or train adapter heads) and register the result.
+
+    ``checkpoint_path`` resumes training from a ``TRAIN_CKPT``-style checkpoint;
+    the trained weights are registered as model version ``version_name``
+    (default ``clip-ft-<timestamp>`` / ``clip-adapter-<timestamp>``).
+    """
     # Ensure directories exist
     DATA_DIR.mkdir(exist_ok=True)
     CHECKPTS.mkdir(exist_ok=True)
@@ -69,94 +255,117 @@ def run_finetune():
         return
     
     # ── Phase C: BLIP Caption Generation ────────────────────
-    if not CAP_FILE.exists():
+    img_paths = [p.strip() for p in open(IMG_LIST) if p.strip()]
+    done      = {rec["path"] for rec in read_captions(CAP_FILE)}
+    if any(p not in done and os.path.exists(p) for p in img_paths):
         print("Phase C: Generating captions with BLIP…")
         try:
             processor  = BlipProcessor.from_pretrained(BLIP_MODEL)
-            blip_model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL).to(DEVICE)
-            img_paths  = [p.strip() for p in open(IMG_LIST) if p.strip()]
-            
-            with open(CAP_FILE, "w") as out:
-                for path in tqdm(img_paths, desc="Captioning images"):
-                    if not os.path.exists(path):
-                        print(f"Warning: Image not found: {path}")
-                        continue
-                    img    = Image.open(path).convert("RGB")
-                    inputs = processor(images=img, return_tensors="pt").to(DEVICE)
-                    ids    = blip_model.generate(**inputs, max_new_tokens=40)
-                    cap    = processor.decode(ids[0], skip_special_tokens=True)
-                    out.write(json.dumps({"path": path, "caption": cap}) + "\n")
-            print(f"✔ Saved captions → {CAP_FILE}")
+            blip_model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL).to(DEVICE).eval()
+            written    = generate_captions(img_paths, CAP_FILE, processor, blip_model,
+                                           batch_size=caption_batch_size, num_workers=caption_workers)
+            print(f"✔ Saved {written} captions → {CAP_FILE}")
         except Exception as e:
-            print(f"Error during caption generation: {e}")
+            print(f"Error during caption generation: {e}; rerun to resume")
             return
     else:
-        print(f"⚠ {CAP_FILE} exists; skipping caption generation.")
+        print(f"⚠ {CAP_FILE} covers every image; skipping caption generation.")
 
     # ── Phase D: CLIP Contrastive Fine-Tuning ────────────────
     print("Phase D: Fine-tuning CLIP with InfoNCE loss…")
     try:
-        clip_model, clip_preprocess = clip.load(CLIP_MODEL, device=DEVICE)
-        clip_model.train()
+        clip_model, _ = clip.load(CLIP_MODEL, device=DEVICE)
+        clip_model = clip_model.float().train()   # fp32 master weights; autocast handles bf16
 
-        dataset = FashionCLIPDataset(str(CAP_FILE), clip_preprocess)
+        n_px          = clip_model.visual.input_resolution
+        paths, tokens = tokenize_captions(CAP_FILE, TOKENS_FILE)
+        cache   = TrainImageCache(IMAGE_CACHE, paths, n_px) if cache_images else None
+        dataset = FashionCLIPDataset(paths, tokens, n_px, cache)
+        engine  = BatchPreprocessor(n_px, device=DEVICE)
         loader  = DataLoader(
-            dataset, batch_size=BATCH_SIZE,
-            shuffle=True, num_workers=0
+            dataset, batch_size=batch_size, shuffle=True,
+            num_workers=num_workers, pin_memory=DEVICE.type == "cuda",
+            persistent_workers=num_workers > 0, prefetch_factor=4 if num_workers > 0 else None,
         )
+        if cache is not None:
+            print(f"Image cache: {cache.filled()}/{len(dataset)} images preprocessed")
+
+        if adapter:
+            # Frozen backbone: embed every pair once, then train adapter heads on the features
+            print("Training adapter heads on precomputed CLIP features…")
+            feature_loader = DataLoader(
+                dataset, batch_size=batch_size, shuffle=False,
+                num_workers=num_workers, pin_memory=DEVICE.type == "cuda",
+            )
+            data_hash = hashlib.sha256("\n".join(paths).encode("utf-8") + tokens.numpy().tobytes()).hexdigest()
+            image_f, text_f = extract_features(
+                clip_model.eval(), feature_loader, engine.normalize, str(FEATURE_DIR),
+                {"model": CLIP_MODEL, "data": data_hash}, device=DEVICE, amp=precision == "bf16",
+            )
+            head = train_adapter(image_f, text_f, epochs=adapter_epochs, batch_size=ADAPTER_BATCH_SIZE,
+                                 tau=TAU, device=DEVICE)
+            name = version_name or f"clip-adapter-{datetime.now():%Y%m%d-%H%M%S}"
+            adapter_path = CHECKPTS / f"{name}.adapter.pt"
+            save_adapter(head, adapter_path, {"model": CLIP_MODEL, "data": data_hash})
+            register_model(name, CLIP_MODEL, adapter=adapter_path)
+            print(f"Serve it with CLIP_MODEL_VERSION={name}")
+            return
 
-        optimizer = AdamW(clip_model.parameters(), lr=LR, weight_decay=WD)
+        trainer = ContrastiveTrainer(
+            clip_model, engine.normalize, tau=TAU, precision=precision, train=train,
+            grad_cache=grad_cache, device=DEVICE,
+        )
+        steps_per_epoch = -(-len(loader) // accum_steps)
+        optimizer = AdamW(trainer.params, lr=LR, weight_decay=WD)
         scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
-            optimizer, T_max=EPOCHS * len(loader)
+            optimizer, T_max=epochs * steps_per_epoch
         )
+        start_epoch = 0
+        if checkpoint_path:
+            ckpt = load_checkpoint(checkpoint_path, train)
+            clip_model.load_state_dict(ckpt["model"])
+            optimizer.load_state_dict(ckpt["optimizer"])
+            scheduler.load_state_dict(ckpt["scheduler"])
+            start_epoch = ckpt["epoch"]
+            print(f"✔ Resumed from {checkpoint_path} after epoch {start_epoch}")
+        print(f"Effective batch {batch_size * accum_steps} ({accum_steps} × {batch_size}), "
+              f"{precision}, training {train}{', gradient cache' if grad_cache and accum_steps > 1 and train == 'all' else ''}")
 
-        for epoch in range(EPOCHS):
-            total_loss = 0.0
-            for imgs, txts in tqdm(loader, desc=f"Epoch {epoch+1}/{EPOCHS}"):
-                imgs = imgs.to(DEVICE)
-                txts = txts.to(DEVICE)
-
-                with torch.no_grad():
-                    img_f = clip_model.encode_image(imgs)
-                    txt_f = clip_model.encode_text(txts)
-                    img_f = img_f / img_f.norm(dim=-1, keepdim=True)
-                    txt_f = txt_f / txt_f.norm(dim=-1, keepdim=True)
-
-                logits = img_f @ txt_f.T / TAU
-                labels = torch.arange(imgs.size(0), device=DEVICE)
-
-                loss_i = torch.nn.functional.cross_entropy(logits,    labels)
-                loss_t = torch.nn.functional.cross_entropy(logits.T,  labels)
-                loss   = (loss_i + loss_t) / 2
-
-                optimizer.zero_grad()
-                loss.backward()
-                torch.nn.utils.clip_grad_norm_(clip_model.parameters(), max_norm=1.0)
-                optimizer.step()
+        for epoch in range(start_epoch, epochs):
+            total_loss, micro = 0.0, []
+            for imgs, txts in tqdm(loader, desc=f"Epoch {epoch+1}/{epochs}"):
+                micro.append((imgs, txts))
+                if len(micro) == accum_steps:
+                    total_loss += trainer.step(micro, optimizer)
+                    scheduler.step()
+                    micro = []
+            if micro:
+                total_loss += trainer.step(micro, optimizer)
                 scheduler.step()
 
-                total_loss += loss.item()
-
-            avg = total_loss / len(loader)
+            avg = total_loss / steps_per_epoch
             print(f"Epoch {epoch+1} done – avg loss: {avg:.4f}")
+            save_checkpoint(TRAIN_CKPT, clip_model, optimizer, scheduler, epoch + 1, train)
+
+        # Final weights get their own file, so a later run cannot change a registered version
+        name = version_name or f"clip-ft-{datetime.now():%Y%m%d-%H%M%S}"
+        weights_path = CHECKPTS / f"{name}.pt"
+        torch.save(clip_model.state_dict(), weights_path)
+        print(f"✔ Saved fine-tuned CLIP → {weights_path}")
+        register_model(name, CLIP_MODEL, checkpoint=weights_path)
+        print(f"Serve it with CLIP_MODEL_VERSION={name} (and rebuild the index)")
 
-        ckpt_path = CHECKPTS / "clip_finetuned.pt"
-        torch.save(clip_model.state_dict(), ckpt_path)
-        print(f"✔ Saved fine-tuned CLIP → {ckpt_path}")
-        
     except Exception as e:
         print(f"Error during CLIP fine-tuning: {e}")
         return
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--epochs", type=int, default=10)
-    parser.add_argument("--batch_size", type=int, default=32)
-    parser.add_argument("--checkpoint_path", type=str, default=None)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--checkpoint_path", type=str, default=None, help="Training checkpoint to resume from")
+    parser.add_argument("--version_name", type=str, default=None)
     args = parser.parse_args()
 
-    # Pass args.epochs, args.batch_size, args.checkpoint_path to your training loop
-    # Example usage in your training code:
-    # if args.checkpoint_path:
-    #     model.load_state_dict(torch.load(args.checkpoint_path))
-    # train(model, ..., epochs=args.epochs, batch_size=args.batch_size)
+    run_finetune(epochs=args.epochs, batch_size=args.batch_size,
+                 checkpoint_path=args.checkpoint_path, version_name=args.version_name)
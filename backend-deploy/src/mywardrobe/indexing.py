@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import (
+    FAISS_INDEX_TYPE, FAISS_DIMENSION, FAISS_NLIST, FAISS_NPROBE, FAISS_PQ_M,
+    FAISS_PQ_NBITS, FAISS_HNSW_M, FAISS_EF_CONSTRUCTION, FAISS_EF_SEARCH,
+)
+
+INDEX_TYPES = ("IndexFlatIP", "IndexIVFFlat", "IndexIVFPQ", "IndexHNSWFlat")
+
+# Vectors sampled per IVF centroid / PQ codebook entry for training
+TRAIN_POINTS_PER_CENTROID = 64
+
+def _default_nlist(n):
+    # ~4*sqrt(N) lists, but never fewer than 39 training points per list
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+def sample_rows(vecs, n_points, seed=0):
+    """At most ``n_points`` rows of ``vecs``, sampled without replacement in row order (for training and queries)."""
+    if len(vecs) <= n_points:
+        return vecs
+    rng = np.random.default_rng(seed)
+    return vecs[np.sort(rng.choice(len(vecs), n_points, replace=False))]
+
+def make_index(vecs, index_type=None, nlist=None, pq_m=None, pq_nbits=None, hnsw_m=None,
+               ef_construction=None, verbose=True):
+    """Build, train and fill a FAISS inner-product index of ``index_type``.
+
+    Falls back to ``IndexFlatIP`` when there are too few vectors to train
+    the requested type.
+    """
+    index_type = index_type or FAISS_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}; expected one of {INDEX_TYPES}")
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
+    n, d = vecs.shape
+    if d != FAISS_DIMENSION:
+        raise ValueError(f"Embeddings have dimension {d}, but FAISS_DIMENSION is {FAISS_DIMENSION}")
+
+    nlist = nlist or FAISS_NLIST or _default_nlist(n)
+    pq_m = pq_m or FAISS_PQ_M
+    pq_nbits = pq_nbits or FAISS_PQ_NBITS
+    min_train = {"IndexIVFFlat": 39 * nlist, "IndexIVFPQ": max(39 * nlist, 2 ** pq_nbits)}
+    if n < min_train.get(index_type, 0):
+        if verbose:
+            print(f"⚠️ {n} vectors are too few to train {index_type}; using IndexFlatIP")
+        index_type = "IndexFlatIP"
+
+    start = time.perf_counter()
+    if index_type == "IndexFlatIP":
+        ix = faiss.IndexFlatIP(d)
+    elif index_type == "IndexIVFFlat":
+        quantizer = faiss.IndexFlatIP(d)
+        ix = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        ix.train(sample_rows(vecs, nlist * TRAIN_POINTS_PER_CENTROID))
+    elif index_type == "IndexIVFPQ":
+        quantizer = faiss.IndexFlatIP(d)
+        ix = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        ix.train(sample_rows(vecs, max(nlist, 2 ** pq_nbits) * TRAIN_POINTS_PER_CENTROID))
+    else:
+        ix = faiss.IndexHNSWFlat(d, hnsw_m or FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        ix.hnsw.efConstruction = ef_construction or FAISS_EF_CONSTRUCTION
+    ix.add(vecs)
+    set_search_params(ix)
+    if verbose:
+        print(f"✔ Built {index_type} over {n} vectors in {time.perf_counter() - start:.2f}s")
+    return ix
+
+def set_search_params(ix, nprobe=None, ef_search=None):
+    """Apply ``nprobe`` (IVF) / ``efSearch`` (HNSW) to an index; other types are unaffected."""
+    ps = faiss.ParameterSpace()
+    ivf = faiss.try_extract_index_ivf(ix)
+    if ivf is not None:
+        ps.set_index_parameter(ix, "nprobe", min(nprobe or FAISS_NPROBE, ivf.nlist))
+    if isinstance(faiss.downcast_index(ix), faiss.IndexHNSW):
+        ps.set_index_parameter(ix, "efSearch", ef_search or FAISS_EF_SEARCH)
+    return ix
+
+def benchmark_index(vecs, index_types=INDEX_TYPES, top_k=10, num_queries=200,
+                    nprobes=(1, 4, 16, 64), ef_searches=(16, 64, 256), seed=0):
+    """Report recall@k and per-query latency of each index type against exact search.
+
+    Queries are catalog vectors sampled with ``seed``; recall is the fraction
+    of the exact ``IndexFlatIP`` top-k that each index also returns.
+    """
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
+    queries = sample_rows(vecs, num_queries, seed=seed + 1)
+    flat = make_index(vecs, "IndexFlatIP", verbose=False)
+    start = time.perf_counter()
+    _, truth = flat.search(queries, top_k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    rows = [{"index_type": "IndexFlatIP", "param": "-", "recall": 1.0, "ms_per_query": flat_ms}]
+    for index_type in index_types:
+        if index_type == "IndexFlatIP":
+            continue
+        ix = make_index(vecs, index_type)
+        if "IVF" in index_type:
+            sweep = [("nprobe", v) for v in nprobes]
+        else:
+            sweep = [("efSearch", v) for v in ef_searches]
+        for name, value in sweep:
+            if name == "nprobe":
+                set_search_params(ix, nprobe=value)
+            else:
+                set_search_params(ix, ef_search=value)
+            start = time.perf_counter()
+            _, found = ix.search(queries, top_k)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = np.mean([len(set(f) & set(t)) / top_k for f, t in zip(found, truth)])
+            rows.append({"index_type": index_type, "param": f"{name}={value}",
+                         "recall": float(recall), "ms_per_query": ms})
+
+    print(f"Recall@{top_k} vs IndexFlatIP over {len(vecs)} vectors, {len(queries)} queries:")
+    print(f"{'index':<15} {'param':<14} {'recall':>7} {'ms/query':>9}")
+    for r in rows:
+        print(f"{r['index_type']:<15} {r['param']:<14} {r['recall']:>7.3f} {r['ms_per_query']:>9.3f}")
+    return rows
+
+def index_file_for(emb_file):
+    """Serialized index stored next to an embeddings file (``embeddings.npy`` → ``embeddings.faiss``)."""
+    return os.path.splitext(emb_file)[0] + ".faiss"
+
+def index_type_of(ix):
+    """Name of an index in INDEX_TYPES terms."""
+    name = type(faiss.downcast_index(ix)).__name__
+    # IndexFlatIP deserializes as a plain IndexFlat with METRIC_INNER_PRODUCT
+    return "IndexFlatIP" if name == "IndexFlat" else name
+
+def save_index(ix, path):
+    """Atomically write a serialized index; processes that mapped the old file keep a valid view."""
+    tmp = path + ".tmp"
+    faiss.write_index(ix, tmp)
+    os.replace(tmp, path)
+
+def read_index(path, mmap=True):
+    """Read a serialized index, memory-mapping its data where FAISS supports it.
+
+    With ``IO_FLAG_MMAP`` IVF inverted lists stay in the file and are shared
+    through the page cache by every worker that opens it. FAISS maps nothing
+    else: the vectors of ``IndexFlatIP`` and ``IndexHNSWFlat`` (and IVF
+    centroids) are copied into process memory, so each worker holds its own
+    copy of a flat catalog. Either way the index is loaded without re-adding
+    or re-training.
+    """
+    if mmap:
+        try:
+            ix = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            ix = faiss.read_index(path)
+    else:
+        ix = faiss.read_index(path)
+    return set_search_params(ix)
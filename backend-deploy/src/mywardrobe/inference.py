@@ -0,0 +1,256 @@
+import os
+import sys
+import copy
+import time
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+import torch
+import torch.nn as nn
+import clip
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import INFERENCE_BACKEND, INFERENCE_THREADS, ONNX_DIR
+
+# CPU inference backends for CLIP's image and text encoders:
+#   eager    - the PyTorch model as loaded
+#   script   - traced TorchScript graphs, frozen and optimized for inference
+#   compile  - torch.compile (inductor); the first batch of each shape compiles
+#   int8     - dynamic int8 quantization of the MLP linear layers
+#   onnx     - ONNX export run by ONNX Runtime (optional: pip install onnx onnxruntime)
+# Each keeps the eager model's outputs within PARITY_MIN_COSINE (cosine
+# similarity per embedding); `python main.py bench_inference` measures parity,
+# latency and throughput on catalog images.
+INFERENCE_BACKENDS = ("eager", "script", "compile", "int8", "onnx")
+PARITY_MIN_COSINE = {"eager": 1.0, "script": 0.9999, "compile": 0.9999, "int8": 0.99, "onnx": 0.9999}
+
+BENCH_TEXTS = [
+    "red summer dress", "black leather jacket", "white sneakers", "blue denim jeans",
+    "striped cotton shirt", "floral maxi skirt", "wool winter coat", "gold hoop earrings",
+]
+
+def threads_for(backend, spec=None):
+    """Intra-op threads for ``backend`` from a spec like ``"4"`` or ``"int8:4,onnx:2,*:1"`` (0 = library default)."""
+    spec = INFERENCE_THREADS if spec is None else spec
+    threads = {}
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, value = part.rpartition(":")
+        threads[name or "*"] = int(value)
+    return threads.get(backend, threads.get("*", 0))
+
+@contextmanager
+def torch_threads(threads):
+    """Run a block with PyTorch's process-global intra-op thread count at ``threads`` (0 keeps it), then restore it."""
+    previous = torch.get_num_threads()
+    if threads:
+        torch.set_num_threads(threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+class _ImageEncoder(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image):
+        return self.model.encode_image(image)
+
+class _TextEncoder(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, text):
+        return self.model.encode_text(text)
+
+def _examples(model, batch=2):
+    n_px = model.visual.input_resolution
+    image = torch.zeros(batch, 3, n_px, n_px, dtype=model.visual.conv1.weight.dtype)
+    return image, clip.tokenize(BENCH_TEXTS[:batch])
+
+def _script(model):
+    image, text = _examples(model)
+    with torch.no_grad():
+        encoders = []
+        for module, example in ((_ImageEncoder(model), image), (_TextEncoder(model), text)):
+            traced = torch.jit.trace(module.eval(), example, check_trace=False)
+            encoders.append(torch.jit.optimize_for_inference(torch.jit.freeze(traced)))
+    return encoders
+
+def _int8(model):
+    # nn.MultiheadAttention's projections are not dynamically quantizable, so
+    # this covers the MLP blocks, about two thirds of the transformer FLOPs
+    quantized = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+    return quantized.encode_image, quantized.encode_text
+
+def _onnx(model, tag, threads, onnx_dir):
+    try:
+        import onnx  # noqa: F401 - needed by torch.onnx.export
+        import onnxruntime as ort
+    except ImportError:
+        raise ImportError("INFERENCE_BACKEND=onnx needs ONNX and ONNX Runtime: pip install onnx onnxruntime")
+    os.makedirs(onnx_dir, exist_ok=True)
+    key = hashlib.sha256(tag.encode("utf-8")).hexdigest()[:12]
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    image, text = _examples(model)
+    encoders = []
+    for name, module, example in (("image", _ImageEncoder(model), image), ("text", _TextEncoder(model), text)):
+        path = os.path.join(onnx_dir, f"clip-{key}.{name}.onnx")
+        if not os.path.exists(path):
+            tmp = path + ".tmp"
+            with torch.no_grad():
+                torch.onnx.export(module.eval(), example, tmp, input_names=[name], output_names=["embedding"],
+                                  dynamic_axes={name: {0: "batch"}, "embedding": {0: "batch"}}, opset_version=14)
+            os.replace(tmp, path)
+            print(f"✔ Exported {name} encoder → {path}")
+        session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        encoders.append(_onnx_runner(session, name))
+    return encoders
+
+def _onnx_runner(session, name):
+    def run(x):
+        return torch.from_numpy(session.run(None, {name: x.cpu().numpy()})[0])
+    return run
+
+class ClipEncoder:
+    """``encode_image`` / ``encode_text`` of a CLIP model through one inference backend.
+
+    Non-eager backends run on the CPU only; on other devices the eager model
+    is used. ``threads`` sets ONNX Runtime's intra-op parallelism (0 keeps
+    the default). PyTorch's thread count is process-global, so the PyTorch
+    backends leave it alone: ``load_encoder`` sets it once for the serving
+    encoder and ``torch_threads`` scopes it for benchmarks.
+    """
+    def __init__(self, model, backend="eager", threads=0, tag=None, onnx_dir=None):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend!r}; expected one of {INFERENCE_BACKENDS}")
+        if backend != "eager" and model.visual.conv1.weight.device.type != "cpu":
+            print(f"⚠️ Inference backend {backend} is CPU-only; using eager")
+            backend = "eager"
+        self.model = model
+        self.backend = backend
+        self.threads = threads
+        start = time.perf_counter()
+        if backend == "eager":
+            self._image, self._text = model.encode_image, model.encode_text
+        elif backend == "script":
+            self._image, self._text = _script(model)
+        elif backend == "compile":
+            self._image = torch.compile(model.encode_image, dynamic=True)
+            self._text = torch.compile(model.encode_text, dynamic=True)
+        elif backend == "int8":
+            self._image, self._text = _int8(model)
+        else:
+            self._image, self._text = _onnx(model, tag or "clip", threads, onnx_dir or ONNX_DIR)
+        self.load_seconds = time.perf_counter() - start
+
+    def encode_image(self, image):
+        with torch.no_grad():
+            return self._image(image)
+
+    def encode_text(self, text):
+        with torch.no_grad():
+            return self._text(text)
+
+    def __repr__(self):
+        return f"ClipEncoder({self.backend!r}, threads={self.threads})"
+
+_encoders = {}
+
+def load_encoder(model, tag, backend=None, threads=None):
+    """The ``ClipEncoder`` for ``model`` (identified by ``tag``) and INFERENCE_BACKEND, built once.
+
+    For the PyTorch backends ``threads`` is applied with the process-global
+    ``torch.set_num_threads`` when the encoder is built, normally once at
+    startup; it then holds for every PyTorch op in the process.
+    """
+    backend = backend or INFERENCE_BACKEND
+    threads = threads_for(backend) if threads is None else threads
+    key = (tag, backend, threads)
+    if key not in _encoders:
+        if threads and backend != "onnx":
+            torch.set_num_threads(threads)
+        encoder = ClipEncoder(model, backend, threads, tag)
+        _encoders[key] = encoder
+        print(f"✔ Inference backend {encoder.backend} ready in {encoder.load_seconds:.1f}s "
+              f"(threads={threads or torch.get_num_threads()})")
+    return _encoders[key]
+
+def _cosine(a, b):
+    a, b = a.float(), b.float()
+    return torch.nn.functional.cosine_similarity(a, b, dim=-1)
+
+def check_parity(model, encoder, images, texts):
+    """Cosine similarity of ``encoder``'s embeddings to the eager model's.
+
+    ``images`` is a preprocessed batch, ``texts`` a token batch. Returns the
+    min and mean per modality and whether both minimums reach the backend's
+    PARITY_MIN_COSINE.
+    """
+    with torch.no_grad():
+        image_cos = _cosine(encoder.encode_image(images), model.encode_image(images))
+        text_cos = _cosine(encoder.encode_text(texts), model.encode_text(texts))
+    result = {
+        "image_min": image_cos.min().item(), "image_mean": image_cos.mean().item(),
+        "text_min": text_cos.min().item(), "text_mean": text_cos.mean().item(),
+    }
+    # Float noise can put identical embeddings a hair below 1.0
+    result["ok"] = min(result["image_min"], result["text_min"]) >= PARITY_MIN_COSINE[encoder.backend] - 1e-6
+    return result
+
+def _timed(fn, x, repeats):
+    fn(x)  # warm-up (and compilation for script / compile)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def benchmark_backends(model, images, backends=INFERENCE_BACKENDS, texts=BENCH_TEXTS, threads=None,
+                       repeats=5, tag=None):
+    """Report parity, single-query latency and batch throughput of each backend against eager.
+
+    ``images`` is a preprocessed batch; throughput is measured over all of
+    it, latency on its first image and first text. ``threads`` is a spec as
+    for ``threads_for`` (default INFERENCE_THREADS).
+    """
+    tokens = clip.tokenize(texts)
+    default_threads = torch.get_num_threads()
+    rows = []
+    for backend in backends:
+        n_threads = threads_for(backend, threads)
+        # The PyTorch thread count is restored after each backend
+        with torch_threads(0 if backend == "onnx" else n_threads):
+            try:
+                encoder = ClipEncoder(model, backend, n_threads, tag)
+            except ImportError as e:
+                print(f"⚠️ Skipping {backend}: {e}")
+                continue
+            parity = check_parity(model, encoder, images, tokens)
+            batch_seconds = _timed(encoder.encode_image, images, repeats)
+            rows.append({
+                "backend": backend, "threads": n_threads or default_threads, "load_s": encoder.load_seconds,
+                "image_ms": _timed(encoder.encode_image, images[:1], repeats) * 1000,
+                "text_ms": _timed(encoder.encode_text, tokens[:1], repeats) * 1000,
+                "images_per_s": len(images) / batch_seconds,
+                "cos_min": min(parity["image_min"], parity["text_min"]), "parity_ok": parity["ok"],
+            })
+
+    print(f"CLIP inference backends over {len(images)} images, {len(texts)} texts:")
+    print(f"{'backend':<8} {'threads':>7} {'load s':>7} {'img ms':>8} {'text ms':>8} {'img/s':>7} {'cos min':>8}")
+    for r in rows:
+        flag = "" if r["parity_ok"] else "  ⚠️ below parity threshold"
+        print(f"{r['backend']:<8} {r['threads']:>7} {r['load_s']:>7.1f} {r['image_ms']:>8.1f} "
+              f"{r['text_ms']:>8.1f} {r['images_per_s']:>7.1f} {r['cos_min']:>8.5f}{flag}")
+    return rows
@@ -0,0 +1,425 @@
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import threading
+import numpy as np
+import faiss
+
+from .compact import save_embeddings, load_embeddings, embedding_format
+from .filtering import AttributeTable, attributes_file_for, catalog_category, filtered_search, _exact_search
+from .indexing import index_file_for, save_index
+from .pathtable import ConcatPaths, find_path, path_table_file_for, write_path_table
+from .models import model_file_for
+from .sharding import merge_topk, lookup_paths
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import CATALOG_COMPACT_AFTER
+
+# A live catalog serves the built index ("base") plus changes made since:
+# added vectors sit in a small IndexIDMap2 ("delta") under new ids, and
+# removed items are tombstoned and masked out of every search. Each change is
+# appended to a write-ahead log next to the embeddings (embeddings.wal.jsonl)
+# before it is acknowledged, and replayed when the catalog is opened again.
+#
+# Compaction never rewrites the built files. It writes a new generation of
+# base files, with its own (tail of the) log, into a numbered directory
+#   embeddings.live/000001/embeddings.npy, paths.txt, embeddings.wal.jsonl, ...
+# and then atomically replaces embeddings.live/CURRENT, which names the
+# generation to open. That rename is the commit point: a crash before it
+# leaves the previous generation and its full log in place. CURRENT and the
+# first line of every log also record the build they derive from (size and
+# mtime of the built embeddings and paths files), so a rebuild by `prep`
+# supersedes the generations and the log, and the live changes in them.
+
+def wal_file_for(emb_file):
+    return os.path.splitext(emb_file)[0] + ".wal.jsonl"
+
+def live_dir_for(emb_file):
+    return os.path.splitext(emb_file)[0] + ".live"
+
+def _source_stamp(emb_file, idx_file):
+    """Size and mtime of the built embeddings and paths files, identifying one build."""
+    stamp = []
+    for path in (emb_file, idx_file):
+        st = os.stat(path)
+        stamp += [st.st_size, st.st_mtime_ns]
+    return stamp
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _encode_vector(vec):
+    return base64.b64encode(np.asarray(vec, dtype="float32").tobytes()).decode("ascii")
+
+def _decode_vector(text):
+    return np.frombuffer(base64.b64decode(text), dtype="float32")
+
+class _CatalogState:
+    """One base index plus the changes applied on top of it."""
+    def __init__(self, base, paths, attributes):
+        self.base = base
+        self.base_size = len(paths)
+        self.base_paths = paths
+        self.added_paths = []
+        self.paths = ConcatPaths([paths, self.added_paths])
+        self.added_ids = {}   # live added path -> id; base paths are looked up in their table
+        self.removed = set()
+        self.added_rows = {}
+        self.delta = faiss.IndexIDMap2(faiss.IndexFlatIP(base.d))
+        self._alive = None
+        self._attributes = attributes   # covers every id; removed ones are masked by ``alive``
+
+    @property
+    def size(self):
+        return len(self.paths) - len(self.removed)
+
+    def id_of(self, path):
+        """Id of the live item at ``path``, or None."""
+        if path in self.added_ids:
+            return self.added_ids[path]
+        old_id = find_path(self.base_paths, path)
+        return None if old_id is None or old_id in self.removed else old_id
+
+    def changed(self):
+        self._alive = None
+
+    @property
+    def alive(self):
+        if self._alive is None:
+            alive = np.ones(len(self.paths), dtype=bool)
+            alive[list(self.removed)] = False
+            self._alive = alive
+        return self._alive
+
+    @property
+    def attributes(self):
+        # Ids only grow, so rows added since the last call are appended to the cached table
+        covered = self._attributes.size
+        if covered < len(self.paths):
+            self._attributes = self._attributes.append(
+                [self.added_rows.get(i, {}) for i in range(covered, len(self.paths))])
+        return self._attributes
+
+    def apply(self, record):
+        """Apply one log record; returns the affected id or None."""
+        path = record["path"]
+        if record["op"] == "add":
+            self.apply({"op": "remove", "path": path})
+            new_id = len(self.paths)
+            self.added_paths.append(path)
+            self.added_ids[path] = new_id
+            self.added_rows[new_id] = dict(record.get("attributes") or {}, category=catalog_category(path))
+            self.delta.add_with_ids(record["vector"][None, :], np.array([new_id], dtype="int64"))
+            self.changed()
+            return new_id
+        old_id = self.id_of(path)
+        if old_id is None:
+            return None
+        self.added_ids.pop(path, None)
+        self.removed.add(old_id)
+        if old_id >= self.base_size:
+            self.delta.remove_ids(np.array([old_id], dtype="int64"))
+        self.changed()
+        return old_id
+
+class LiveCatalog:
+    """Catalog index that accepts additions and removals while serving searches.
+
+    ``add`` / ``remove`` take effect for the next search and are durable once
+    they return. Every ``CATALOG_COMPACT_AFTER`` logged changes a background
+    thread writes a new generation of base files without the removed items
+    and with the added ones, commits it and swaps it in; searches already
+    running finish on the old one. ``emb_file`` / ``idx_file`` are the built
+    catalog; ``self.emb_file`` / ``self.idx_file`` are the generation served.
+    """
+    def __init__(self, emb_file, idx_file, index_type=None, compact_after=None):
+        self.source_emb, self.source_idx, self.index_type = emb_file, idx_file, index_type
+        self.live_dir = live_dir_for(emb_file)
+        self.source = _source_stamp(emb_file, idx_file)
+        self.generation = self._current_generation()
+        self.emb_file, self.idx_file = self._generation_files(self.generation)
+        self.wal_file = wal_file_for(self.emb_file)
+        self.compact_after = CATALOG_COMPACT_AFTER if compact_after is None else compact_after
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        self.compactions = 0
+        self.last_compaction = None
+        self.last_compaction_error = None
+        self._log = self._read_wal()
+        self._state = self._open_state(self.emb_file, self.idx_file, self._log)
+        if self._log:
+            print(f"✔ Replayed {len(self._log)} catalog changes from {self.wal_file}")
+
+    def _generation_files(self, generation):
+        """(emb_file, idx_file) of a compaction generation; generation 0 is the built catalog."""
+        if generation == 0:
+            return self.source_emb, self.source_idx
+        gen_dir = os.path.join(self.live_dir, f"{generation:06d}")
+        return os.path.join(gen_dir, os.path.basename(self.source_emb)), os.path.join(gen_dir, os.path.basename(self.source_idx))
+
+    def _current_generation(self):
+        """Generation named by CURRENT; unreferenced (crashed) and superseded generations are deleted."""
+        current = os.path.join(self.live_dir, "CURRENT")
+        generation = 0
+        if os.path.exists(current):
+            with open(current) as f:
+                pointer = json.load(f)
+            if pointer["source"] == self.source:
+                generation = pointer["generation"]
+            else:
+                print(f"⚠️ {self.source_emb} was rebuilt; dropping compacted generations in {self.live_dir}")
+                shutil.rmtree(self.live_dir, ignore_errors=True)
+        if os.path.isdir(self.live_dir):
+            for name in os.listdir(self.live_dir):
+                if name != "CURRENT" and name != f"{generation:06d}":
+                    shutil.rmtree(os.path.join(self.live_dir, name), ignore_errors=True)
+        return generation
+
+    def _open_state(self, emb_file, idx_file, records):
+        from .retrieval import load_index
+        from .filtering import load_attributes
+        base, paths = load_index(emb_file, idx_file, self.index_type)
+        state = _CatalogState(base, paths, load_attributes(idx_file, paths))
+        for record in records:
+            state.apply(record)
+        return state
+
+    def _wal_header(self):
+        return json.dumps({"op": "source", "source": self.source}) + "\n"
+
+    def _read_wal(self):
+        """Logged changes; a log written against another build of the catalog is deleted."""
+        records = []
+        if not os.path.exists(self.wal_file):
+            return records
+        with open(self.wal_file) as f:
+            try:
+                header = json.loads(f.readline())
+            except json.JSONDecodeError:
+                header = None
+            stale = header != {"op": "source", "source": self.source}
+            if not stale:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break   # torn final line from an interrupted append
+                    if record["op"] == "add":
+                        record["vector"] = _decode_vector(record["vector"])
+                    records.append(record)
+        if stale:
+            # Its adds may name old paths or hold vectors of another model version
+            print(f"⚠️ {self.source_emb} was rebuilt; dropping the live changes in {self.wal_file}")
+            os.remove(self.wal_file)
+        return records
+
+    def _write_records(self, f, records):
+        for record in records:
+            if record["op"] == "add":
+                record = dict(record, vector=_encode_vector(record["vector"]))
+            f.write(json.dumps(record) + "\n")
+
+    def _append(self, records):
+        with open(self.wal_file, "a") as f:
+            if f.tell() == 0:
+                f.write(self._wal_header())
+            self._write_records(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+        self._log.extend(records)
+
+    # --- updates ---------------------------------------------------------
+    def add(self, paths, vecs, attributes=None):
+        """Add (or replace) items by path; returns their new ids."""
+        vecs = np.ascontiguousarray(vecs, dtype="float32").reshape(len(paths), -1)
+        attributes = attributes or [None] * len(paths)
+        records = [
+            {"op": "add", "path": path, "vector": vec, "attributes": attrs or {}}
+            for path, vec, attrs in zip(paths, vecs, attributes)
+        ]
+        with self._lock:
+            self._append(records)
+            ids = [self._state.apply(record) for record in records]
+        self._maybe_compact()
+        return ids
+
+    def remove(self, paths):
+        """Tombstone items by path; returns how many were in the catalog."""
+        with self._lock:
+            records = [{"op": "remove", "path": path} for path in dict.fromkeys(paths) if self._state.id_of(path) is not None]
+            if records:
+                self._append(records)
+            for record in records:
+                self._state.apply(record)
+        self._maybe_compact()
+        return len(records)
+
+    # --- search ----------------------------------------------------------
+    @property
+    def paths(self):
+        return self._state.paths
+
+    @property
+    def attributes(self):
+        with self._lock:
+            return self._state.attributes
+
+    @property
+    def ntotal(self):
+        return self._state.size
+
+    def search_paths(self, queries, k, filters=None):
+        """Top-``k`` live items for each query: ``(D, paths)`` with None for missing results."""
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        with self._lock:
+            state = self._state
+            mask = None
+            if state.removed or filters:
+                mask = (state.alive & state.attributes.mask(filters)) if filters else state.alive
+            results = [self._search_delta(state, queries, k, mask)] if state.delta.ntotal else []
+        # The base index never changes, so it is searched outside the lock
+        if mask is None:
+            results.insert(0, state.base.search(queries, k))
+        else:
+            results.insert(0, filtered_search(state.base, queries, k, mask[:state.base_size]))
+        D, I = merge_topk(results, [0] * len(results), k)
+        return D, lookup_paths(I, state.paths)
+
+    def _search_delta(self, state, queries, k, mask):
+        if mask is None:
+            return state.delta.search(queries, k)
+        ids = faiss.vector_to_array(state.delta.id_map)
+        keep = np.flatnonzero(mask[ids])
+        if len(keep) == 0:
+            return (np.full((len(queries), k), -np.inf, dtype="float32"),
+                    np.full((len(queries), k), -1, dtype="int64"))
+        D, I = _exact_search(state.delta.index, queries, k, keep)
+        return D, np.where(I >= 0, ids[np.maximum(I, 0)], -1)
+
+    # --- compaction ------------------------------------------------------
+    def _maybe_compact(self):
+        if self.compact_after <= 0 or len(self._log) < self.compact_after:
+            return
+        self.start_compaction()
+
+    def start_compaction(self):
+        """Compact on the background thread that ``close`` waits for; False if one is already running."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return False
+        self._compactor = threading.Thread(target=self._compact_in_background, name="catalog-compact", daemon=True)
+        self._compactor.start()
+        return True
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+            self.last_compaction_error = None
+        except Exception as e:
+            # The log and the previous generation are intact; the next compaction retries
+            self.last_compaction_error = f"{type(e).__name__}: {e}"
+            print(f"⚠️ Catalog compaction failed: {e}")
+
+    def compact(self):
+        """Rewrite the base files with all logged changes applied and truncate the log."""
+        from .retrieval import _make_catalog_index
+
+        with self._compact_lock:
+            start = time.perf_counter()
+            with self._lock:
+                state, applied = self._state, len(self._log)
+                if not applied:
+                    return
+                live = np.flatnonzero(state.alive).tolist()
+                added = [i for i in live if i >= state.base_size]
+                added_vecs = np.vstack([state.delta.reconstruct(i) for i in added]) if added else None
+                rows = state.attributes.rows()
+            kept = [i for i in live if i < state.base_size]
+            vecs = load_embeddings(self.emb_file)[kept]
+            if added_vecs is not None:
+                vecs = np.vstack([vecs, added_vecs])
+            paths = [state.paths[i] for i in live]
+
+            # Write the next generation in its own directory
+            generation = self.generation + 1
+            new_emb, new_idx = self._generation_files(generation)
+            gen_dir = os.path.dirname(new_emb)
+            shutil.rmtree(gen_dir, ignore_errors=True)
+            os.makedirs(gen_dir)
+            save_embeddings(vecs, new_emb, embedding_format(self.emb_file))
+            save_index(_make_catalog_index(new_emb, self.index_type, vecs), index_file_for(new_emb))
+            with open(new_idx, "w") as f:
+                f.write("\n".join(paths))
+            write_path_table(paths, path_table_file_for(new_idx))
+            AttributeTable.from_rows([rows[i] for i in live]).save(attributes_file_for(new_idx))
+            if os.path.exists(model_file_for(self.emb_file)):
+                shutil.copyfile(model_file_for(self.emb_file), model_file_for(new_emb))
+
+            fresh = self._open_state(new_emb, new_idx, [])
+            with self._lock:
+                # Changes logged while compacting move to the new generation's log
+                tail = self._log[applied:]
+                for record in tail:
+                    fresh.apply(record)
+                with open(wal_file_for(new_emb), "w") as f:
+                    f.write(self._wal_header())
+                    self._write_records(f, tail)
+                for name in os.listdir(gen_dir):
+                    _fsync(os.path.join(gen_dir, name))
+                _fsync(gen_dir)
+                self._commit_generation(generation)
+                old_generation, old_wal = self.generation, self.wal_file
+                self.generation, self.emb_file, self.idx_file = generation, new_emb, new_idx
+                self.wal_file = wal_file_for(new_emb)
+                self._log = tail
+                self._state = fresh
+            # Only now is the folded log obsolete; the built files stay as they are
+            if old_generation == 0:
+                if os.path.exists(old_wal):
+                    os.remove(old_wal)
+            else:
+                shutil.rmtree(os.path.dirname(old_wal), ignore_errors=True)
+            self.compactions += 1
+            self.last_compaction = time.time()
+            print(f"✔ Compacted {applied} catalog changes into {len(paths)} items "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+    def _commit_generation(self, generation):
+        """Point CURRENT at ``generation``: the atomic commit of a compaction."""
+        current = os.path.join(self.live_dir, "CURRENT")
+        with open(current + ".tmp", "w") as f:
+            json.dump({"generation": generation, "source": self.source}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current + ".tmp", current)
+        _fsync(self.live_dir)
+
+    def close(self):
+        """Let a running compaction finish before the catalog is dropped."""
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def stats(self):
+        state = self._state
+        return {
+            "size": state.size,
+            "base": state.base_size,
+            "added": int(state.delta.ntotal),
+            "removed": len(state.removed),
+            "wal_records": len(self._log),
+            "generation": self.generation,
+            "compact_after": self.compact_after,
+            "compacting": self._compactor is not None and self._compactor.is_alive(),
+            "compactions": self.compactions,
+            "last_compaction": self.last_compaction,
+            "last_compaction_error": self.last_compaction_error,
+        }
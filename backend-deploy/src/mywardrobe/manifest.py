@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Incremental index builds keep a JSON-lines manifest next to the embeddings:
+# one record per encoded image with its content hash, mask hash, model name
+# and the (shard, row) holding its vector. Shards are written before their
+# manifest records, so an interrupted build never references missing vectors.
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's bytes, or None if the path is missing."""
+    if path is None or not os.path.exists(path):
+        return None
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _stat_key(path):
+    if path is None or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def manifest_paths(out_emb):
+    """Return (manifest_file, shard_dir) used for an embeddings file."""
+    base, _ = os.path.splitext(out_emb)
+    return base + ".manifest.jsonl", base + ".shards"
+
+def load_manifest(manifest_file):
+    """Load manifest records keyed by image path; later records win."""
+    records = {}
+    if not os.path.exists(manifest_file):
+        return records
+    with open(manifest_file, "r") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn final line from an interrupted build
+                continue
+            records[rec["path"]] = rec
+    return records
+
+def append_manifest(manifest_file, records):
+    """Append records and flush them to disk."""
+    with open(manifest_file, "a") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_manifest(manifest_file, records):
+    """Atomically replace the manifest with ``records``."""
+    tmp = manifest_file + ".tmp"
+    with open(tmp, "w") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+    os.replace(tmp, manifest_file)
+
+def fingerprint(img_path, mask_path, model_name, previous=None):
+    """Build the identity of an image; hashes are reused when size and mtime are unchanged."""
+    img_stat, mask_stat = _stat_key(img_path), _stat_key(mask_path)
+    if previous is not None and previous.get("stat") == img_stat and previous.get("mask_stat") == mask_stat:
+        img_hash, mask_hash = previous["sha1"], previous["mask_sha1"]
+    else:
+        img_hash, mask_hash = file_digest(img_path), file_digest(mask_path)
+    return {
+        "path": img_path,
+        "sha1": img_hash,
+        "mask_sha1": mask_hash,
+        "model": model_name,
+        "stat": img_stat,
+        "mask_stat": mask_stat,
+    }
+
+def is_current(record, fp):
+    """True if a manifest record still describes the image identified by ``fp``."""
+    return (
+        record is not None
+        and record["sha1"] == fp["sha1"]
+        and record["mask_sha1"] == fp["mask_sha1"]
+        and record["model"] == fp["model"]
+    )
+
+def save_shard(shard_dir, shard_id, vecs):
+    """Atomically write one shard of vectors and return its file name."""
+    os.makedirs(shard_dir, exist_ok=True)
+    name = f"shard_{shard_id:05d}.npy"
+    tmp = os.path.join(shard_dir, name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, vecs)
+    os.replace(tmp, os.path.join(shard_dir, name))
+    return name
+
+def next_shard_id(shard_dir):
+    if not os.path.isdir(shard_dir):
+        return 0
+    ids = [int(f[6:11]) for f in os.listdir(shard_dir) if f.startswith("shard_") and f.endswith(".npy")]
+    return max(ids) + 1 if ids else 0
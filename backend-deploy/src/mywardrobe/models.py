@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import hashlib
+import torch
+import clip
+
+from .adapter import load_adapter
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import CLIP_MODEL, CLIP_MODEL_VERSION, CLIP_CHECKPOINT_PATH, CLIP_ADAPTER_PATH, MODEL_REGISTRY_FILE
+
+# A model version is a stock CLIP base plus an optional fine-tuned checkpoint
+# and adapter. Named versions are recorded in a JSON registry
+# (MODEL_REGISTRY_FILE, written by `finetune`); CLIP_MODEL_VERSION selects one,
+# otherwise CLIP_MODEL / CLIP_CHECKPOINT_PATH / CLIP_ADAPTER_PATH describe it.
+# Every embeddings file records the version that produced it
+# (embeddings.npy -> embeddings.model.json), and catalogs built by a
+# different version are refused at load time.
+
+_hashes = {}
+
+def file_hash(path):
+    """Short SHA-256 of a weights file, cached per (path, size, mtime)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if key not in _hashes:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _hashes[key] = h.hexdigest()[:12]
+    return _hashes[key]
+
+class ModelVersion:
+    def __init__(self, name, base, checkpoint=None, adapter=None):
+        self.name = name
+        self.base = base
+        self.checkpoint = checkpoint or None
+        self.adapter = adapter or None
+        self._tag = None
+
+    @property
+    def tag(self):
+        """Identity of the weights: the base name plus content hashes of checkpoint and adapter."""
+        if self._tag is None:
+            parts = [self.base]
+            if self.checkpoint:
+                parts.append(f"ckpt:{file_hash(self.checkpoint)}")
+            if self.adapter:
+                parts.append(f"adapter:{file_hash(self.adapter)}")
+            self._tag = "+".join(parts)
+        return self._tag
+
+    def to_dict(self):
+        return {"base": self.base, "checkpoint": self.checkpoint, "adapter": self.adapter}
+
+    def __repr__(self):
+        return f"ModelVersion({self.name!r}, {self.tag!r})"
+
+def load_registry(registry_file=None):
+    """Named model versions from the registry file."""
+    registry_file = registry_file or MODEL_REGISTRY_FILE
+    if not os.path.exists(registry_file):
+        return {}
+    with open(registry_file) as f:
+        entries = json.load(f)
+    return {name: ModelVersion(name, **entry) for name, entry in entries.items()}
+
+def register_model(name, base, checkpoint=None, adapter=None, registry_file=None):
+    """Add (or replace) a named version; weight paths are stored absolute."""
+    registry_file = registry_file or MODEL_REGISTRY_FILE
+    entries = {n: v.to_dict() for n, v in load_registry(registry_file).items()}
+    version = ModelVersion(name, base,
+                           os.path.abspath(checkpoint) if checkpoint else None,
+                           os.path.abspath(adapter) if adapter else None)
+    entries[name] = version.to_dict()
+    os.makedirs(os.path.dirname(os.path.abspath(registry_file)), exist_ok=True)
+    tmp = registry_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp, registry_file)
+    print(f"✔ Registered model version {name} ({version.tag}) → {registry_file}")
+    return version
+
+def resolve_model(name=None, registry_file=None):
+    """The ``ModelVersion`` called ``name`` (default CLIP_MODEL_VERSION), or the one the env describes."""
+    name = name or CLIP_MODEL_VERSION
+    if not name:
+        return ModelVersion(CLIP_MODEL, CLIP_MODEL, CLIP_CHECKPOINT_PATH, CLIP_ADAPTER_PATH)
+    registry = load_registry(registry_file)
+    if name in registry:
+        return registry[name]
+    if name in clip.available_models():
+        return ModelVersion(name, name)
+    raise ValueError(f"Unknown model version {name!r}; registered: {sorted(registry)}")
+
+_current = None
+
+def current_model():
+    """The version this process encodes with (resolved once)."""
+    global _current
+    if _current is None:
+        _current = resolve_model()
+    return _current
+
+_loaded = {}
+
+def load_model(version, device="cpu"):
+    """``(model, preprocess, adapter or None)`` for ``version``, loaded once per process."""
+    key = (version.tag, str(device))
+    if key not in _loaded:
+        model, preprocess = clip.load(version.base, device=device)
+        if version.checkpoint:
+            state = torch.load(version.checkpoint, map_location=device)
+            # Training checkpoints hold the weights next to optimizer state
+            model.load_state_dict(state["model"] if "model" in state and "optimizer" in state else state)
+        model.eval()
+        adapter = load_adapter(version.adapter, device) if version.adapter else None
+        _loaded[key] = (model, preprocess, adapter)
+        print(f"✔ Loaded model version {version.name} ({version.tag})")
+    return _loaded[key]
+
+def model_file_for(emb_file):
+    return os.path.splitext(emb_file)[0] + ".model.json"
+
+def write_model_tag(emb_file, version):
+    with open(model_file_for(emb_file), "w") as f:
+        json.dump({"version": version.name, "tag": version.tag}, f)
+
+def read_model_tag(emb_file):
+    path = model_file_for(emb_file)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def check_model_tag(emb_file, version=None):
+    """Raise ValueError if ``emb_file`` was embedded by a different model version than ``version``."""
+    version = version or current_model()
+    built = read_model_tag(emb_file)
+    if built is None:
+        print(f"⚠️ {emb_file} has no model version; assuming {version.name}")
+        return
+    if built["tag"] != version.tag:
+        raise ValueError(
+            f"{emb_file} was embedded with model version {built['version']} ({built['tag']}) "
+            f"but queries use {version.name} ({version.tag}); rebuild the index or set "
+            f"CLIP_MODEL_VERSION={built['version']}"
+        )
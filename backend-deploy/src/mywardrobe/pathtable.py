@@ -0,0 +1,141 @@
+import os
+from bisect import bisect_right
+import numpy as np
+
+# The id -> path table of a catalog is kept next to its paths file
+# (index_paths.txt -> index_paths.pathtab) in one memory-mapped file:
+#   magic (8 bytes) | count n (uint64)
+#   offsets (int64, n + 1)  - byte range of each path in the blob
+#   order (int64, n)        - ids sorted by path, for lookups by path
+#   blob                    - the UTF-8 paths back to back
+# Every process serving the catalog maps the same pages, and only the paths a
+# search returns are decoded. The text file stays the source of truth.
+MAGIC = b"MWPATHS1"
+_HEADER = 16
+
+def path_table_file_for(idx_file):
+    return os.path.splitext(idx_file)[0] + ".pathtab"
+
+def write_path_table(paths, table_file):
+    """Write ``paths`` as a path table (atomically)."""
+    encoded = [p.encode("utf-8") for p in paths]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    order = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype="<i8")
+    tmp = table_file + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(offsets.tobytes())
+        f.write(order.tobytes())
+        f.write(b"".join(encoded))
+    os.replace(tmp, table_file)
+
+class PathTable:
+    """Read-only sequence of catalog paths backed by a memory-mapped path table."""
+    def __init__(self, table_file):
+        self.table_file = table_file
+        buf = np.memmap(table_file, dtype=np.uint8, mode="r")
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError(f"{table_file} is not a path table")
+        n = int(buf[8:_HEADER].view("<u8")[0])
+        start = _HEADER
+        self.offsets = buf[start:start + 8 * (n + 1)].view("<i8")
+        start += 8 * (n + 1)
+        self.order = buf[start:start + 8 * n].view("<i8")
+        self.blob = buf[start + 8 * n:]
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    def _raw(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        i = int(i)
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(f"path id {i} out of range for {self._n} paths")
+        return self._raw(i).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self._raw(i).decode("utf-8")
+
+    def find(self, path):
+        """Id of ``path``, or None; a binary search that decodes about log2(n) paths."""
+        key = path.encode("utf-8")
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._raw(self.order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n and self._raw(self.order[lo]) == key:
+            return int(self.order[lo])
+        return None
+
+    def __contains__(self, path):
+        return self.find(path) is not None
+
+def find_path(paths, path):
+    """Id of ``path`` in a path table, ``ConcatPaths`` or list; None if absent."""
+    if hasattr(paths, "find"):
+        return paths.find(path)
+    try:
+        return paths.index(path)
+    except ValueError:
+        return None
+
+class ConcatPaths:
+    """Several path sequences read as one, e.g. the shards of a sharded catalog.
+
+    The last part may keep growing (a live catalog appends added paths to it).
+    """
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.starts = [0]
+        for part in self.parts[:-1]:
+            self.starts.append(self.starts[-1] + len(part))
+
+    def __len__(self):
+        return self.starts[-1] + len(self.parts[-1])
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        part = bisect_right(self.starts, i) - 1
+        return self.parts[part][i - self.starts[part]]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def find(self, path):
+        for start, part in zip(self.starts, self.parts):
+            i = find_path(part, path)
+            if i is not None:
+                return start + i
+        return None
+
+    def __contains__(self, path):
+        return self.find(path) is not None
+
+def load_paths(idx_file):
+    """Catalog paths of ``idx_file`` as a ``PathTable``, writing the table if it is missing or stale."""
+    table_file = path_table_file_for(idx_file)
+    if not os.path.exists(table_file) or os.path.getmtime(table_file) < os.path.getmtime(idx_file):
+        with open(idx_file) as f:
+            paths = f.read().splitlines()
+        try:
+            write_path_table(paths, table_file)
+        except OSError as e:
+            print(f"⚠️ Could not write {table_file} ({e}); keeping paths in memory")
+            return paths
+    return PathTable(table_file)
@@ -1,112 +1,574 @@
+import io
 import os
+import re
+import sys
+import time
+import hashlib
 import numpy as np
-import faiss
 import clip
 import torch
-from .utils import apply_mask, preprocess_image, cosine_sim
+from .utils import apply_mask, mask_and_preprocess, load_image, preprocess_image, cosine_sim
+from .caching import LRUCache, ImageEmbeddingCache, dhash
+from .preprocess import BatchPreprocessor
+from .compact import save_embeddings, load_embeddings, quantized_index, embedding_format
+from .indexing import (
+    FAISS_INDEX_TYPE, make_index, set_search_params, index_file_for, index_type_of, save_index, read_index,
+)
+from .sharding import select_shard
+from .filtering import build_attributes, attributes_file_for, load_attributes, filtered_search
+from .pathtable import load_paths, path_table_file_for, write_path_table
+from .models import current_model, load_model, write_model_tag, check_model_tag
+from .inference import INFERENCE_BACKENDS, load_encoder, benchmark_backends
+from .manifest import (
+    manifest_paths, load_manifest, append_manifest, write_manifest,
+    fingerprint, is_current, save_shard, next_shard_id,
+)
 from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+from tqdm import tqdm
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import (
+    CATALOG_ATTRIBUTES_FILE, EMBEDDING_FORMAT, FAST_PREPROCESS, INFERENCE_BACKEND, TEXT_CACHE_SIZE, IMAGE_CACHE_SIZE, IMAGE_CACHE_DIR, IMAGE_CACHE_DISK_MAX, IMAGE_CACHE_PHASH_DISTANCE,
+)
 
 # Updated device detection to support Apple Silicon
 device = torch.device("mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu")
 
-# Lazy loader for CLIP model
-_clip_cache = None
-
+# Lazy loader for the CLIP model version being served (see models)
 def _get_clip():
-    global _clip_cache
-    if _clip_cache is None:
-        m, p = clip.load("ViT-B/32", device=device)
-        m.eval()
-        _clip_cache = (m, p)
-    return _clip_cache
-
-def encode_query(img_path, text):
-    """Helper function to encode a query (image + text) into a blended vector."""
-    model, preprocess = _get_clip()
-    
-    # Encode image
-    img = Image.open(img_path).convert('RGB')
-    image_input = preprocess(img).unsqueeze(0).to(device)
-    
+    model, preprocess, _ = load_model(current_model(), device)
+    return model, preprocess
+
+def _get_encoder():
+    """CLIP's encoders through INFERENCE_BACKEND (see inference), built once per model version."""
+    model, _ = _get_clip()
+    return load_encoder(model, model_tag())
+
+def _get_adapter():
+    """Adapter heads of the model version, applied after CLIP's encoders, or None."""
+    return load_model(current_model(), device)[2]
+
+def model_tag():
+    """Identity of the embedding model (CLIP weights plus any checkpoint / adapter), for cache and manifest keys."""
+    return current_model().tag
+
+def _adapt(emb, modality):
+    """Normalized CLIP embeddings through the adapter head of ``modality``, if one is loaded."""
+    adapter = _get_adapter()
+    if adapter is None:
+        return emb
+    return getattr(adapter, modality)(emb.float())
+
+def _get_preprocessor():
+    """Batched tensor preprocessor matching the CLIP model, or None if FAST_PREPROCESS is off."""
+    if not FAST_PREPROCESS:
+        return None
+    model, _ = _get_clip()
+    return BatchPreprocessor(model.visual.input_resolution, device=device)
+
+def warm_up(batch_size=1):
+    """Load CLIP and the inference backend and run a dummy batch through both encoders.
+
+    The query caches are bypassed. Returns the dummy image embeddings (for a
+    warm-up search) and the seconds spent per phase.
+    """
+    timings = {}
+    start = time.perf_counter()
+    model, _ = _get_clip()
+    _get_preprocessor()
+    timings["load_model"] = time.perf_counter() - start
+    start = time.perf_counter()
+    encoder = _get_encoder()
+    timings["load_backend"] = time.perf_counter() - start
+    start = time.perf_counter()
+    n_px = model.visual.input_resolution
+    images = torch.zeros(batch_size, 3, n_px, n_px, dtype=model.visual.conv1.weight.dtype, device=device)
+    tokens = clip.tokenize(["warm up"] * batch_size).to(device)
     with torch.no_grad():
-        img_emb = model.encode_image(image_input)
-        img_emb = img_emb / img_emb.norm(dim=-1, keepdim=True)
-    
-    # Encode text if provided
-    if text:
-        text_tokens = clip.tokenize([text]).to(device)
+        emb = encoder.encode_image(images)
+        emb = _adapt(emb / emb.norm(dim=-1, keepdim=True), "image")
+        txt = encoder.encode_text(tokens)
+        _adapt(txt / txt.norm(dim=-1, keepdim=True), "text")
+    timings["forward"] = time.perf_counter() - start
+    return emb.float().cpu().numpy(), timings
+
+# Normalized text embeddings keyed by (model, normalized text)
+_text_cache = LRUCache(TEXT_CACHE_SIZE)
+
+def normalize_text(text):
+    """Canonical form of a text query; CLIP's tokenizer lowercases and collapses whitespace too."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def encode_texts(texts):
+    """Encode texts into normalized embeddings, reusing cached phrases.
+
+    Only phrases missing from the cache go through ``encode_text``, in a
+    single batch. Returns a ``(len(texts), dim)`` tensor on ``device``.
+    """
+    tag = model_tag()
+    keys = [(tag, normalize_text(text)) for text in texts]
+    found = {key: _text_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key, emb in found.items() if emb is None]
+    if missing:
+        text_tokens = clip.tokenize([text for _, text in missing]).to(device)
         with torch.no_grad():
-            txt_emb = model.encode_text(text_tokens)
-            txt_emb = txt_emb / txt_emb.norm(dim=-1, keepdim=True)
+            emb = _get_encoder().encode_text(text_tokens)
+            emb = _adapt(emb / emb.norm(dim=-1, keepdim=True), "text")
+        for key, row in zip(missing, emb):
+            # A copy, so a cached row does not keep its whole batch alive
+            row = row.clone()
+            found[key] = row
+            _text_cache.put(key, row)
+    return torch.stack([found[key] for key in keys])
+
+def warm_text_cache(phrases, batch_size=256):
+    """Pre-encode common query phrases so their first use is a cache hit."""
+    phrases = [p for p in dict.fromkeys(normalize_text(p) for p in phrases) if p]
+    for i in range(0, len(phrases), batch_size):
+        encode_texts(phrases[i:i + batch_size])
+    print(f"✔ Warmed text cache with {len(phrases)} phrases")
+    return len(phrases)
+
+def text_cache_stats():
+    return _text_cache.stats()
+
+# Query-image embeddings keyed by a content hash of the upload
+_image_cache = ImageEmbeddingCache(
+    IMAGE_CACHE_SIZE, disk_dir=IMAGE_CACHE_DIR or None,
+    disk_max=IMAGE_CACHE_DISK_MAX, phash_distance=IMAGE_CACHE_PHASH_DISTANCE,
+)
+
+class QueryImage:
+    """A query upload: its raw bytes, their cache key, and the decoded image if it was needed."""
+    def __init__(self, data):
+        self.data = data
+        self.key = image_content_key(data)
+        self.image = None
+
+def prepare_query_image(data):
+    """Hash an upload's raw bytes and decode it only if its embedding is not cached.
+
+    Decoding errors are raised here, so a bad upload fails before it joins a
+    batch. A cache hit skips the decode: the same bytes decoded once already.
+    With FAST_PREPROCESS large JPEGs are draft-decoded at reduced size, as
+    catalog images are (see ``BatchPreprocessor.decode``).
+    """
+    query = QueryImage(data)
+    if query.key not in _image_cache:
+        engine = _get_preprocessor()
+        query.image = engine.decode(data) if engine is not None else load_image(data)
+    return query
+
+def image_content_key(image):
+    """SHA-256 of an image's bytes (paths, bytes) or decoded pixels (PIL images), salted with the model."""
+    if isinstance(image, QueryImage):
+        return image.key
+    h = hashlib.sha256(model_tag().encode())
+    if isinstance(image, Image.Image):
+        h.update(f"{image.mode}{image.size}".encode())
+        h.update(image.tobytes())
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        h.update(image)
     else:
-        txt_emb = torch.zeros_like(img_emb)
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def encode_images(images):
+    """Encode query images into normalized embeddings, reusing cached uploads.
+
+    ``images`` may be ``QueryImage`` uploads (see ``prepare_query_image``),
+    paths, bytes, file-like objects or PIL images. Exact repeats are found
+    by content hash before decoding; with
+    IMAGE_CACHE_PHASH_DISTANCE set, near-duplicates are matched by
+    perceptual hash. Only the remaining images are preprocessed and sent
+    through ``encode_image``, in one batch.
+    """
+    model, preprocess = _get_clip()
+    engine = _get_preprocessor()
+    decode = engine.decode if engine is not None else load_image
+    # File-like objects can only be read once: hash and decode the same bytes
+    images = [image.read() if hasattr(image, "read") else image for image in images]
+    keys = [image_content_key(image) for image in images]
+    embs = [_image_cache.get(key) for key in keys]
+
+    todo, decoded, phashes, repeats = [], [], [], {}
+    for i, emb in enumerate(embs):
+        if emb is not None:
+            continue
+        if keys[i] in repeats:
+            continue
+        repeats[keys[i]] = i
+        if isinstance(images[i], QueryImage):
+            img = images[i].image if images[i].image is not None else decode(images[i].data)
+        else:
+            img = decode(images[i])
+        phash = dhash(img) if _image_cache.phash_distance >= 0 else None
+        emb = _image_cache.get_similar(phash) if phash is not None else None
+        if emb is not None:
+            embs[i] = emb
+            continue
+        todo.append(i)
+        decoded.append(img)
+        phashes.append(phash)
+
+    if todo:
+        if engine is not None:
+            image_input = engine(decoded)
+        else:
+            image_input = torch.stack([preprocess(img) for img in decoded]).to(device)
+        with torch.no_grad():
+            emb = _get_encoder().encode_image(image_input)
+            emb = _adapt(emb / emb.norm(dim=-1, keepdim=True), "image")
+        emb = emb.float().cpu().numpy()
+        for row, i in enumerate(todo):
+            embs[i] = emb[row]
+            _image_cache.put(keys[i], emb[row], phashes[row])
+    # The same upload can appear more than once in a batch
+    embs = [emb if emb is not None else embs[repeats[key]] for emb, key in zip(embs, keys)]
+    dtype = model.visual.conv1.weight.dtype
+    return torch.from_numpy(np.stack(embs)).to(device=device, dtype=dtype)
+
+def image_cache_stats():
+    return _image_cache.stats()
+
+def _blend_alpha(text):
+    # Adaptive text weight: longer descriptions pull the query further toward text
+    return min(0.4 + 0.02 * len(text.split()), 0.6) if text else 0.0
+
+def encode_queries(images, texts):
+    """Encode a batch of (image, text) queries into blended, normalized vectors.
+
+    Images may be paths, raw bytes, file-like objects or decoded PIL images.
+    All images go through one ``encode_image`` call and all non-empty texts
+    through one ``encode_text`` call. Returns a ``(len(images), dim)`` tensor.
+    """
+    # Encode images
+    img_emb = encode_images(images)
+
+    # Encode the texts that were provided
+    txt_emb = torch.zeros_like(img_emb)
+    with_text = [i for i, text in enumerate(texts) if text]
+    if with_text:
+        txt_emb[with_text] = encode_texts([texts[i] for i in with_text]).to(txt_emb.dtype)
 
     # Blend image and text embeddings with adaptive alpha
-    alpha = min(0.4 + 0.02 * len(text.split()), 0.6) if text else 0.0
+    alpha = torch.tensor([_blend_alpha(text) for text in texts], dtype=img_emb.dtype, device=img_emb.device)
+    alpha = alpha.unsqueeze(1)
     query_emb = (1 - alpha) * img_emb + alpha * txt_emb
     query_emb = query_emb / query_emb.norm(dim=-1, keepdim=True)
     return query_emb.cpu()
 
-def build_index(image_dir, mask_dir, out_emb="embeddings.npy", out_idx="index_paths.txt"):
-    model, preprocess = _get_clip()
-    embeddings, paths = [], []
-    
-    # Get list of images
-    image_files = [f for f in os.listdir(image_dir) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
-    
+def encode_query(image, text):
+    """Helper function to encode a query (image + text) into a blended vector.
+
+    ``image`` may be a path, raw bytes, a file-like object or a PIL image.
+    """
+    return encode_queries([image], [text])
+
+class CatalogImageDataset(Dataset):
+    """Decodes, masks and preprocesses catalog images for batched encoding.
+
+    With ``fused_mask`` masked images go through ``mask_and_preprocess``,
+    which masks at the model's input resolution instead of full size. With a
+    ``BatchPreprocessor`` engine items are uint8 crops, normalized per batch
+    by the encoder (a quarter of the float32 transfer from workers).
+    """
+    def __init__(self, items, preprocess_fn, fused_mask=False, n_px=224, engine=None):
+        self.items = items  # list of (img_path, mask_path or None)
+        self.preprocess = preprocess_fn
+        self.fused_mask = fused_mask
+        self.n_px = n_px
+        self.engine = engine
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        img_path, mask_path = self.items[idx]
+        if self.engine is not None:
+            return self.engine.catalog_item(img_path, mask_path, self.fused_mask)
+        if mask_path is not None and self.fused_mask:
+            return torch.from_numpy(mask_and_preprocess(img_path, mask_path, self.n_px))
+        if mask_path is not None:
+            img = apply_mask(img_path, mask_path)
+        else:
+            img = Image.open(img_path).convert('RGB')
+        return self.preprocess(img)
+
+def _list_catalog(image_dir, mask_dir):
+    """Return sorted (img_path, mask_path or None) pairs for the catalog."""
+    items = []
+    image_files = sorted(f for f in os.listdir(image_dir) if f.lower().endswith((".png", ".jpg", ".jpeg")))
     for img_name in image_files:
         img_path = os.path.join(image_dir, img_name)
-        
+
         # Construct mask path
         base_name, ext = os.path.splitext(img_name)
-        segm_name = base_name + "_segm.png"
-        mask_path = os.path.join(mask_dir, segm_name)
-        
-        # Apply mask if it exists, otherwise use original image
-        if os.path.exists(mask_path):
-            img = apply_mask(img_path, mask_path)
-        else:
-            img = Image.open(img_path).convert('RGB')
-        
-        # Preprocess and encode
-        image_input = preprocess(img).unsqueeze(0).to(device)
-        
+        mask_path = os.path.join(mask_dir, base_name + "_segm.png")
+        items.append((img_path, mask_path if os.path.exists(mask_path) else None))
+    return items
+
+def _encode_catalog(items, batch_size=64, num_workers=4, desc="Encoding images", fused_mask=False):
+    """Encode (img_path, mask_path) pairs with a worker pool feeding fixed-size batches."""
+    model, preprocess = _get_clip()
+    if not items:
+        return np.zeros((0, model.visual.output_dim), dtype="float32")
+
+    engine = _get_preprocessor()
+    encoder = _get_encoder()
+    loader = DataLoader(
+        CatalogImageDataset(items, preprocess, fused_mask, model.visual.input_resolution, engine),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        pin_memory=device.type == "cuda",
+    )
+    embeddings = []
+    for image_input in tqdm(loader, desc=desc):
+        if engine is not None:
+            image_input = engine.normalize(image_input)
         with torch.no_grad():
-            emb = model.encode_image(image_input)
-            emb = emb / emb.norm(dim=-1, keepdim=True)
+            emb = encoder.encode_image(image_input.to(device))
+            emb = _adapt(emb / emb.norm(dim=-1, keepdim=True), "image")
+        embeddings.append(emb.float().cpu().numpy())
+    return np.vstack(embeddings).astype("float32")
 
-        embeddings.append(emb.cpu().numpy())
-        paths.append(img_path)
+def benchmark_inference(image_dir, backends=INFERENCE_BACKENDS, num_images=32, threads=None):
+    """Compare inference backends on the first ``num_images`` catalog images (see ``inference.benchmark_backends``)."""
+    model, preprocess = _get_clip()
+    paths = [img_path for img_path, _ in _list_catalog(image_dir, image_dir)[:num_images]]
+    if not paths:
+        raise FileNotFoundError(f"No images in {image_dir}")
+    engine = _get_preprocessor()
+    if engine is not None:
+        images = engine(paths)
+    else:
+        images = torch.stack([preprocess(load_image(p)) for p in paths]).to(device)
+    return benchmark_backends(model, images, backends, threads=threads, tag=model_tag())
+
+def encode_catalog_images(items, fused_mask=False):
+    """Embed a few catalog items in-process, e.g. for live additions.
+
+    ``items`` are (image, mask or None) pairs; each may be a path or raw bytes.
+    """
+    items = [
+        tuple(io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src for src in item)
+        for item in items
+    ]
+    return _encode_catalog(items, num_workers=0, desc="Encoding catalog additions", fused_mask=fused_mask)
+
+def build_index(image_dir, mask_dir, out_emb="embeddings.npy", out_idx="index_paths.txt",
+                batch_size=64, num_workers=4, incremental=False, shard_size=2048,
+                index_type=None, fused_mask=False, emb_format=None, shard=None, num_shards=1,
+                shard_by="hash", attributes_file=None):
+    """Embed every catalog image in batches and save the vectors and their paths.
 
-    embeddings = np.vstack(embeddings).astype("float32")
-    np.save(out_emb, embeddings)
+    ``num_workers`` processes decode, mask and preprocess images while the
+    encoder consumes batches of ``batch_size`` tensors. With ``incremental``
+    only new or changed images are re-encoded (see ``_build_incremental``).
+    The trained ``index_type`` index (default: FAISS_INDEX_TYPE) is saved next
+    to ``out_emb`` so ``load_index`` can open it without rebuilding.
+    ``fused_mask`` masks at the model's input resolution (``mask_and_preprocess``).
+    ``emb_format`` (default: EMBEDDING_FORMAT) stores the vectors compactly
+    (see ``compact.FORMATS``). With ``shard`` only that shard of ``num_shards``
+    is built (see ``sharding.build_shards``). Per-item attributes, from
+    ``attributes_file`` (default: CATALOG_ATTRIBUTES_FILE) and the file
+    names, are saved next to ``out_idx`` for filtered search.
+    """
+    emb_format = emb_format or EMBEDDING_FORMAT
+    items = _list_catalog(image_dir, mask_dir)
+    if shard is not None:
+        items = select_shard(items, shard, num_shards, shard_by)
+
+    start = time.perf_counter()
+    if incremental:
+        embeddings, encoded = _build_incremental(items, out_emb, batch_size, num_workers, shard_size, fused_mask)
+    else:
+        embeddings = _encode_catalog(items, batch_size=batch_size, num_workers=num_workers,
+                                     fused_mask=fused_mask)
+        encoded = len(items)
+    elapsed = time.perf_counter() - start
+    paths = [img_path for img_path, _ in items]
+
+    save_embeddings(embeddings, out_emb, emb_format)
+    write_model_tag(out_emb, current_model())
     with open(out_idx, "w") as f:
         f.write("\n".join(paths))
-    print(f"✔ Saved {len(paths)} embeddings → {out_emb}")
+    write_path_table(paths, path_table_file_for(out_idx))
+    rate = encoded / elapsed if elapsed > 0 else 0.0
+    print(f"✔ Encoded {encoded} images in {elapsed:.1f}s ({rate:.1f} img/s, "
+          f"batch_size={batch_size}, num_workers={num_workers})")
+    print(f"✔ Saved {len(paths)} {emb_format} embeddings → {out_emb}")
     print(f"✔ Saved paths → {out_idx}")
+    attributes = build_attributes(paths, attributes_file or CATALOG_ATTRIBUTES_FILE or None)
+    attributes.save(attributes_file_for(out_idx))
+    print(f"✔ Saved attributes ({', '.join(sorted(attributes.columns))}) → {attributes_file_for(out_idx)}")
+
+    index_file = index_file_for(out_emb)
+    save_index(_make_catalog_index(out_emb, index_type, embeddings), index_file)
+    print(f"✔ Saved index → {index_file}")
+
+def _build_incremental(items, out_emb, batch_size, num_workers, shard_size, fused_mask=False):
+    """Reuse manifest vectors for unchanged images and checkpoint new ones in shards.
+
+    Images whose content hash, mask hash and model match the manifest are not
+    re-encoded; the model identity includes the inference backend and the
+    preprocessing (fused masking, FAST_PREPROCESS). Images no longer in
+    ``items`` are dropped. Every ``shard_size`` freshly encoded images are
+    saved as a shard and recorded in the manifest, so an interrupted run
+    resumes after the last completed shard.
+    """
+    manifest_file, shard_dir = manifest_paths(out_emb)
+    previous = load_manifest(manifest_file)
+    # Non-eager backends (int8 in particular), fused masking and tensor
+    # preprocessing change the vectors, so they are part of the model identity
+    model_name = model_tag()
+    if INFERENCE_BACKEND != "eager":
+        model_name += f"+{INFERENCE_BACKEND}"
+    if fused_mask:
+        model_name += "+fused_mask"
+    if FAST_PREPROCESS:
+        model_name += "+fast_preprocess"
+
+    fingerprints, pending = [], []
+    for img_path, mask_path in items:
+        fp = fingerprint(img_path, mask_path, model_name, previous.get(img_path))
+        fingerprints.append(fp)
+        if not is_current(previous.get(img_path), fp):
+            pending.append((img_path, mask_path))
+    print(f"Incremental build: {len(items) - len(pending)} unchanged, {len(pending)} to encode, "
+          f"{len(set(previous) - {p for p, _ in items})} removed")
+
+    by_path = {fp["path"]: fp for fp in fingerprints}
+    shard_id = next_shard_id(shard_dir)
+    for i in range(0, len(pending), shard_size):
+        chunk = pending[i:i + shard_size]
+        vecs = _encode_catalog(chunk, batch_size=batch_size, num_workers=num_workers,
+                               desc=f"Encoding shard {shard_id}", fused_mask=fused_mask)
+        name = save_shard(shard_dir, shard_id, vecs)
+        records = [dict(by_path[p], shard=name, row=row) for row, (p, _) in enumerate(chunk)]
+        append_manifest(manifest_file, records)
+        previous.update((rec["path"], rec) for rec in records)
+        shard_id += 1
+
+    # Assemble the catalog in item order and drop everything no longer referenced;
+    # fresh stats let the next run skip re-hashing files that were only touched
+    live = [dict(previous[fp["path"]], **fp) for fp in fingerprints]
+    shards = {name: np.load(os.path.join(shard_dir, name), mmap_mode="r")
+              for name in {rec["shard"] for rec in live}}
+    if live:
+        embeddings = np.vstack([shards[rec["shard"]][rec["row"]] for rec in live]).astype("float32")
+    else:
+        embeddings = _encode_catalog([])
+    write_manifest(manifest_file, live)
+    if os.path.isdir(shard_dir):
+        for name in os.listdir(shard_dir):
+            if name not in shards:
+                os.remove(os.path.join(shard_dir, name))
+    return embeddings, len(pending)
+
+def load_index(emb_file, idx_file, index_type=None, mmap=True, check_model=True):
+    """Load the catalog index and paths.
+
+    Opens the serialized index written by ``build_index`` (memory-mapped when
+    ``mmap``) if it is at least as new as ``emb_file`` and matches an explicit
+    ``index_type``; otherwise builds one from the raw embeddings. ``paths`` is
+    a memory-mapped ``PathTable`` (see ``pathtable``). With ``check_model`` a
+    catalog embedded by another model version than queries use is refused
+    (ValueError).
+    """
+    if check_model:
+        check_model_tag(emb_file)
+    index_file = index_file_for(emb_file)
+    ix = None
+    if os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(emb_file):
+        ix = read_index(index_file, mmap=mmap)
+        allowed = {index_type} | (QUANTIZED_FLAT_TYPES if index_type == "IndexFlatIP" else set())
+        if index_type and index_type_of(ix) not in allowed:
+            print(f"⚠️ {index_file} holds {index_type_of(ix)}, not {index_type}; rebuilding from {emb_file}")
+            ix = None
+    if ix is None:
+        ix = _make_catalog_index(emb_file, index_type)
+    return ix, load_paths(idx_file)
+
+# Flat indexes over compact codes, served in place of IndexFlatIP
+QUANTIZED_FLAT_TYPES = {"IndexScalarQuantizer", "IndexPQ"}
+
+def _make_catalog_index(emb_file, index_type=None, vecs=None):
+    """Index for a saved embeddings file of any format.
+
+    A flat index over compact embeddings searches the stored codes directly;
+    other index types are trained on the (dequantized) float32 vectors.
+    """
+    if (index_type or FAISS_INDEX_TYPE) == "IndexFlatIP":
+        ix = quantized_index(emb_file)
+        if ix is not None:
+            print(f"✔ Serving {ix.ntotal} {embedding_format(emb_file)} codes from {emb_file}")
+            return set_search_params(ix)
+    return make_index(load_embeddings(emb_file) if vecs is None else vecs, index_type)
+
+class Retriever:
+    """Owns a loaded index, its paths and the CLIP model so many queries share one load."""
+    def __init__(self, emb_file, idx_file, index_type=None):
+        self.emb_file, self.idx_file = emb_file, idx_file
+        self.ix, self.paths = load_index(emb_file, idx_file, index_type)
+        self._attributes = None
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = load_attributes(self.idx_file, self.paths)
+        return self._attributes
+
+    @property
+    def model(self):
+        # CLIP is shared process-wide and loaded on first use
+        return _get_clip()[0]
+
+    def search_many(self, queries, top_k, filters=None):
+        """Search a list of (image, text) queries with a single ``ix.search`` call.
+
+        ``filters`` (see ``AttributeTable.mask``) restricts every query to
+        matching catalog items inside the search.
+        """
+        images = [image for image, _ in queries]
+        texts = [text or "" for _, text in queries]
+        query_np = encode_queries(images, texts).numpy().astype("float32")
+        if filters:
+            return filtered_search(self.ix, query_np, top_k, self.attributes.mask(filters))
+        return self.ix.search(query_np, top_k)
+
+    def search(self, query_image, query_text, top_k, filters=None):
+        D, I = self.search_many([(query_image, query_text)], top_k, filters)
+        return D[0], I[0]
+
+# Retrievers reused across calls, keyed by file path and modification time
+_retrievers = {}
+
+def get_retriever(emb_file, idx_file, index_type=None):
+    """Return a cached Retriever, reloading it only when the index files change."""
+    key = (os.path.abspath(emb_file), os.path.abspath(idx_file), index_type)
+    stamp = (os.path.getmtime(emb_file), os.path.getmtime(idx_file))
+    cached = _retrievers.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, Retriever(emb_file, idx_file, index_type))
+        _retrievers[key] = cached
+    return cached[1]
+
+def search(query_image, query_text, top_k, emb_file, idx_file, filters=None):
+    """Search for similar images using FAISS index, optionally restricted by attribute ``filters``."""
+    retriever = get_retriever(emb_file, idx_file)
+    D, I = retriever.search(query_image, query_text, top_k, filters)
 
-def load_index(emb_file, idx_file):
-    """Load a pre-built FAISS index and paths."""
-    vecs = np.load(emb_file)
-    ix = faiss.IndexFlatIP(vecs.shape[1])
-    ix.add(vecs)
-    paths = open(idx_file).read().splitlines()
-    return ix, paths
-
-def search(query_image, query_text, top_k, emb_file, idx_file):
-    """Search for similar images using FAISS index."""
-    # Load index
-    ix, paths = load_index(emb_file, idx_file)
-
-    # Encode query
-    query_emb = encode_query(query_image, query_text)
-    query_np = query_emb.cpu().numpy()
-
-    # Search using FAISS
-    D, I = ix.search(query_np, top_k)
-    
     print(f"Top {top_k} matches:")
-    for score, idx in zip(D[0], I[0]):
-        print(f"{paths[idx]} — sim={score:.4f}")
-    
-    return D[0], I[0], paths
+    for score, idx in zip(D, I):
+        if idx < 0:
+            break
+        print(f"{retriever.paths[idx]} — sim={score:.4f}")
+
+    return D, I, retriever.paths
@@ -0,0 +1,206 @@
+import os
+import re
+import glob
+import heapq
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+import faiss
+
+from .filtering import AttributeTable, catalog_category, filtered_search, load_attributes
+from .pathtable import ConcatPaths, load_paths
+
+# A sharded catalog splits the images over N independent indexes, each with
+# its own embeddings, paths and serialized index in one directory:
+#   <shard_dir>/catalog_00.npy, catalog_00.txt, catalog_00.faiss, ...
+# Every shard is an ordinary build_index output, so one can be rebuilt alone.
+SHARD_BY = ("hash", "category", "batch")
+
+def shard_files(shard_dir, shard, num_shards):
+    """(embeddings, paths) files of one shard."""
+    width = max(2, len(str(num_shards - 1)))
+    base = os.path.join(shard_dir, f"catalog_{shard:0{width}d}")
+    return base + ".npy", base + ".txt"
+
+def _stable_hash(key):
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:8], 16)
+
+def shard_of(index, items, num_shards, shard_by="hash"):
+    """Shard holding ``items[index]``.
+
+    ``hash`` spreads images by file name and ``category`` keeps a category in
+    one shard; both are stable as the catalog grows. ``batch`` splits the
+    sorted catalog into contiguous ranges (ingestion order for sortable names).
+    """
+    img_path = items[index][0]
+    if shard_by == "hash":
+        return _stable_hash(os.path.basename(img_path)) % num_shards
+    if shard_by == "category":
+        return _stable_hash(catalog_category(img_path)) % num_shards
+    if shard_by == "batch":
+        return index * num_shards // len(items)
+    raise ValueError(f"Unknown shard_by {shard_by!r}; expected one of {SHARD_BY}")
+
+def select_shard(items, shard, num_shards, shard_by="hash"):
+    """The (img_path, mask_path) items belonging to ``shard`` of ``num_shards``."""
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard must be in [0, {num_shards}), got {shard}")
+    return [item for i, item in enumerate(items) if shard_of(i, items, num_shards, shard_by) == shard]
+
+def build_shards(image_dir, mask_dir, shard_dir, num_shards, shard_by="hash", shards=None, **kwargs):
+    """Build every shard (or only ``shards``) of a sharded catalog with ``build_index``."""
+    from .retrieval import build_index
+
+    os.makedirs(shard_dir, exist_ok=True)
+    for shard in (range(num_shards) if shards is None else shards):
+        out_emb, out_idx = shard_files(shard_dir, shard, num_shards)
+        print(f"Building shard {shard + 1}/{num_shards} ({shard_by}) → {out_emb}")
+        build_index(image_dir, mask_dir, out_emb, out_idx, shard=shard, num_shards=num_shards,
+                    shard_by=shard_by, **kwargs)
+    if shards is None:
+        # Drop shards left over from a build with more shards
+        keep = {os.path.basename(shard_files(shard_dir, s, num_shards)[0])[:-4] for s in range(num_shards)}
+        for path in glob.glob(os.path.join(shard_dir, "catalog_*")):
+            if os.path.basename(path).split(".")[0] not in keep:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+
+def list_shards(shard_dir):
+    """Sorted (embeddings, paths) file pairs of a sharded catalog."""
+    shards = []
+    for emb_file in sorted(glob.glob(os.path.join(shard_dir, "catalog_*.npy"))):
+        if re.fullmatch(r"catalog_\d+\.npy", os.path.basename(emb_file)):
+            shards.append((emb_file, os.path.splitext(emb_file)[0] + ".txt"))
+    if not shards:
+        raise FileNotFoundError(f"No catalog_*.npy shards in {shard_dir}")
+    return shards
+
+def merge_topk(results, offsets, k):
+    """Merge per-shard ``(D, I)`` results into global top-``k`` ``(D, I)``.
+
+    Each shard's rows are already sorted best-first, so every query row is a
+    k-way heap merge; shard-local ids are shifted by the shard's offset into
+    the concatenated paths, and missing results stay ``-1`` as in FAISS.
+    """
+    nq = len(results[0][0])
+    D = np.full((nq, k), -np.inf, dtype="float32")
+    I = np.full((nq, k), -1, dtype="int64")
+    for q in range(nq):
+        rows = [
+            [(float(d), int(i) + offset) for d, i in zip(Ds[q], Is[q]) if i >= 0]
+            for (Ds, Is), offset in zip(results, offsets)
+        ]
+        for j, (d, i) in enumerate(islice(heapq.merge(*rows, key=lambda r: r[0], reverse=True), k)):
+            D[q, j], I[q, j] = d, i
+    return D, I
+
+def lookup_paths(I, paths):
+    """Object array of the paths for ids ``I``, None where there is no result."""
+    P = np.full(np.shape(I), None, dtype=object)
+    for idx in zip(*np.nonzero(np.asarray(I) >= 0)):
+        P[idx] = paths[I[idx]]
+    return P
+
+# Shard index owned by a worker process in "process" mode
+_worker_index = None
+
+def _open_shard(emb_file, idx_file, index_type=None, check_model=True):
+    from .retrieval import load_index
+    return load_index(emb_file, idx_file, index_type, check_model=check_model)
+
+def _worker_init(emb_file, idx_file, index_type, omp_threads):
+    global _worker_index
+    faiss.omp_set_num_threads(omp_threads)
+    # The parent checked the shard's model version; workers never encode queries
+    _worker_index, _ = _open_shard(emb_file, idx_file, index_type, check_model=False)
+
+def _worker_search(queries, k, mask=None):
+    return _search(_worker_index, queries, k, mask)
+
+def _search(ix, queries, k, mask=None):
+    if mask is None:
+        return ix.search(queries, k)
+    return filtered_search(ix, queries, k, mask)
+
+def _worker_ntotal():
+    return _worker_index.ntotal
+
+class ShardedIndex:
+    """Searches every shard of a sharded catalog in parallel and merges their top-k.
+
+    With ``mode="thread"`` the shards live in this process and are searched on
+    a thread per shard (FAISS releases the GIL). With ``mode="process"`` each
+    shard is loaded and searched in its own worker process, so the catalog no
+    longer has to fit one process's memory. ``search`` returns ids into the
+    concatenated ``paths``, like a single FAISS index.
+    """
+    def __init__(self, shard_dir, mode="thread", index_type=None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown shard search mode {mode!r}; expected 'thread' or 'process'")
+        self.shard_dir = shard_dir
+        self.mode = mode
+        self.files = list_shards(shard_dir)
+        tables = [load_paths(idx_file) for _, idx_file in self.files]
+        self.paths = ConcatPaths(tables)
+        self.offsets, self.sizes = self.paths.starts, [len(table) for table in tables]
+        self.ntotal = len(self.paths)
+        self._attributes = None
+
+        if mode == "thread":
+            self.indexes = [_open_shard(emb, idx, index_type)[0] for emb, idx in self.files]
+            self.workers = None
+        else:
+            from .models import check_model_tag
+            for emb_file, _ in self.files:
+                check_model_tag(emb_file)
+            self.indexes = None
+            ctx = multiprocessing.get_context("spawn")
+            omp_threads = max(1, (os.cpu_count() or 1) // len(self.files))
+            self.workers = [
+                ProcessPoolExecutor(max_workers=1, mp_context=ctx, initializer=_worker_init,
+                                    initargs=(emb, idx, index_type, omp_threads))
+                for emb, idx in self.files
+            ]
+            # Start the workers and load their shards now rather than on the first query
+            for future in [worker.submit(_worker_ntotal) for worker in self.workers]:
+                future.result()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.files), thread_name_prefix="shard")
+        print(f"✔ Loaded {len(self.files)} shards ({self.ntotal} vectors, {mode} fan-out) from {shard_dir}")
+
+    @property
+    def attributes(self):
+        """Attribute table over the concatenated paths (see ``filtering``)."""
+        if self._attributes is None:
+            self._attributes = AttributeTable.concat([load_attributes(idx) for _, idx in self.files])
+        return self._attributes
+
+    def _search_shard(self, shard, queries, k, mask):
+        if mask is not None:
+            mask = mask[self.offsets[shard]:self.offsets[shard] + self.sizes[shard]]
+        if self.workers is not None:
+            return self.workers[shard].submit(_worker_search, queries, k, mask).result()
+        return _search(self.indexes[shard], queries, k, mask)
+
+    def search(self, queries, k, mask=None):
+        """Fan ``queries`` out to every shard and merge the results: ``(D, I)`` of shape ``(nq, k)``.
+
+        ``mask`` restricts the search to items where it is True (see ``filtering.filtered_search``).
+        """
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        futures = [self.executor.submit(self._search_shard, s, queries, k, mask) for s in range(len(self.files))]
+        return merge_topk([f.result() for f in futures], self.offsets, k)
+
+    def search_paths(self, queries, k, filters=None):
+        """Like ``search`` with attribute ``filters``, returning ``(D, paths)``."""
+        D, I = self.search(queries, k, self.attributes.mask(filters) if filters else None)
+        return D, lookup_paths(I, self.paths)
+
+    def close(self):
+        self.executor.shutdown()
+        for worker in self.workers or []:
+            worker.shutdown()
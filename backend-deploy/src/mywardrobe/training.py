@@ -0,0 +1,152 @@
+import torch
+import torch.nn.functional as F
+
+# Contrastive fine-tuning of CLIP with large effective batches.
+#
+# An optimizer step covers several micro-batches. With a gradient cache
+# (Gao et al., "Scaling Deep Contrastive Learning Batch Size under Memory
+# Limited Setup") the InfoNCE loss still sees every pair of the effective
+# batch as negatives, while only one micro-batch's activations are alive at a
+# time: embeddings are first computed without a graph, the loss gradient with
+# respect to them is cached, and each micro-batch is then re-run with autograd
+# and back-propagated from its slice of that gradient.
+TRAIN_MODES = ("all", "proj")
+
+def info_nce(img_f, txt_f, tau):
+    """Symmetric InfoNCE over L2-normalized image / text embeddings, computed in fp32."""
+    logits = img_f.float() @ txt_f.float().T / tau
+    labels = torch.arange(len(logits), device=logits.device)
+    return (F.cross_entropy(logits, labels) + F.cross_entropy(logits.T, labels)) / 2
+
+def _text_to_bf16(module, args):
+    active = torch.is_autocast_cpu_enabled() or torch.is_autocast_enabled()
+    return (args[0].to(torch.bfloat16),) if active else None
+
+def enable_bf16_text(model):
+    """Let CLIP's text encoder run under bf16 autocast.
+
+    Its blocks cast the causal attention mask to the input dtype, so the
+    input is cast to bf16 to match attention computed in bf16.
+    """
+    if getattr(model, "_bf16_text_hook", None) is None:
+        model._bf16_text_hook = model.transformer.register_forward_pre_hook(_text_to_bf16)
+
+def set_trainable(model, train="all"):
+    """Freeze what ``train`` leaves fixed and return the parameters to optimize.
+
+    ``all`` trains the whole model; ``proj`` freezes both encoders and trains
+    only the image and text projections (ViT CLIP models).
+    """
+    if train not in TRAIN_MODES:
+        raise ValueError(f"Unknown train mode {train!r}; expected one of {TRAIN_MODES}")
+    if train == "all":
+        for p in model.parameters():
+            p.requires_grad_(True)
+        return list(model.parameters())
+    if getattr(model.visual, "proj", None) is None:
+        raise ValueError("train='proj' needs a ViT CLIP model with a visual projection")
+    for p in model.parameters():
+        p.requires_grad_(False)
+    params = [model.visual.proj, model.text_projection]
+    for p in params:
+        p.requires_grad_(True)
+    return params
+
+class ContrastiveTrainer:
+    """One optimizer step of CLIP InfoNCE training per list of micro-batches.
+
+    Micro-batches are ``(uint8 images, tokens)`` pairs as produced by
+    ``FashionCLIPDataset``; ``normalize`` turns the images into model input
+    on the training device (``BatchPreprocessor.normalize``). ``precision``
+    ``bf16`` runs the forward passes under bfloat16 autocast (CPU or CUDA).
+    Without ``grad_cache`` the micro-batches are plain gradient accumulation,
+    each with only its own in-batch negatives.
+    """
+    def __init__(self, model, normalize, tau=0.07, precision="bf16", train="all",
+                 grad_cache=True, max_grad_norm=1.0, device="cpu"):
+        self.model = model
+        self.normalize = normalize
+        self.tau = tau
+        self.device = torch.device(device)
+        self.autocast = precision == "bf16" and self.device.type in ("cpu", "cuda")
+        self.train = train
+        self.grad_cache = grad_cache
+        self.max_grad_norm = max_grad_norm
+        self.params = set_trainable(model, train)
+        if self.autocast:
+            enable_bf16_text(model)
+        if train == "proj":
+            self._trunk = {}
+            model.visual.ln_post.register_forward_hook(lambda mod, inp, out: self._trunk.__setitem__("image", out))
+            model.ln_final.register_forward_hook(lambda mod, inp, out: self._trunk.__setitem__("text", out))
+
+    def _amp(self):
+        return torch.autocast(self.device.type, dtype=torch.bfloat16, enabled=self.autocast)
+
+    def _embed(self, imgs, txts):
+        txts = txts.to(self.device, non_blocking=True)
+        img_f = self.model.encode_image(self.normalize(imgs))
+        txt_f = self.model.encode_text(txts)
+        return img_f / img_f.norm(dim=-1, keepdim=True), txt_f / txt_f.norm(dim=-1, keepdim=True)
+
+    def _trunk_features(self, imgs, txts):
+        """Frozen encoder outputs just before the projections."""
+        txts = txts.to(self.device, non_blocking=True)
+        with torch.no_grad(), self._amp():
+            self.model.encode_image(self.normalize(imgs))
+            self.model.encode_text(txts)
+        eot = self._trunk["text"][torch.arange(len(txts)), txts.argmax(dim=-1)]
+        return self._trunk["image"].float(), eot.float()
+
+    def _project(self, img_h, txt_h):
+        img_f = img_h @ self.model.visual.proj.float()
+        txt_f = txt_h @ self.model.text_projection.float()
+        return img_f / img_f.norm(dim=-1, keepdim=True), txt_f / txt_f.norm(dim=-1, keepdim=True)
+
+    def loss(self, micro):
+        """Accumulate gradients for ``micro`` (a list of micro-batches); returns the loss."""
+        if self.train == "proj":
+            # The encoders run once without a graph; only the projections need autograd
+            feats = [self._trunk_features(imgs, txts) for imgs, txts in micro]
+            img_f, txt_f = self._project(torch.cat([f[0] for f in feats]), torch.cat([f[1] for f in feats]))
+            loss = info_nce(img_f, txt_f, self.tau)
+            loss.backward()
+            return loss.item()
+
+        if not self.grad_cache or len(micro) == 1:
+            total = 0.0
+            for imgs, txts in micro:
+                with self._amp():
+                    img_f, txt_f = self._embed(imgs, txts)
+                loss = info_nce(img_f, txt_f, self.tau) / len(micro)
+                loss.backward()
+                total += loss.item()
+            return total
+
+        # 1. Embeddings of the whole effective batch, without activations
+        with torch.no_grad(), self._amp():
+            reps = [self._embed(imgs, txts) for imgs, txts in micro]
+        img_r = torch.cat([r[0] for r in reps]).float().requires_grad_()
+        txt_r = torch.cat([r[1] for r in reps]).float().requires_grad_()
+        # 2. Loss over all pairs, and its gradient with respect to each embedding
+        loss = info_nce(img_r, txt_r, self.tau)
+        loss.backward()
+        # 3. Replay each micro-batch with autograd, seeded with its cached gradient
+        start = 0
+        for imgs, txts in micro:
+            end = start + len(imgs)
+            with self._amp():
+                img_f, txt_f = self._embed(imgs, txts)
+            surrogate = (img_f.float() * img_r.grad[start:end]).sum() + (txt_f.float() * txt_r.grad[start:end]).sum()
+            surrogate.backward()
+            start = end
+        return loss.item()
+
+    def step(self, micro, optimizer):
+        """One optimizer step over ``micro``; returns the loss."""
+        optimizer.zero_grad()
+        loss = self.loss(micro)
+        if self.max_grad_norm:
+            torch.nn.utils.clip_grad_norm_(self.params, max_norm=self.max_grad_norm)
+        optimizer.step()
+        return loss
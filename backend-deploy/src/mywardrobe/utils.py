@@ -1,29 +1,93 @@
+import io
 import os
 from PIL import Image
 import numpy as np
 import torch
 
+def load_image(src):
+    """Decode an RGB image from a path, raw bytes, a file-like object or a PIL.Image."""
+    if isinstance(src, Image.Image):
+        return src if src.mode == "RGB" else src.convert("RGB")
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = io.BytesIO(src)
+    img = Image.open(src)
+    img.load()
+    return img.convert("RGB")
+
 def apply_mask(img_path, mask_path):
     """Apply segmentation mask to image, matching the working code approach."""
     img = Image.open(img_path).convert('RGB')
     img_np = np.array(img)
-    
-    mask = Image.open(mask_path).convert('L')
-    mask = mask.resize(img.size, Image.NEAREST)
-    mask_np = np.array(mask)
+    mask_np = _load_mask(mask_path, img.size)
+
+    # White out non-clothing pixels (mask == 0) in place
+    np.copyto(img_np, 255, where=(mask_np == 0)[..., None])
+    return Image.fromarray(img_np)
+
+# CLIP's input normalization (see clip.clip._transform)
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+def _nearest_index(src_len, dst_len, offset=0.0, span=None):
+    # Source index of each output pixel, sampling pixel centres like PIL's NEAREST
+    span = src_len if span is None else span
+    idx = ((np.arange(dst_len) + 0.5) * (span / dst_len) + offset).astype(np.intp)
+    return np.minimum(idx, src_len - 1)
+
+def resize_mask_nearest(mask, size, box=None):
+    """Nearest-neighbour resize of a 2-D mask array to ``size`` (w, h) via index arrays.
+
+    ``box`` = (left, top, width, height) selects the region of the full-size
+    image the output covers, in units of the mask's own resolution.
+    """
+    w, h = size
+    left, top, bw, bh = box if box is not None else (0, 0, mask.shape[1], mask.shape[0])
+    rows = _nearest_index(mask.shape[0], h, top, bh)
+    cols = _nearest_index(mask.shape[1], w, left, bw)
+    return mask[rows[:, None], cols[None, :]]
+
+def _load_mask(mask, size):
+    """Mask as a 2-D array at ``size``; accepts a path or a (possibly downsampled) array."""
+    if isinstance(mask, np.ndarray):
+        return mask if mask.shape[:2] == (size[1], size[0]) else resize_mask_nearest(mask, size)
+    return np.asarray(Image.open(mask).convert('L').resize(size, Image.NEAREST))
+
+def mask_and_preprocess(img_path, mask, n_px=224, normalize=True):
+    """Fused mask + CLIP resize / center-crop / normalize for one catalog image.
+
+    The image is resized and cropped first, and the mask is sampled directly
+    at the crop's ``n_px`` resolution, so masking touches n_px² pixels instead
+    of the full image. Pixels on garment edges are blended slightly
+    differently than masking at full resolution and then resizing; all
+    other pixels match the unfused path exactly. Returns a normalized float32
+    ``(3, n_px, n_px)`` array, or the uint8 crop when ``normalize`` is False.
+    """
+    img = Image.open(img_path).convert('RGB')
 
-    # Binary mask where clothing pixels > 0
-    binary_mask = (mask_np > 0).astype(np.uint8)
+    # Same geometry as torchvision Resize(n_px) + CenterCrop(n_px)
+    w, h = img.size
+    rw, rh = (n_px, int(n_px * h / w)) if w <= h else (int(n_px * w / h), n_px)
+    left, top = int(round((rw - n_px) / 2.0)), int(round((rh - n_px) / 2.0))
+    crop = np.array(img.resize((rw, rh), Image.BICUBIC).crop((left, top, left + n_px, top + n_px)))
 
-    # White out non-clothing pixels (set to 255 instead of 0)
-    img_np[binary_mask == 0] = 255
+    if mask is not None:
+        mask_np = mask if isinstance(mask, np.ndarray) else np.asarray(Image.open(mask).convert('L'))
+        # Map the crop window back into mask coordinates
+        sx, sy = mask_np.shape[1] / rw, mask_np.shape[0] / rh
+        m = resize_mask_nearest(mask_np, (n_px, n_px), (left * sx, top * sy, n_px * sx, n_px * sy))
+        np.copyto(crop, 255, where=(m == 0)[..., None])
 
-    masked_img = Image.fromarray(img_np)
-    return masked_img
+    if not normalize:
+        return np.ascontiguousarray(crop.transpose(2, 0, 1))
+    out = np.empty((3, n_px, n_px), dtype=np.float32)
+    np.divide(crop.transpose(2, 0, 1), 255.0, out=out, casting="unsafe")
+    out -= CLIP_MEAN[:, None, None]
+    out /= CLIP_STD[:, None, None]
+    return out
 
 def preprocess_image(img, preprocess_fn):
-    if isinstance(img, str):
-        img = Image.open(img).convert("RGB")
+    if not isinstance(img, Image.Image):
+        img = load_image(img)
     return preprocess_fn(img).unsqueeze(0)
 
 def cosine_sim(a, b):
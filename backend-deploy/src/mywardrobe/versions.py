@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from .live import LiveCatalog
+from .sharding import ShardedIndex, list_shards
+
+# Add the parent directory to Python path to import config
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from config import CATALOG_KEEP_VERSIONS
+
+# A versioned catalog directory holds one subdirectory per release, e.g.
+#   data/releases/20261017-120000/embeddings.npy, paths.txt, embeddings.faiss, ...
+# (or catalog_*.npy shards). Releases are built under "<name>.tmp" and renamed
+# into place when complete, so the newest name is always a finished build.
+
+def list_versions(root):
+    """Names of the complete releases under ``root``, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    names = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.startswith(".") or name.endswith(".tmp") or not os.path.isdir(path):
+            continue
+        if os.path.exists(os.path.join(path, "embeddings.npy")) or _has_shards(path):
+            names.append(name)
+    return names
+
+def _has_shards(path):
+    try:
+        return bool(list_shards(path))
+    except FileNotFoundError:
+        return False
+
+def new_version(root):
+    """(build_dir, release_dir) for a new release; build into the first, then ``publish_version``."""
+    name = datetime.now().strftime("%Y%m%d-%H%M%S")
+    release_dir = os.path.join(root, name)
+    build_dir = release_dir + ".tmp"
+    os.makedirs(build_dir, exist_ok=True)
+    return build_dir, release_dir
+
+def publish_version(build_dir, release_dir, keep=None):
+    """Make a finished build visible to watching servers and drop all but the newest ``keep`` releases."""
+    keep = CATALOG_KEEP_VERSIONS if keep is None else keep
+    os.rename(build_dir, release_dir)
+    print(f"✔ Published catalog version {os.path.basename(release_dir)}")
+    root = os.path.dirname(release_dir)
+    if keep:
+        for name in list_versions(root)[:-keep]:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def open_catalog(path, shard_mode="thread"):
+    """Searchable catalog for one release directory."""
+    if _has_shards(path):
+        return ShardedIndex(path, mode=shard_mode)
+    return LiveCatalog(os.path.join(path, "embeddings.npy"), os.path.join(path, "paths.txt"))
+
+class _Loaded:
+    def __init__(self, name, catalog, load_seconds):
+        self.name = name
+        self.catalog = catalog
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.in_flight = 0
+        self.retired = False
+
+    def info(self):
+        return {
+            "version": self.name,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "size": self.catalog.ntotal,
+            "in_flight": self.in_flight,
+        }
+
+class CatalogVersions:
+    """The catalog ``/search`` uses, swapped to newer releases without dropping requests.
+
+    Callers take a ``lease()`` for the duration of a search. A watcher thread
+    polls ``root`` every ``poll_seconds``, loads a newer release in the
+    background and swaps it in atomically; the old catalog is released once
+    the last lease on it ends. Without ``root`` the given ``catalog`` is served
+    as a fixed version.
+    """
+    def __init__(self, root=None, catalog=None, name="static", poll_seconds=10.0, shard_mode="thread"):
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self.shard_mode = shard_mode
+        self._lock = threading.Lock()
+        self._draining = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self.last_check = None
+        self.last_error = None
+        self.last_error_at = None
+        self._failed = set()
+        if root:
+            versions = list_versions(root)
+            if not versions:
+                raise FileNotFoundError(f"No catalog versions in {root}")
+            self.current = self._load(versions[-1])
+        else:
+            self.current = _Loaded(name, catalog, 0.0)
+
+    def _load(self, name):
+        start = time.perf_counter()
+        catalog = open_catalog(os.path.join(self.root, name), self.shard_mode)
+        loaded = _Loaded(name, catalog, time.perf_counter() - start)
+        print(f"✔ Loaded catalog version {name} ({catalog.ntotal} items) in {loaded.load_seconds:.1f}s")
+        return loaded
+
+    @contextmanager
+    def lease(self):
+        """Hold the current catalog; a swap never releases it while leased."""
+        with self._lock:
+            entry = self.current
+            entry.in_flight += 1
+        try:
+            yield entry.catalog
+        finally:
+            with self._lock:
+                entry.in_flight -= 1
+                release = entry.retired and entry.in_flight == 0
+            if release:
+                self._release(entry)
+
+    def _release(self, entry):
+        with self._lock:
+            if entry in self._draining:
+                self._draining.remove(entry)
+        close = getattr(entry.catalog, "close", None)
+        if close is not None:
+            close()
+        print(f"✔ Released catalog version {entry.name}")
+
+    def swap(self, entry):
+        """Serve ``entry`` from now on; the previous version drains and is released."""
+        with self._lock:
+            old, self.current = self.current, entry
+            old.retired = True
+            idle = old.in_flight == 0
+            if not idle:
+                self._draining.append(old)
+        print(f"✔ Serving catalog version {entry.name} (was {old.name})")
+        if idle:
+            self._release(old)
+
+    def check(self):
+        """Load and swap in the newest release if it is not the one being served."""
+        self.last_check = time.time()
+        versions = list_versions(self.root)
+        if not versions or versions[-1] == self.current.name or versions[-1] in self._failed:
+            return False
+        try:
+            entry = self._load(versions[-1])
+        except Exception as e:
+            # Keep serving the current version; a broken release is not retried
+            self._failed.add(versions[-1])
+            self._record_error(f"{versions[-1]}: {e}")
+            print(f"⚠️ Could not load catalog version {versions[-1]}: {e}")
+            return False
+        self.swap(entry)
+        return True
+
+    def start(self):
+        """Watch ``root`` for new releases on a background thread."""
+        if not self.root or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="catalog-watch", daemon=True)
+        self._watcher.start()
+
+    def _record_error(self, message):
+        self.last_error, self.last_error_at = message, time.time()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            # One bad poll (e.g. a half-written release directory) must not end hot-swapping
+            try:
+                self.check()
+            except Exception as e:
+                self._record_error(f"{type(e).__name__}: {e}")
+                print(f"⚠️ Catalog version check failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        with self._lock:
+            return {
+                "root": self.root,
+                "active": self.current.info(),
+                "draining": [entry.info() for entry in self._draining],
+                "last_check": self.last_check,
+                "last_error": self.last_error,
+                "last_error_at": self.last_error_at,
+                "watching": self._watcher is not None and self._watcher.is_alive(),
+            }
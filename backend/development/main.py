@@ -1,7 +1,16 @@
+import os
+import json
 import argparse
 import torch
 from src.mywardrobe import build_index, load_index, search, encode_query
-from src.mywardrobe.finetune import run_finetune
+from src.mywardrobe.indexing import benchmark_index
+from src.mywardrobe.compact import compare_formats, load_embeddings
+from src.mywardrobe.sharding import build_shards
+from src.mywardrobe.live import LiveCatalog
+from src.mywardrobe.versions import new_version, publish_version
+from src.mywardrobe.filtering import read_attribute_rows
+from src.mywardrobe.retrieval import encode_catalog_images, benchmark_inference
+from src.mywardrobe.finetune import run_finetune, EPOCHS, ADAPTER_EPOCHS
 
 def main():
     # Print device information for debugging
@@ -17,6 +26,22 @@ def main():
     p.add_argument("--mask_dir", required=True)
     p.add_argument("--out_emb", default="embeddings.npy")
     p.add_argument("--out_idx", default="index_paths.txt")
+    p.add_argument("--batch_size", type=int, default=64, help="Images per encoder batch")
+    p.add_argument("--num_workers", type=int, default=4, help="Decode/mask/preprocess worker processes")
+    p.add_argument("--incremental", action="store_true", help="Only re-encode new or changed images; resume interrupted builds")
+    p.add_argument("--shard_size", type=int, default=2048, help="Images per checkpoint shard in incremental mode")
+    p.add_argument("--index_type", default=None, help="FAISS index to train and save (default: FAISS_INDEX_TYPE)")
+    p.add_argument("--fused_mask", action="store_true", help="Mask at CLIP input resolution instead of full size (faster)")
+    p.add_argument("--emb_format", default=None, choices=["float32", "float16", "int8", "pq"],
+                   help="Embedding storage format (default: EMBEDDING_FORMAT)")
+    p.add_argument("--num_shards", type=int, default=1, help="Split the catalog into this many shard indexes")
+    p.add_argument("--shard", type=int, default=None, help="Rebuild only this shard (with --num_shards)")
+    p.add_argument("--shard_by", default="hash", choices=["hash", "category", "batch"])
+    p.add_argument("--shard_dir", default="shards", help="Output directory for catalog_*.npy shards")
+    p.add_argument("--attributes", default=None,
+                   help="CSV / JSON-lines file of per-image attributes (default: CATALOG_ATTRIBUTES_FILE)")
+    p.add_argument("--release_dir", default=None,
+                   help="Build a new catalog version under this directory for the API to swap in")
 
     # Query
     q = sub.add_parser("query")
@@ -25,26 +50,136 @@ def main():
     q.add_argument("--top_k", type=int, default=5)
     q.add_argument("--emb_file", default="embeddings.npy")
     q.add_argument("--idx_file", default="index_paths.txt")
+    q.add_argument("--filters", default="", help='JSON attribute filters, e.g. \'{"category": "WOMEN-Dresses", "price": {"max": 50}}\'')
+
+    # Benchmark ANN index types against exact search
+    b = sub.add_parser("bench")
+    b.add_argument("--emb_file", default="embeddings.npy")
+    b.add_argument("--index_types", default="IndexIVFFlat,IndexIVFPQ,IndexHNSWFlat")
+    b.add_argument("--top_k", type=int, default=10)
+    b.add_argument("--num_queries", type=int, default=200)
+    b.add_argument("--nprobe", default="1,4,16,64", help="Comma-separated nprobe values for IVF types")
+    b.add_argument("--ef_search", default="16,64,256", help="Comma-separated efSearch values for HNSW")
+
+    # Compare compact embedding formats against float32
+    c = sub.add_parser("storage")
+    c.add_argument("--emb_file", default="embeddings.npy")
+    c.add_argument("--formats", default="float32,float16,int8,pq")
+    c.add_argument("--top_k", type=int, default=10)
+    c.add_argument("--num_queries", type=int, default=200)
+
+    # Compare CLIP inference backends against the eager model
+    e = sub.add_parser("bench_inference")
+    e.add_argument("--image_dir", required=True)
+    e.add_argument("--backends", default="eager,script,int8,onnx", help="Comma-separated: eager,script,compile,int8,onnx")
+    e.add_argument("--num_images", type=int, default=32, help="Images per throughput batch")
+    e.add_argument("--threads", default=None, help='Intra-op threads, e.g. "4" or "int8:4,onnx:2" (default: INFERENCE_THREADS)')
+
+    # Add / remove catalog items without a full rebuild
+    u = sub.add_parser("update")
+    u.add_argument("--emb_file", default="embeddings.npy")
+    u.add_argument("--idx_file", default="index_paths.txt")
+    u.add_argument("--add", nargs="*", default=[], help="Images to add (or re-embed)")
+    u.add_argument("--mask_dir", default=None, help="Masks for added images (<name>_segm.png)")
+    u.add_argument("--attributes", default=None, help="CSV / JSON-lines attributes for added images")
+    u.add_argument("--remove", nargs="*", default=[], help="Catalog paths to remove")
+    u.add_argument("--compact", action="store_true", help="Fold all logged changes into the index files")
 
     # Fine-tune
     f = sub.add_parser("finetune")
+    f.add_argument("--caption_batch_size", type=int, default=16, help="Images per BLIP captioning batch")
+    f.add_argument("--caption_workers", type=int, default=2, help="Background image loading processes for captioning")
+    f.add_argument("--num_workers", type=int, default=4, help="Training data loading processes")
+    f.add_argument("--no_image_cache", action="store_true", help="Decode every image every epoch instead of caching crops")
+    f.add_argument("--batch_size", type=int, default=32, help="Micro-batch size")
+    f.add_argument("--accum_steps", type=int, default=1, help="Micro-batches per optimizer step (effective batch = batch_size × accum_steps)")
+    f.add_argument("--precision", default="bf16", choices=["bf16", "fp32"])
+    f.add_argument("--train", default="all", choices=["all", "proj"], help="Train the whole model or only the projections")
+    f.add_argument("--no_grad_cache", action="store_true", help="Plain gradient accumulation (negatives only within a micro-batch)")
+    f.add_argument("--adapter", action="store_true", help="Train adapter heads on precomputed frozen CLIP features instead")
+    f.add_argument("--adapter_epochs", type=int, default=ADAPTER_EPOCHS)
+    f.add_argument("--epochs", type=int, default=EPOCHS)
+    f.add_argument("--checkpoint_path", default=None, help="Resume from a training checkpoint (checkpoints/clip_finetuned.pt)")
+    f.add_argument("--version_name", default=None, help="Model version to register the result as")
 
     args = parser.parse_args()
 
     try:
         if args.cmd == "prep":
             print(f"Building index from {args.image_dir} with masks from {args.mask_dir}")
-            build_index(args.image_dir, args.mask_dir, args.out_emb, args.out_idx)
+            options = dict(
+                batch_size=args.batch_size, num_workers=args.num_workers,
+                incremental=args.incremental, shard_size=args.shard_size,
+                index_type=args.index_type, fused_mask=args.fused_mask,
+                emb_format=args.emb_format, attributes_file=args.attributes
+            )
+            if args.release_dir:
+                if args.shard is not None:
+                    raise ValueError("--shard cannot be combined with --release_dir; a release is a full build")
+                build_dir, release_dir = new_version(args.release_dir)
+                args.shard_dir = build_dir
+                args.out_emb = os.path.join(build_dir, "embeddings.npy")
+                args.out_idx = os.path.join(build_dir, "paths.txt")
+            if args.num_shards > 1:
+                build_shards(
+                    args.image_dir, args.mask_dir, args.shard_dir, args.num_shards, args.shard_by,
+                    shards=None if args.shard is None else [args.shard], **options
+                )
+            else:
+                build_index(args.image_dir, args.mask_dir, args.out_emb, args.out_idx, **options)
+            if args.release_dir:
+                publish_version(build_dir, release_dir)
         elif args.cmd == "query":
             print(f"Searching for similar images to {args.query_image}")
             if args.query_text:
                 print(f"With text query: '{args.query_text}'")
             search(
                 args.query_image, args.query_text,
-                args.top_k, args.emb_file, args.idx_file
+                args.top_k, args.emb_file, args.idx_file,
+                filters=json.loads(args.filters) if args.filters else None
             )
+        elif args.cmd == "bench":
+            benchmark_index(
+                load_embeddings(args.emb_file), args.index_types.split(","),
+                top_k=args.top_k, num_queries=args.num_queries,
+                nprobes=[int(v) for v in args.nprobe.split(",")],
+                ef_searches=[int(v) for v in args.ef_search.split(",")]
+            )
+        elif args.cmd == "storage":
+            compare_formats(
+                load_embeddings(args.emb_file), args.formats.split(","),
+                top_k=args.top_k, num_queries=args.num_queries
+            )
+        elif args.cmd == "bench_inference":
+            benchmark_inference(
+                args.image_dir, args.backends.split(","),
+                num_images=args.num_images, threads=args.threads
+            )
+        elif args.cmd == "update":
+            catalog = LiveCatalog(args.emb_file, args.idx_file, compact_after=0)
+            if args.add:
+                masks = [
+                    os.path.join(args.mask_dir, os.path.splitext(os.path.basename(p))[0] + "_segm.png")
+                    if args.mask_dir else None
+                    for p in args.add
+                ]
+                masks = [m if m and os.path.exists(m) else None for m in masks]
+                rows = read_attribute_rows(args.attributes) if args.attributes else {}
+                catalog.add(args.add, encode_catalog_images(list(zip(args.add, masks))),
+                            [rows.get(os.path.basename(p)) for p in args.add])
+            removed = catalog.remove(args.remove)
+            print(f"✔ Added {len(args.add)}, removed {removed}; catalog has {catalog.ntotal} items")
+            if args.compact:
+                catalog.compact()
         elif args.cmd == "finetune":
-            run_finetune()
+            run_finetune(
+                caption_batch_size=args.caption_batch_size, caption_workers=args.caption_workers,
+                num_workers=args.num_workers, cache_images=not args.no_image_cache,
+                batch_size=args.batch_size, accum_steps=args.accum_steps, precision=args.precision,
+                train=args.train, grad_cache=not args.no_grad_cache,
+                adapter=args.adapter, adapter_epochs=args.adapter_epochs, epochs=args.epochs,
+                checkpoint_path=args.checkpoint_path, version_name=args.version_name
+            )
     except Exception as e:
         print(f"Error: {e}")
         print("Make sure CLIP is installed: pip install openai-clip")
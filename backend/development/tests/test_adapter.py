@@ -0,0 +1,39 @@
+import os
+import sys
+import numpy as np
+import torch
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.adapter import ClipAdapter, load_adapter, save_adapter, train_adapter
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float16")
+
+
+def test_adapter_learns_pairing_from_features(tmp_path):
+    # Text features are a fixed rotation of the image features plus noise
+    rng = np.random.default_rng(0)
+    image = rng.standard_normal((2000, 32))
+    rotation, _ = np.linalg.qr(rng.standard_normal((32, 32)))
+    text = image @ rotation + 0.3 * rng.standard_normal((2000, 32))
+    np.save(tmp_path / "image.npy", _unit(image))
+    np.save(tmp_path / "text.npy", _unit(text))
+    image_f = np.load(tmp_path / "image.npy", mmap_mode="r")
+    text_f = np.load(tmp_path / "text.npy", mmap_mode="r")
+
+    # A fresh adapter is the identity on normalized embeddings
+    x = torch.from_numpy(image_f[:4].astype("float32"))
+    assert torch.allclose(ClipAdapter(32, 64).image(x), x / x.norm(dim=-1, keepdim=True), atol=1e-6)
+
+    adapter = train_adapter(image_f, text_f, epochs=30, batch_size=256, hidden=64, lr=3e-3)
+    with torch.no_grad():
+        img = adapter.image(torch.from_numpy(image_f[:200].astype("float32")))
+        txt = adapter.text(torch.from_numpy(text_f[:200].astype("float32")))
+    assert (img @ txt.T).argmax(dim=1).eq(torch.arange(200)).float().mean() > 0.8
+
+    save_adapter(adapter, str(tmp_path / "adapter.pt"))
+    loaded = load_adapter(str(tmp_path / "adapter.pt"))
+    assert torch.allclose(loaded.image(x), adapter.image(x))
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import asyncio
+import numpy as np
+import pytest
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from api.batching import QueryBatcher, Saturated
+
+
+def test_concurrent_queries_share_one_batch():
+    calls = []
+
+    def fake_search(queries, top_k):
+        calls.append(len(queries))
+        D = np.tile(np.arange(top_k, dtype=np.float32), (len(queries), 1))
+        I = np.array([[i] * top_k for i in range(len(queries))])
+        return D, I
+
+    batcher = QueryBatcher(fake_search, max_batch=8, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*[batcher.submit(f"img{i}", "", 3 + i % 2) for i in range(5)])
+
+    results = asyncio.run(run())
+    assert calls == [5]
+    assert [len(D) for D, _ in results] == [3, 4, 3, 4, 3]
+    assert [int(I[0]) for _, I in results] == [0, 1, 2, 3, 4]
+    assert batcher.stats()["max_batch_size"] == 5
+
+
+def test_search_errors_reach_every_caller():
+    def failing_search(queries, top_k):
+        raise RuntimeError("boom")
+
+    batcher = QueryBatcher(failing_search, max_batch=4, max_wait_ms=10)
+
+    async def run():
+        return await asyncio.gather(
+            *[batcher.submit("img", "", 1) for _ in range(2)], return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_saturated_batcher_rejects_new_queries():
+    def slow_search(queries, top_k):
+        time.sleep(0.1)
+        return np.zeros((len(queries), top_k)), np.zeros((len(queries), top_k), dtype=int)
+
+    batcher = QueryBatcher(slow_search, max_batch=4, max_wait_ms=1, workers=1, max_pending=1)
+
+    async def run():
+        return await asyncio.gather(
+            *[batcher.submit("img", "", 1) for _ in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert sum(isinstance(r, Saturated) for r in results) == 2
+    assert batcher.stats()["rejected"] == 2
+
+
+def test_admitted_query_counts_as_pending_before_it_is_queued():
+    batcher = QueryBatcher(lambda queries, top_k: None, max_pending=1)
+    with batcher.admit():
+        # Still preprocessing: nothing queued yet, but the slot is taken
+        assert batcher.stats()["pending"] == 1
+        with pytest.raises(Saturated):
+            with batcher.admit():
+                pass
+    assert batcher.stats()["pending"] == 0 and batcher.stats()["rejected"] == 1
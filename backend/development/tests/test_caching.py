@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.caching import LRUCache, ImageEmbeddingCache
+from src.mywardrobe.retrieval import normalize_text
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1   # "a" is now most recent
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 1, 1)
+
+
+def test_normalize_text_matches_equivalent_phrases():
+    assert normalize_text("  Green\tDress ") == normalize_text("green dress") == "green dress"
+
+
+def test_image_cache_disk_tier_and_near_duplicates(tmp_path):
+    cache = ImageEmbeddingCache(maxsize=4, disk_dir=str(tmp_path), phash_distance=2)
+    emb = np.arange(4, dtype=np.float32)
+    cache.put("k1", emb, phash=0b1010)
+
+    # A fresh cache over the same directory finds the embedding on disk
+    cold = ImageEmbeddingCache(maxsize=4, disk_dir=str(tmp_path))
+    assert np.array_equal(cold.get("k1"), emb)
+    assert cold.stats()["disk_hits"] == 1
+
+    # Hashes within phash_distance bits match; farther ones do not
+    assert np.array_equal(cache.get_similar(0b1011), emb)
+    assert cache.get_similar(0b0101) is None
+
+
+def test_image_cache_stores_copies_and_membership_does_not_count(tmp_path):
+    cache = ImageEmbeddingCache(maxsize=4, disk_dir=str(tmp_path))
+    batch = np.ones((3, 4), dtype=np.float32)
+    cache.put("k1", batch[1])
+    batch[1] = 0
+    assert np.array_equal(cache.get("k1"), np.ones(4, dtype=np.float32))
+    assert cache.get("k1").base is None
+
+    assert "k1" in cache and "k2" not in cache
+    assert "k1" in ImageEmbeddingCache(maxsize=4, disk_dir=str(tmp_path))
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 0)
+
+
+def test_query_upload_is_decoded_only_on_a_cache_miss(monkeypatch):
+    from src.mywardrobe import retrieval
+    decoded = []
+    monkeypatch.setattr(retrieval, "_image_cache", ImageEmbeddingCache(maxsize=4))
+    monkeypatch.setattr(retrieval, "_get_preprocessor", lambda: None)
+    monkeypatch.setattr(retrieval, "load_image", lambda data: decoded.append(data) or "image")
+
+    miss = retrieval.prepare_query_image(b"upload")
+    assert (miss.image, decoded) == ("image", [b"upload"])
+
+    retrieval._image_cache.put(miss.key, np.zeros(4, dtype=np.float32))
+    hit = retrieval.prepare_query_image(b"upload")
+    assert hit.image is None and hit.key == miss.key
+    assert retrieval.image_content_key(hit) == retrieval.image_content_key(b"upload")
+    assert len(decoded) == 1
+
+
+def test_query_upload_uses_the_draft_decoder_when_enabled(monkeypatch):
+    from src.mywardrobe import retrieval
+    from src.mywardrobe.preprocess import BatchPreprocessor
+    buf = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (200, 30, 30)).save(buf, "JPEG")
+    monkeypatch.setattr(retrieval, "_image_cache", ImageEmbeddingCache(maxsize=4))
+    monkeypatch.setattr(retrieval, "_get_preprocessor", lambda: BatchPreprocessor(32))
+
+    query = retrieval.prepare_query_image(buf.getvalue())
+    # Reduced-size JPEG decoding, still at least DRAFT_MARGIN x the model resolution
+    assert 128 <= min(query.image.size) < 1200
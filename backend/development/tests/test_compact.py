@@ -0,0 +1,53 @@
+import os
+import sys
+import faiss
+import numpy as np
+import pytest
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.compact import FORMATS, save_embeddings, load_embeddings, embedding_format, quantized_index
+
+# Minimum recall@10 of each format's quantized_index against float32 exact search
+RECALL_FLOOR = {"float16": 0.99, "int8": 0.95, "pq": 0.35}
+# Largest element-wise error of the decoded vectors
+MAX_ERROR = {"float32": 0.0, "float16": 1e-3, "int8": 1e-2, "pq": 0.2}
+
+
+@pytest.fixture(scope="module")
+def vecs():
+    # Clustered unit vectors, closer to catalog embeddings than pure noise
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((40, 512))
+    vecs = (centers[rng.integers(0, 40, 2000)] + 0.5 * rng.standard_normal((2000, 512))).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_save_load_round_trip(tmp_path, vecs, fmt):
+    emb_file = str(tmp_path / "embeddings.npy")
+    save_embeddings(vecs, emb_file, fmt)
+    assert embedding_format(emb_file) == fmt
+    loaded = load_embeddings(emb_file)
+    assert loaded.shape == vecs.shape and loaded.dtype == np.float32
+    assert np.abs(loaded - vecs).max() <= MAX_ERROR[fmt]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_quantized_index_recall_against_float32(tmp_path, vecs, fmt):
+    emb_file = str(tmp_path / "embeddings.npy")
+    save_embeddings(vecs, emb_file, fmt)
+    ix = quantized_index(emb_file)
+    if fmt == "float32":
+        assert ix is None
+        return
+    assert ix.ntotal == len(vecs)
+
+    exact = faiss.IndexFlatIP(vecs.shape[1])
+    exact.add(vecs)
+    queries = vecs[:100]
+    _, truth = exact.search(queries, 10)
+    _, found = ix.search(queries, 10)
+    recall = np.mean([len(set(f) & set(t)) / 10 for f, t in zip(found, truth)])
+    assert recall >= RECALL_FLOOR[fmt]
@@ -0,0 +1,47 @@
+import os
+import sys
+import numpy as np
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.filtering import AttributeTable, filtered_search
+from src.mywardrobe.indexing import make_index
+
+
+def test_attribute_table_masks_and_round_trips(tmp_path):
+    rows = [
+        {"category": "WOMEN-Dresses", "price": 30.0, "in_stock": True},
+        {"category": "MEN-Denim", "price": 80.0, "in_stock": False},
+        {"category": "WOMEN-Dresses", "price": 120.0},
+    ]
+    path = str(tmp_path / "paths.attrs.npz")
+    AttributeTable.from_rows(rows).save(path)
+    table = AttributeTable.load(path)
+    assert table.mask({"category": "WOMEN-Dresses"}).tolist() == [True, False, True]
+    assert table.mask({"price": {"min": 50}, "in_stock": False}).tolist() == [False, True, False]
+    assert table.mask({"category": ["MEN-Denim", "unknown"]}).tolist() == [False, True, False]
+
+
+def test_filtered_search_returns_best_matching_items():
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((500, 512)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    ix = make_index(vecs, "IndexHNSWFlat", verbose=False)
+    mask = np.arange(len(vecs)) % 50 == 0
+    D, I = filtered_search(ix, vecs[:5], 20, mask)
+    ids = np.flatnonzero(mask)
+    assert I[:, :len(ids)].tolist() == ids[np.argsort(-(vecs[:5] @ vecs[ids].T), axis=1)].tolist()
+    assert (I[:, len(ids):] == -1).all()
+
+
+def test_appended_rows_match_a_rebuilt_table():
+    base = [{"category": "A", "price": 10.0}, {"category": "B"}, {}]
+    added = [{"category": "C", "price": 5.0, "color": "red"}, {"price": 7.0}, {"category": "A"}]
+    table = AttributeTable.from_rows(base).append(added)
+    rebuilt = AttributeTable.from_rows(base + added)
+    assert table.size == 6 and table.rows() == rebuilt.rows()
+    for filters in ({"category": "A"}, {"category": ["B", "C"]}, {"price": {"max": 8}}, {"color": "red"}):
+        assert table.mask(filters).tolist() == rebuilt.mask(filters).tolist()
+    # A numeric column that receives text falls back to a rebuild
+    assert AttributeTable.from_rows([{"size": 1}]).append([{"size": "XL"}]).mask({"size": "XL"}).tolist() == [False, True]
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import pytest
+import torch
+from PIL import Image
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from torch.utils.data import DataLoader
+from src.mywardrobe.finetune import (
+    FashionCLIPDataset, TrainImageCache, generate_captions, read_captions, tokenize_captions,
+    save_checkpoint, load_checkpoint, CLIP_MODEL,
+)
+
+
+class _Processor:
+    def __call__(self, images, return_tensors):
+        return {"pixel_values": torch.stack([torch.full((3, 4, 4), float(img.getpixel((0, 0))[0])) for img in images])}
+
+    def batch_decode(self, ids, skip_special_tokens):
+        return [f"red {int(row[0])}" for row in ids]
+
+
+class _Blip:
+    def __init__(self):
+        self.batches = []
+
+    def generate(self, pixel_values, max_new_tokens):
+        self.batches.append(len(pixel_values))
+        return pixel_values[:, 0, 0, :1].long()
+
+
+def test_captions_are_batched_and_resume_after_a_torn_line(tmp_path):
+    paths = []
+    for i in range(5):
+        path = str(tmp_path / f"img{i}.jpg")
+        Image.new("RGB", (8, 8), (i * 10, 0, 0)).save(path)
+        paths.append(path)
+    paths.insert(2, str(tmp_path / "missing.jpg"))
+    cap_file = str(tmp_path / "captions.jsonl")
+    with open(cap_file, "w") as f:
+        f.write(json.dumps({"path": paths[0], "caption": "done"}) + "\n" + '{"path": "torn')
+
+    blip = _Blip()
+    assert generate_captions(paths, cap_file, _Processor(), blip, batch_size=2, num_workers=0) == 4
+    assert blip.batches == [1, 2, 1]
+    records = read_captions(cap_file)
+    assert [r["path"] for r in records] == [paths[0], paths[1], paths[3], paths[4], paths[5]]
+    assert records[0]["caption"] == "done" and records[2]["caption"] == "red 20"
+    assert generate_captions(paths, cap_file, _Processor(), blip, batch_size=2, num_workers=0) == 0
+
+
+def test_training_images_are_cached_after_the_first_epoch(tmp_path):
+    cap_file = tmp_path / "captions.jsonl"
+    with open(cap_file, "w") as f:
+        for i in range(4):
+            path = str(tmp_path / f"img{i}.jpg")
+            Image.new("RGB", (40, 30), (i * 50, 100, 0)).save(path)
+            f.write(json.dumps({"path": path, "caption": f"a red dress {i}"}) + "\n")
+    paths, tokens = tokenize_captions(cap_file, tmp_path / "tokens.pt")
+    assert tokens.shape == (4, 77) and tokenize_captions(cap_file, tmp_path / "tokens.pt")[0] == paths
+
+    cache = TrainImageCache(tmp_path / "cache.npy", paths, 16)
+    loader = DataLoader(FashionCLIPDataset(paths, tokens, 16, cache), batch_size=2, num_workers=2)
+    first = torch.cat([imgs for imgs, _ in loader])
+    assert first.dtype == torch.uint8 and first.shape == (4, 3, 16, 16)
+    assert cache.filled() == 4
+
+    # Later epochs (and runs) read the crops back without the image files
+    for path in paths:
+        os.remove(path)
+    cache = TrainImageCache(tmp_path / "cache.npy", paths, 16)
+    imgs, txts = next(iter(DataLoader(FashionCLIPDataset(paths, tokens, 16, cache), batch_size=4)))
+    assert torch.equal(imgs, first) and txts.dtype == torch.long
+
+
+def test_resume_accepts_training_checkpoints_only(tmp_path):
+    model = torch.nn.Linear(2, 2)
+    optimizer = torch.optim.AdamW(model.parameters())
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=4)
+    ckpt_path = tmp_path / "train.pt"
+    save_checkpoint(ckpt_path, model, optimizer, scheduler, 3, "proj")
+    assert load_checkpoint(ckpt_path, "proj")["epoch"] == 3
+    with pytest.raises(ValueError, match=f"trains proj of {CLIP_MODEL}"):
+        load_checkpoint(ckpt_path, "all")
+
+    # Registered version weights are a bare state_dict
+    weights_path = tmp_path / "weights.pt"
+    torch.save(model.state_dict(), weights_path)
+    with pytest.raises(ValueError, match="not a training checkpoint"):
+        load_checkpoint(weights_path, "proj")
@@ -0,0 +1,97 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe import retrieval
+from src.mywardrobe.manifest import load_manifest, manifest_paths
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """Five fake images and an encoder that records what it encodes."""
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for i in range(5):
+        (image_dir / f"img_{i}.jpg").write_bytes(bytes([i]) * 8)
+    encoded, fail_after = [], []
+
+    def fake_encode(items, **kwargs):
+        if fail_after and len(encoded) >= fail_after[0]:
+            raise KeyboardInterrupt
+        encoded.extend(p for p, _ in items)
+        # The vector is the first byte of the file, so reused rows can be checked
+        return np.array([[open(p, "rb").read(1)[0]] * 4 for p, _ in items], dtype="float32")
+
+    monkeypatch.setattr(retrieval, "_encode_catalog", fake_encode)
+
+    def build(shard_size=2):
+        items = retrieval._list_catalog(str(image_dir), str(image_dir))
+        return retrieval._build_incremental(items, str(tmp_path / "embeddings.npy"), 4, 0, shard_size)
+
+    return image_dir, build, encoded, fail_after
+
+
+def test_unchanged_rerun_encodes_nothing(catalog):
+    image_dir, build, encoded, _ = catalog
+    first, count = build()
+    assert count == 5
+    encoded.clear()
+    second, count = build()
+    assert (count, encoded) == (0, [])
+    assert np.array_equal(first, second)
+
+
+def test_modified_file_is_reencoded_and_deleted_file_dropped(catalog, tmp_path):
+    image_dir, build, encoded, _ = catalog
+    build()
+    encoded.clear()
+    (image_dir / "img_1.jpg").write_bytes(b"\x09" * 8)
+    os.remove(image_dir / "img_3.jpg")
+
+    vecs, count = build()
+    assert count == 1 and encoded == [str(image_dir / "img_1.jpg")]
+    assert vecs[:, 0].tolist() == [0, 9, 2, 4]
+    manifest_file, _ = manifest_paths(str(tmp_path / "embeddings.npy"))
+    assert str(image_dir / "img_3.jpg") not in load_manifest(manifest_file)
+
+
+def test_touched_file_refreshes_its_stat_without_reencoding(catalog, tmp_path):
+    image_dir, build, encoded, _ = catalog
+    build()
+    encoded.clear()
+    touched = image_dir / "img_2.jpg"
+    os.utime(touched, ns=(0, 10 ** 9))
+
+    build()
+    manifest_file, _ = manifest_paths(str(tmp_path / "embeddings.npy"))
+    record = load_manifest(manifest_file)[str(touched)]
+    assert encoded == [] and record["stat"] == [8, 10 ** 9]
+
+
+def test_interrupted_build_resumes_after_last_shard(catalog):
+    image_dir, build, encoded, fail_after = catalog
+    fail_after.append(2)
+    with pytest.raises(KeyboardInterrupt):
+        build(shard_size=2)
+    assert len(encoded) == 2
+
+    fail_after.clear()
+    vecs, count = build(shard_size=2)
+    assert count == 3 and len(set(encoded)) == 5
+    assert vecs[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("setting, value", [("FAST_PREPROCESS", None), ("INFERENCE_BACKEND", "int8")])
+def test_changing_the_encoding_pipeline_invalidates_the_manifest(catalog, monkeypatch, setting, value):
+    image_dir, build, encoded, _ = catalog
+    build()
+    encoded.clear()
+    if value is None:
+        value = not getattr(retrieval, setting)
+    monkeypatch.setattr(retrieval, setting, value)
+    _, count = build()
+    assert count == 5 and len(encoded) == 5
@@ -0,0 +1,101 @@
+import os
+import sys
+import faiss
+import numpy as np
+import pytest
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.indexing import (
+    INDEX_TYPES, make_index, save_index, index_file_for, index_type_of, set_search_params, benchmark_index,
+)
+from src.mywardrobe import retrieval
+from src.mywardrobe.retrieval import load_index, get_retriever
+
+
+def _unit_vectors(n, d=512, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_each_index_type_builds_and_finds_its_own_vectors(index_type):
+    vecs = _unit_vectors(1200)
+    ix = make_index(vecs, index_type, nlist=8, verbose=False)
+    assert index_type_of(ix) == index_type and ix.ntotal == len(vecs)
+    _, I = ix.search(vecs[:20], 5)
+    # Each vector is its own nearest neighbour; PQ codes may rank a close one first
+    found = np.mean([i in row for i, row in enumerate(I)])
+    assert found >= (0.9 if index_type == "IndexIVFPQ" else 1.0)
+
+
+def test_too_few_vectors_fall_back_to_flat():
+    ix = make_index(_unit_vectors(50), "IndexIVFFlat", nlist=8, verbose=False)
+    assert index_type_of(ix) == "IndexFlatIP"
+
+
+def test_search_params_are_applied():
+    vecs = _unit_vectors(1200)
+    ivf = make_index(vecs, "IndexIVFFlat", nlist=8, verbose=False)
+    set_search_params(ivf, nprobe=3)
+    assert faiss.extract_index_ivf(ivf).nprobe == 3
+    # nprobe is capped at the number of lists
+    set_search_params(ivf, nprobe=64)
+    assert faiss.extract_index_ivf(ivf).nprobe == 8
+
+    hnsw = make_index(vecs, "IndexHNSWFlat", verbose=False)
+    set_search_params(hnsw, ef_search=77)
+    assert faiss.downcast_index(hnsw).hnsw.efSearch == 77
+
+
+def test_benchmark_index_reports_recall():
+    rows = benchmark_index(_unit_vectors(1200), ("IndexIVFFlat", "IndexHNSWFlat"), top_k=5,
+                           num_queries=50, nprobes=(1, 64), ef_searches=(16, 256))
+    by_param = {(r["index_type"], r["param"]): r["recall"] for r in rows}
+    assert by_param[("IndexFlatIP", "-")] == 1.0
+    assert all(0.0 <= recall <= 1.0 for recall in by_param.values())
+    # Probing every list is exact; more probes never lose recall
+    assert by_param[("IndexIVFFlat", "nprobe=64")] == 1.0
+    assert by_param[("IndexIVFFlat", "nprobe=64")] >= by_param[("IndexIVFFlat", "nprobe=1")]
+    assert by_param[("IndexHNSWFlat", "efSearch=256")] >= by_param[("IndexHNSWFlat", "efSearch=16")]
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+@pytest.mark.parametrize("mmap", [True, False])
+def test_persisted_index_reloads_with_identical_results(tmp_path, index_type, mmap):
+    vecs = _unit_vectors(1200)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "index_paths.txt")
+    np.save(emb_file, vecs)
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"img_{i}.jpg" for i in range(len(vecs))))
+    built = make_index(vecs, index_type, nlist=8, verbose=False)
+    save_index(built, index_file_for(emb_file))
+
+    loaded, paths = load_index(emb_file, idx_file, index_type, mmap=mmap, check_model=False)
+    queries = vecs[:20]
+    D0, I0 = built.search(queries, 10)
+    D1, I1 = loaded.search(queries, 10)
+    assert loaded.ntotal == len(paths) == len(vecs)
+    assert np.array_equal(I0, I1) and np.array_equal(D0, D1)
+
+
+def test_cached_retriever_reloads_only_when_files_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "_retrievers", {})
+    vecs = _unit_vectors(100)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "index_paths.txt")
+    np.save(emb_file, vecs)
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"img_{i}.jpg" for i in range(len(vecs))))
+
+    first = get_retriever(emb_file, idx_file, "IndexFlatIP")
+    assert get_retriever(emb_file, idx_file, "IndexFlatIP") is first
+
+    np.save(emb_file, vecs[:50])
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"img_{i}.jpg" for i in range(50)))
+    stat = os.stat(emb_file)
+    os.utime(emb_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    reloaded = get_retriever(emb_file, idx_file, "IndexFlatIP")
+    assert reloaded is not first and reloaded.ix.ntotal == len(reloaded.paths) == 50
+    assert get_retriever(emb_file, idx_file, "IndexFlatIP") is reloaded
@@ -0,0 +1,49 @@
+import os
+import sys
+import clip
+import pytest
+import torch
+from clip.model import CLIP
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.inference import ClipEncoder, check_parity, threads_for, benchmark_backends
+
+
+def _tiny_clip():
+    torch.manual_seed(0)
+    return CLIP(16, 32, 1, 64, 16, 77, 49408, 64, 2, 1).float().eval()
+
+
+def test_threads_spec():
+    assert threads_for("int8", "4") == 4
+    assert threads_for("int8", "int8:2,onnx:3") == 2
+    assert threads_for("script", "int8:2,*:1") == 1
+    assert threads_for("eager", "") == 0
+
+
+@pytest.mark.parametrize("backend", ["script", "int8", "onnx"])
+def test_backend_matches_eager(backend, tmp_path):
+    if backend == "onnx":
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+    model = _tiny_clip()
+    encoder = ClipEncoder(model, backend, threads=1, tag="tiny", onnx_dir=str(tmp_path))
+    images = torch.randn(5, 3, 32, 32)
+    texts = clip.tokenize(["red dress", "black boots", "a blue denim jacket"])
+    # Traced / exported graphs must handle batch sizes other than the example's
+    assert encoder.encode_image(images).shape == (5, 16)
+    parity = check_parity(model, encoder, images, texts)
+    assert parity["ok"], parity
+
+
+def test_benchmark_restores_the_global_thread_count():
+    model = _tiny_clip()
+    threads = torch.get_num_threads()
+    ClipEncoder(model, "int8", threads=threads + 1)
+    assert torch.get_num_threads() == threads
+    rows = benchmark_backends(model, torch.randn(2, 3, 32, 32), ("eager", "int8"),
+                              threads=str(threads + 1), repeats=1)
+    assert [r["threads"] for r in rows] == [threads + 1] * 2
+    assert torch.get_num_threads() == threads
@@ -0,0 +1,154 @@
+import os
+import sys
+import numpy as np
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.indexing import make_index, save_index, index_file_for
+from src.mywardrobe.live import LiveCatalog
+
+
+def _unit(rng, n):
+    vecs = rng.standard_normal((n, 512)).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_live_catalog_updates_survive_restart_and_compaction(tmp_path):
+    rng = np.random.default_rng(0)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "paths.txt")
+    base = _unit(rng, 50)
+    np.save(emb_file, base)
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"item_{i}.jpg" for i in range(50)))
+    save_index(make_index(base, "IndexFlatIP", verbose=False), index_file_for(emb_file))
+
+    catalog = LiveCatalog(emb_file, idx_file, compact_after=0)
+    new = _unit(rng, 2)
+    catalog.add(["new_0.jpg", "new_1.jpg"], new, [{"price": 10}, {"price": 90}])
+    assert catalog.remove(["item_3.jpg", "missing.jpg"]) == 1
+    _, P = catalog.search_paths(np.vstack([new[0], base[3]]), 1)
+    assert P[0, 0] == "new_0.jpg" and P[1, 0] != "item_3.jpg"
+    _, P = catalog.search_paths(new[1:], 3, {"price": {"max": 50}})
+    assert P[0].tolist() == ["new_0.jpg", None, None]
+
+    # The write-ahead log is replayed on reopen
+    reopened = LiveCatalog(emb_file, idx_file, compact_after=0)
+    assert reopened.ntotal == 51
+    assert reopened.search_paths(new[1:], 1)[1][0, 0] == "new_1.jpg"
+
+    catalog.compact()
+    compacted = LiveCatalog(emb_file, idx_file, compact_after=0)
+    assert compacted.stats()["base"] == 51 and compacted.stats()["wal_records"] == 0
+    assert "item_3.jpg" not in compacted.paths
+    assert compacted.search_paths(new[:1], 1)[1][0, 0] == "new_0.jpg"
+
+
+def test_interrupted_compaction_keeps_previous_generation(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "paths.txt")
+    base = _unit(rng, 20)
+    np.save(emb_file, base)
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"item_{i}.jpg" for i in range(20)))
+    save_index(make_index(base, "IndexFlatIP", verbose=False), index_file_for(emb_file))
+
+    catalog = LiveCatalog(emb_file, idx_file, compact_after=0)
+    new = _unit(rng, 1)
+    catalog.add(["new_0.jpg"], new)
+    catalog.remove(["item_0.jpg"])
+
+    # Dying just before the commit point leaves the built files and the full log
+    def crash(generation):
+        raise KeyboardInterrupt("killed")
+    monkeypatch.setattr(catalog, "_commit_generation", crash)
+    try:
+        catalog.compact()
+    except KeyboardInterrupt:
+        pass
+    reopened = LiveCatalog(emb_file, idx_file, compact_after=0)
+    assert reopened.generation == 0 and reopened.stats()["wal_records"] == 2
+    assert reopened.ntotal == 20 and reopened.search_paths(new, 1)[1][0, 0] == "new_0.jpg"
+    assert os.listdir(tmp_path / "embeddings.live") == []
+    assert len(np.load(emb_file)) == 20
+
+    # A committed compaction is served from its generation; the built files are untouched
+    reopened.compact()
+    compacted = LiveCatalog(emb_file, idx_file, compact_after=0)
+    assert compacted.generation == 1 and compacted.stats()["wal_records"] == 0
+    assert compacted.ntotal == 20 and "item_0.jpg" not in compacted.paths
+    np.testing.assert_array_equal(np.load(emb_file), base)
+
+
+def test_rebuild_drops_an_uncompacted_log(tmp_path):
+    rng = np.random.default_rng(2)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "paths.txt")
+
+    def build(n):
+        base = _unit(rng, n)
+        np.save(emb_file, base)
+        with open(idx_file, "w") as f:
+            f.write("\n".join(f"item_{i}.jpg" for i in range(n)))
+        save_index(make_index(base, "IndexFlatIP", verbose=False), index_file_for(emb_file))
+
+    build(10)
+    catalog = LiveCatalog(emb_file, idx_file, compact_after=0)
+    catalog.add(["extra.jpg"], _unit(rng, 1))
+    catalog.remove(["item_2.jpg"])
+    assert LiveCatalog(emb_file, idx_file, compact_after=0).ntotal == 10
+
+    # A rebuild by prep supersedes the pending log, never compacted into a generation
+    build(12)
+    rebuilt = LiveCatalog(emb_file, idx_file, compact_after=0)
+    assert rebuilt.ntotal == 12 and rebuilt.stats()["wal_records"] == 0
+    assert "extra.jpg" not in rebuilt.paths and "item_2.jpg" in rebuilt.paths
+    assert not os.path.exists(rebuilt.wal_file)
+
+    # Changes logged against the new build are still replayed
+    rebuilt.add(["extra.jpg"], _unit(rng, 1))
+    assert LiveCatalog(emb_file, idx_file, compact_after=0).ntotal == 13
+
+
+def test_failed_background_compaction_is_reported(tmp_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "paths.txt")
+    base = _unit(rng, 10)
+    np.save(emb_file, base)
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"item_{i}.jpg" for i in range(10)))
+
+    catalog = LiveCatalog(emb_file, idx_file, compact_after=0)
+    catalog.add(["new_0.jpg"], _unit(rng, 1))
+
+    def fail(generation):
+        raise OSError("disk full")
+    monkeypatch.setattr(catalog, "_commit_generation", fail)
+    assert catalog.start_compaction()
+    catalog.close()
+    stats = catalog.stats()
+    assert stats["last_compaction_error"] == "OSError: disk full"
+    assert stats["generation"] == 0 and stats["wal_records"] == 1
+
+    monkeypatch.undo()
+    catalog.start_compaction()
+    catalog.close()
+    stats = catalog.stats()
+    assert stats["last_compaction_error"] is None and stats["generation"] == 1
+
+
+def test_live_attributes_are_cached_and_extended(tmp_path):
+    rng = np.random.default_rng(4)
+    emb_file, idx_file = str(tmp_path / "embeddings.npy"), str(tmp_path / "paths.txt")
+    np.save(emb_file, _unit(rng, 5))
+    with open(idx_file, "w") as f:
+        f.write("\n".join(f"item_{i}.jpg" for i in range(5)))
+
+    catalog = LiveCatalog(emb_file, idx_file, compact_after=0)
+    catalog.add(["new_0.jpg"], _unit(rng, 1), [{"price": 10}])
+    table = catalog.attributes
+    assert catalog.attributes is table
+    catalog.remove(["item_1.jpg"])
+    assert catalog.attributes is table   # removals are masked by liveness, not by the table
+    catalog.add(["new_1.jpg"], _unit(rng, 1), [{"price": 90}])
+    assert catalog.attributes.size == 7
+    assert catalog.attributes.mask({"price": {"min": 50}}).tolist() == [False] * 6 + [True]
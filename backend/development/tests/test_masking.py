@@ -0,0 +1,61 @@
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.utils import apply_mask, mask_and_preprocess, resize_mask_nearest
+
+
+def _blob_mask(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:height, :width]
+    cx, cy = rng.uniform(0.3, 0.7, 2) * (width, height)
+    return (((x - cx) / (0.3 * width)) ** 2 + ((y - cy) / (0.35 * height)) ** 2 < 1).astype(np.uint8) * 255
+
+
+def _files(tmp_path, width, height, mask_size, seed=0):
+    rng = np.random.default_rng(seed)
+    img_path, mask_path = str(tmp_path / f"img{seed}.png"), str(tmp_path / f"img{seed}_segm.png")
+    Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)).save(img_path)
+    Image.fromarray(_blob_mask(*mask_size, seed=seed)).save(mask_path)
+    return img_path, mask_path
+
+
+def test_nearest_resize_matches_pil():
+    mask = _blob_mask(53, 37)
+    for size in [(120, 90), (53, 37), (20, 31), (224, 224)]:
+        expected = np.asarray(Image.fromarray(mask).resize(size, Image.NEAREST))
+        np.testing.assert_array_equal(resize_mask_nearest(mask, size), expected)
+
+
+def test_apply_mask_matches_pil_reference(tmp_path):
+    # Mask stored at a lower resolution than the image, as segmentation outputs often are
+    img_path, mask_path = _files(tmp_path, 160, 240, (80, 120))
+    img = np.array(Image.open(img_path).convert("RGB"))
+    mask = np.asarray(Image.open(mask_path).convert("L").resize((160, 240), Image.NEAREST))
+    expected = np.where((mask == 0)[..., None], 255, img)
+    np.testing.assert_array_equal(np.array(apply_mask(img_path, mask_path)), expected)
+
+
+def test_fused_mask_matches_mask_then_resize_off_edges(tmp_path):
+    img_path, mask_path = _files(tmp_path, 300, 400, (300, 400), seed=1)
+    masked = apply_mask(img_path, mask_path)
+    rw, rh = 224, int(224 * 400 / 300)
+    top = int(round((rh - 224) / 2.0))
+    expected = np.array(masked.resize((rw, rh), Image.BICUBIC).crop((0, top, 224, top + 224)))
+    fused = mask_and_preprocess(img_path, mask_path, 224, normalize=False).transpose(1, 2, 0)
+
+    # Away from the garment edge both paths agree exactly
+    mask = resize_mask_nearest(_blob_mask(300, 400, seed=1), (224, 224), (0, top * 400 / rh, 300, 224 * 400 / rh))
+    inside = mask > 0
+    outside = mask == 0
+    for region in (inside, outside):
+        eroded = region.copy()
+        for axis in (0, 1):
+            for shift in (-3, 3):
+                eroded &= np.roll(region, shift, axis=axis)
+        assert eroded.sum() > 1000
+        np.testing.assert_array_equal(fused[eroded], expected[eroded])
@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.models import (
+    ModelVersion, check_model_tag, register_model, resolve_model, write_model_tag,
+)
+
+
+def test_registered_versions_resolve_and_tag_embeddings(tmp_path):
+    registry = str(tmp_path / "models.json")
+    ckpt = tmp_path / "ft.pt"
+    ckpt.write_bytes(b"weights v1")
+    version = register_model("fashion-v1", "ViT-B/32", checkpoint=ckpt, registry_file=registry)
+
+    resolved = resolve_model("fashion-v1", registry_file=registry)
+    assert resolved.checkpoint == str(ckpt)
+    assert resolved.tag == version.tag and resolved.tag.startswith("ViT-B/32+ckpt:")
+    assert ModelVersion("ViT-B/32", "ViT-B/32").tag == "ViT-B/32"
+    with pytest.raises(ValueError):
+        resolve_model("no-such-version", registry_file=registry)
+
+    emb_file = str(tmp_path / "embeddings.npy")
+    check_model_tag(emb_file, resolved)          # untagged catalogs only warn
+    write_model_tag(emb_file, resolved)
+    check_model_tag(emb_file, resolved)
+    with pytest.raises(ValueError, match="fashion-v1"):
+        check_model_tag(emb_file, ModelVersion("ViT-B/32", "ViT-B/32"))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.pathtable import ConcatPaths, PathTable, load_paths, path_table_file_for
+
+
+def test_path_table_round_trips_and_finds_paths(tmp_path):
+    paths = ["WOMEN-Dresses-id_01.jpg", "MEN-Denim-id_02.jpg", "données/é.jpg", "a.jpg"]
+    idx_file = str(tmp_path / "paths.txt")
+    with open(idx_file, "w") as f:
+        f.write("\n".join(paths))
+
+    table = load_paths(idx_file)
+    assert isinstance(table, PathTable) and os.path.exists(path_table_file_for(idx_file))
+    assert list(table) == paths and len(table) == 4
+    assert table[2] == "données/é.jpg" and table[-1] == "a.jpg"
+    assert [table.find(p) for p in paths] == [0, 1, 2, 3]
+    assert table.find("missing.jpg") is None and "a.jpg" in table
+
+    both = ConcatPaths([table, ["new.jpg"]])
+    assert len(both) == 5 and both[4] == "new.jpg" and both[1] == paths[1]
+    assert both.find("new.jpg") == 4 and both.find("a.jpg") == 3
@@ -0,0 +1,34 @@
+import io
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from clip.clip import _transform
+from src.mywardrobe.preprocess import BatchPreprocessor, check_parity
+
+
+def _jpeg(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    img = 200 * np.concatenate([np.sin(9 * x + 0 * y) ** 2, np.cos(7 * y + 0 * x) ** 2, x * y], axis=2)
+    img = (img + rng.normal(0, 20, img.shape)).clip(0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def test_batch_preprocessing_matches_clip_transform():
+    # Upscaled, downscaled and draft-decoded (short side >= 4 * 224) inputs
+    images = [_jpeg(200, 300), _jpeg(750, 1100, seed=1), _jpeg(1000, 1400, seed=2)]
+    result = check_parity(images, _transform(224))
+    assert result["ok"], result
+
+
+def test_batch_preprocessing_output_shape():
+    batch = BatchPreprocessor(224)([_jpeg(320, 240), Image.new("RGB", (100, 500))])
+    assert tuple(batch.shape) == (2, 3, 224, 224)
@@ -1,6 +1,7 @@
 import os
 import io
 import sys
+import tempfile
 import pytest
 import numpy as np
 from fastapi.testclient import TestClient
@@ -9,25 +10,20 @@ from fastapi.testclient import TestClient
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend-deploy'))
 
 # Create mock data immediately when module loads (for CI/CD)
-def create_mock_data():
-    """Create mock data for CI/CD environment"""
-    # Create mock data directory if it doesn't exist
-    os.makedirs("data", exist_ok=True)
-    
-    # Create a mock embeddings file if it doesn't exist
-    if not os.path.exists("data/embeddings.npy"):
-        # Create a small mock embeddings file
-        mock_embeddings = np.random.rand(10, 512).astype(np.float32)
-        np.save("data/embeddings.npy", mock_embeddings)
-    
-    # Create a mock paths file if it doesn't exist
-    if not os.path.exists("data/paths.txt"):
-        with open("data/paths.txt", "w") as f:
-            for i in range(10):
-                f.write(f"mock_image_{i}.jpg\n")
-
-# Create mock data immediately
-create_mock_data()
+def create_mock_data(data_dir):
+    """Create mock data for CI/CD environment in ``data_dir``; returns (embeddings, paths) files"""
+    emb_file, idx_file = os.path.join(data_dir, "embeddings.npy"), os.path.join(data_dir, "paths.txt")
+    # Create a small mock embeddings file
+    mock_embeddings = np.random.rand(10, 512).astype(np.float32)
+    np.save(emb_file, mock_embeddings)
+    with open(idx_file, "w") as f:
+        for i in range(10):
+            f.write(f"mock_image_{i}.jpg\n")
+    return emb_file, idx_file
+
+# Create mock data immediately, outside the tree, and point the API at it
+import config
+config.CATALOG_EMB_FILE, config.CATALOG_IDX_FILE = create_mock_data(tempfile.mkdtemp(prefix="mywardrobe-test-"))
 
 from api.app import app
 
@@ -77,4 +73,35 @@ def test_wardrobe_add_and_get():
     assert response.status_code == 200
     items = response.json()
     assert isinstance(items, list)
-    assert any(item["product_path"] == "img.jpg" for item in items) 
\ No newline at end of file
+    assert any(item["product_path"] == "img.jpg" for item in items) 
+
+def test_metrics_endpoint():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    stats = response.json()["search_batching"]
+    assert stats["queue_depth"] == 0
+    assert stats["max_batch"] > 0
+
+
+def test_search_rejects_undecodable_upload():
+    response = client.post(
+        "/search",
+        files={"file": ("notes.jpg", io.BytesIO(b"not an image"), "image/jpeg")},
+        data={"text": "green dress"}
+    )
+    assert response.status_code == 400
+
+
+def test_search_rejects_unknown_filter():
+    response = client.post(
+        "/search",
+        files={"file": ("notes.jpg", io.BytesIO(b"not an image"), "image/jpeg")},
+        data={"filters": '{"no_such_attribute": "x"}'}
+    )
+    assert response.status_code == 400
+    assert "Invalid filters" in response.json()["detail"]
+
+
+def test_catalog_remove_unknown_path():
+    response = client.post("/catalog/remove", data={"path": "not-in-catalog.jpg"})
+    assert response.status_code == 404
@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.indexing import make_index, save_index, index_file_for
+from src.mywardrobe.sharding import ShardedIndex, select_shard, shard_files
+
+
+def test_select_shard_partitions_catalog():
+    items = [(f"WOMEN-Dresses-id_{i:08d}-01_1_front.jpg", None) for i in range(50)]
+    for shard_by in ("hash", "category", "batch"):
+        shards = [select_shard(items, s, 4, shard_by) for s in range(4)]
+        assert sorted(item for shard in shards for item in shard) == sorted(items)
+    # A category never spans shards
+    assert sum(bool(select_shard(items, s, 4, "category")) for s in range(4)) == 1
+
+
+def test_sharded_search_matches_single_index(tmp_path):
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((300, 512)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    parts = np.array_split(np.arange(len(vecs)), 3)
+    for shard, rows in enumerate(parts):
+        emb_file, idx_file = shard_files(str(tmp_path), shard, 3)
+        np.save(emb_file, vecs[rows])
+        with open(idx_file, "w") as f:
+            f.write("\n".join(str(i) for i in rows))
+        save_index(make_index(vecs[rows], "IndexFlatIP", verbose=False), index_file_for(emb_file))
+
+    sharded = ShardedIndex(str(tmp_path), mode="thread")
+    D, I = sharded.search(vecs[:8], 10)
+    D0, I0 = make_index(vecs, "IndexFlatIP", verbose=False).search(vecs[:8], 10)
+    sharded.close()
+    assert np.allclose(D, D0, atol=1e-6)
+    assert [[int(sharded.paths[i]) for i in row] for row in I] == I0.tolist()
@@ -0,0 +1,28 @@
+import os
+import sys
+import subprocess
+
+# Add backend-deploy to Python path for imports
+BACKEND_DEPLOY = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy')
+sys.path.insert(0, BACKEND_DEPLOY)
+
+from api.startup import StartupPhases
+
+
+def test_chat_and_database_modules_defer_heavy_imports():
+    # A fresh interpreter: other tests may already have imported LangChain
+    code = (
+        "import sys, api.chains, src.mywardrobe.db; "
+        "print(sorted(m for m in ('langchain_ollama', 'langchain_core', 'supabase') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DEPLOY, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_startup_phases():
+    phases = StartupPhases()
+    phases.lap("imports")
+    phases.add({"load_model": 1.5})
+    snapshot = phases.snapshot()
+    assert set(snapshot) == {"total_seconds", "imports_seconds", "load_model_seconds"}
+    assert snapshot["total_seconds"] >= 1.5
@@ -0,0 +1,37 @@
+import os
+import sys
+import copy
+import torch
+from clip.model import CLIP
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.preprocess import BatchPreprocessor
+from src.mywardrobe.training import ContrastiveTrainer
+
+
+def _gradients(model, micro, **kwargs):
+    model = copy.deepcopy(model)
+    trainer = ContrastiveTrainer(model, BatchPreprocessor(32).normalize, precision="fp32", **kwargs)
+    loss = trainer.loss(micro)
+    return loss, {name: p.grad for name, p in model.named_parameters() if p.grad is not None}
+
+
+def test_gradient_cache_matches_one_large_batch():
+    torch.manual_seed(0)
+    model = CLIP(16, 32, 1, 64, 16, 77, 49408, 64, 2, 1).float()
+    imgs = torch.randint(0, 255, (8, 3, 32, 32), dtype=torch.uint8)
+    txts = torch.randint(1, 49000, (8, 77))
+    txts[:, 5], txts[:, 6:] = 49407, 0
+    micro = [(imgs[i:i + 2], txts[i:i + 2]) for i in range(0, 8, 2)]
+
+    full_loss, full = _gradients(model, [(imgs, txts)])
+    cached_loss, cached = _gradients(model, micro)
+    assert abs(full_loss - cached_loss) < 1e-4 and cached.keys() == full.keys()
+    for name in full:
+        assert torch.allclose(full[name], cached[name], atol=1e-4), name
+
+    proj_loss, proj = _gradients(model, micro, train="proj")
+    assert sorted(proj) == ["text_projection", "visual.proj"]
+    assert torch.allclose(proj["visual.proj"], full["visual.proj"], atol=1e-4)
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import numpy as np
+
+# Add backend-deploy to Python path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'backend-deploy'))
+
+from src.mywardrobe.indexing import make_index, save_index, index_file_for
+from src.mywardrobe.versions import CatalogVersions, list_versions, new_version, publish_version
+
+
+def _build(path, n, seed):
+    rng = np.random.default_rng(seed)
+    vecs = rng.standard_normal((n, 512)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    np.save(os.path.join(path, "embeddings.npy"), vecs)
+    with open(os.path.join(path, "paths.txt"), "w") as f:
+        f.write("\n".join(f"v{seed}_{i}.jpg" for i in range(n)))
+    save_index(make_index(vecs, "IndexFlatIP", verbose=False), index_file_for(os.path.join(path, "embeddings.npy")))
+    return vecs
+
+
+def test_new_version_is_swapped_in_after_old_searches_drain(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(tmp_path / "20260101-000000")
+    _build(str(tmp_path / "20260101-000000"), 20, 1)
+    versions = CatalogVersions(root)
+    assert versions.status()["active"]["version"] == "20260101-000000"
+
+    build_dir, release_dir = new_version(root)
+    vecs = _build(build_dir, 30, 2)
+    assert list_versions(root) == ["20260101-000000"]   # unfinished builds are not served
+    publish_version(build_dir, release_dir)
+
+    with versions.lease() as old:
+        assert versions.check()
+        # The search holding the old catalog keeps it until it finishes
+        assert old.ntotal == 20
+        status = versions.status()
+        assert status["active"]["version"] == os.path.basename(release_dir)
+        assert [entry["version"] for entry in status["draining"]] == ["20260101-000000"]
+    assert versions.status()["draining"] == []
+    with versions.lease() as catalog:
+        assert catalog.search_paths(vecs[:1], 1)[1][0, 0] == "v2_0.jpg"
+    assert not versions.check()
+
+
+def test_watcher_survives_a_failed_check(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "20260101-000000")
+    _build(str(tmp_path / "20260101-000000"), 10, 1)
+    versions = CatalogVersions(str(tmp_path), poll_seconds=0.01)
+    calls = []
+
+    def flaky_check():
+        calls.append(time.time())
+        if len(calls) == 1:
+            raise OSError("half-written release")
+    monkeypatch.setattr(versions, "check", flaky_check)
+    versions.start()
+    deadline = time.time() + 5
+    while len(calls) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    versions.stop()
+
+    status = versions.status()
+    assert len(calls) >= 3
+    assert status["last_error"] == "OSError: half-written release" and status["last_error_at"] is not None
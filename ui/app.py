@@ -2,7 +2,6 @@ import streamlit as st
 import requests
 import os
 import json
-import tempfile
 
 API = os.getenv("MW_API_ROOT", "http://localhost:8000")
 
@@ -20,24 +19,22 @@ with tab1:
     query = st.text_input("Extra text (optional)", "", key="search_text")
     if st.button("Search", key="search_btn") and uploaded:
         with st.spinner("Searching..."):
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                tmp.write(uploaded.getbuffer())
-                files = {"file": open(tmp.name, "rb")}
-                data = {"text": query}
-                try:
-                    res = requests.post(f"{API}/search", files=files, data=data, timeout=60)
-                    res.raise_for_status()
-                    hits = res.json()
-                    if not hits:
-                        st.info("No results found.")
-                    else:
-                        cols = st.columns(3)
-                        for idx, h in enumerate(hits[:9]):
-                            with cols[idx % 3]:
-                                st.image(h["path"], use_container_width=True)
-                                st.caption(f"score {h['score']:.3f}")
-                except Exception as e:
-                    st.error(f"Search failed: {e}")
+            files = {"file": (uploaded.name, uploaded.getvalue(), uploaded.type or "image/jpeg")}
+            data = {"text": query}
+            try:
+                res = requests.post(f"{API}/search", files=files, data=data, timeout=60)
+                res.raise_for_status()
+                hits = res.json()
+                if not hits:
+                    st.info("No results found.")
+                else:
+                    cols = st.columns(3)
+                    for idx, h in enumerate(hits[:9]):
+                        with cols[idx % 3]:
+                            st.image(h["path"], use_container_width=True)
+                            st.caption(f"score {h['score']:.3f}")
+            except Exception as e:
+                st.error(f"Search failed: {e}")
 
 # --- CHAT TAB ---
 with tab2: